@@ -0,0 +1,88 @@
+"""
+Index of account balances. Balances are updated block by block as blocks are added to or dropped from the chain, so a
+balance is a dict lookup instead of a scan of every transaction of the chain.
+
+A transaction moves its amount from the sender to the recipient and its fee from the sender to the miner, who is paid
+the fees of a block in its mining reward. Mining rewards come from address "0", which mints them
+"""
+from collections import defaultdict
+
+# sender of mining rewards, which creates the coins it sends
+MINT = "0"
+
+
+class BalanceIndex(object):
+    """
+    Balances of all addresses, maintained incrementally
+    """
+
+    def __init__(self, chain=()):
+        """
+        :param chain: (Optional) Chain whose balances are indexed
+        :type chain list
+        """
+        self._balances = defaultdict(int)
+
+        for block in chain:
+            self.apply(block)
+
+    @classmethod
+    def from_dict(cls, balances):
+        """
+        Creates the index from the balances of all addresses, see to_dict
+        :param balances: Balance of every address
+        :type balances dict
+        :rtype: BalanceIndex
+        """
+        index = cls()
+        index._balances.update(balances)
+        return index
+
+    def __len__(self):
+        return len(self._balances)
+
+    def balance(self, address):
+        """
+        Balance of an address
+        :param address: Address
+        :type address str
+        :rtype: int
+        """
+        return self._balances.get(address, 0)
+
+    def to_dict(self):
+        """
+        Balances of all addresses holding coins or in debt
+        :rtype: dict
+        """
+        return dict(self._balances)
+
+    def _credit(self, address, amount):
+        self._balances[address] += amount
+        if not self._balances[address]:
+            del self._balances[address]
+
+    def _transfer(self, transaction, sign):
+        if transaction.sender != MINT:
+            self._credit(
+                transaction.sender, -sign * (transaction.amount + transaction.fee)
+            )
+        self._credit(transaction.recipient, sign * transaction.amount)
+
+    def apply(self, block):
+        """
+        Applies the transactions of a block added to the chain
+        :param block: Block added
+        :type block Block
+        """
+        for transaction in block.transactions:
+            self._transfer(transaction, 1)
+
+    def revert(self, block):
+        """
+        Reverts the transactions of a block dropped from the tip of the chain
+        :param block: Block dropped
+        :type block Block
+        """
+        for transaction in reversed(block.transactions):
+            self._transfer(transaction, -1)
@@ -11,15 +11,106 @@ block = {
         }
     ],
     'proof': 324984774000,
-    'previous_hash': "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"
+    'difficulty': 16,
+    'previous_hash': "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824",
+    'merkle_root': "4a2d8bb05e0b4a0c3a6b0e1ee0d7b1cf2bf4b51b1d2a4c8a41c8d7e7bf0a6f1e"
 }
+
+The difficulty is the number of leading zero bits the hash of the proof of the block needs. It is retargeted every
+retarget_interval blocks from the block timestamps, so that blocks keep being mined every target_block_time seconds
+however fast the hardware mining them is
+
+A block must be timestamped after the median timestamp of the MEDIAN_TIME_BLOCKS blocks before it and at most
+MAX_FUTURE_DRIFT seconds ahead of our clock. The median cannot be moved by a single miner, so timestamps cannot be
+backdated to skew the retargeting of the difficulty, and cannot run far ahead of time either
+
+Every block but the genesis block ends with a single transaction sent by MINT, rewarding its miner with MINING_REWARD
+coins and the fees of the block, and no sender of a block spends more than the balance it had before the block
+
+Blocks are immutable once forged, see models.Block, so their hash is computed once and stored with them. The hash
+covers the header of the block, the transactions being committed to by their Merkle root
+
+Consensus picks the chain that took the most work to mine, see tree. Every node starts from the same genesis block,
+timestamped GENESIS_TIMESTAMP, and a chain of a node that does not start with our genesis block is never adopted: its
+genesis block follows no block it could be validated against. Recent blocks of our chain and the side branches
+validated during consensus are kept in a block tree, so switching branches only replays the blocks after the fork
+
+New blocks and transactions are announced to the registered nodes as they are mined or accepted, see gossip, so they
+spread between consensus rounds
 """
-import hashlib
-import json
-from time import time
+from collections import defaultdict
+from statistics import median
+from sys import float_info
+from threading import Lock
+from time import perf_counter, time
 from urllib.parse import urlparse
 from app import logger
-from requests import get
+from .pow import DIFFICULTY, SerialProofOfWork, create_engine, retarget, valid_proof
+from .balances import MINT, BalanceIndex
+from .encoding import EncodingError, decode_records
+from .gossip import Gossip
+from .locks import ReadWriteLock
+from .lookup import LookupIndex
+from .mempool import MINED, UNSIGNED, Mempool, TransactionRejected
+from .metrics import Metrics
+from .models import Block, Header, Model, Transaction, is_number
+from .peers import PeerClient
+from .signatures import SignatureVerifier
+from .snapshot import load_snapshot, save_snapshot
+from .store import ChainStore
+from .tree import BlockTree, block_work
+from .validation import ChainValidator
+
+# timestamp of the genesis block, the same for every node
+GENESIS_TIMESTAMP = 1506057125.900785
+# coins minted by every block, besides the fees of its transactions
+MINING_REWARD = 1
+# number of blocks before a block whose median timestamp the block must be timestamped after
+MEDIAN_TIME_BLOCKS = 11
+# most seconds a block may be timestamped ahead of our clock
+MAX_FUTURE_DRIFT = 2 * 60 * 60
+
+
+def just_after(timestamp):
+    """
+    Timestamp greater than the given one by at most two steps of float precision
+    :param timestamp: Timestamp
+    :type timestamp float
+    :rtype: float
+    """
+    return timestamp + max(abs(timestamp) * float_info.epsilon, float_info.min)
+
+
+class SplicedChain(object):
+    """
+    Read only view of the first blocks of a chain followed by other blocks, used to validate the blocks fetched after
+    a fork point without copying the blocks before it
+    """
+
+    def __init__(self, chain, fork, blocks):
+        """
+        :param chain: Chain the view starts with
+        :type chain list
+        :param fork: Number of blocks of the chain in the view
+        :type fork int
+        :param blocks: Blocks following them
+        :type blocks list
+        """
+        self.chain = chain
+        self.fork = fork
+        self.blocks = blocks
+
+    def __len__(self):
+        return self.fork + len(self.blocks)
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("block index out of range")
+        if position < self.fork:
+            return self.chain[position]
+        return self.blocks[position - self.fork]
 
 
 class Blockchain(object):
@@ -27,108 +118,872 @@ class Blockchain(object):
     Blockchain class implementation
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        pow_engine=None,
+        difficulty=DIFFICULTY,
+        retarget_interval=10,
+        target_block_time=10,
+        store=None,
+        validator=None,
+        peers=None,
+        sync_mode="full",
+        sync_page_size=500,
+        mempool=None,
+        max_block_transactions=1000,
+        snapshot_every=1000,
+        metrics=None,
+        verifier=None,
+        tree=None,
+        gossip=None,
+    ):
         """
         Creates a new instance of a Blockchain. When instantiated, a new genesis block is created (Block without any
         predecessors), we will also need to add proof to the genesis block
+        :param pow_engine: (Optional) Proof of work engine used to mine blocks, defaults to a serial search
+        :type pow_engine ProofOfWork
+        :param difficulty: (Optional) Difficulty of the genesis block, in leading zero bits
+        :type difficulty int
+        :param retarget_interval: (Optional) Number of blocks between difficulty retargets, 0 disables retargeting
+        :type retarget_interval int
+        :param target_block_time: (Optional) Seconds a block should take to mine
+        :type target_block_time float
+        :param store: (Optional) Persistent store holding the chain, the chain only lives in memory if not given. The
+        genesis block is only created if the store is empty
+        :type store ChainStore
+        :param validator: (Optional) Validator of peer chains, defaults to validating across all CPUs
+        :type validator ChainValidator
+        :param peers: (Optional) Client used to fetch chains from the nodes
+        :type peers PeerClient
+        :param sync_mode: (Optional) Consensus mode, full fetches whole chains while incremental only fetches the blocks
+        following the fork point
+        :type sync_mode str
+        :param sync_page_size: (Optional) Number of blocks fetched from a node at a time in incremental mode
+        :type sync_page_size int
+        :param mempool: (Optional) Pool of pending transactions
+        :type mempool Mempool
+        :param max_block_transactions: (Optional) Most transactions in a block, mining reward included
+        :type max_block_transactions int
+        :param snapshot_every: (Optional) Number of blocks added between snapshots of the indexes of a stored chain
+        :type snapshot_every int
+        :param metrics: (Optional) Registry the blockchain records its metrics in, metrics are disabled if not given
+        :type metrics Metrics
+        :param verifier: (Optional) Verifier of the signatures of transactions, signatures are not required if not given
+        :type verifier SignatureVerifier
+        :param tree: (Optional) Tree of the recent blocks of our chain and of its side branches
+        :type tree BlockTree
+        :param gossip: (Optional) Announces new blocks and transactions to the nodes, nothing is announced if not given
+        :type gossip Gossip
+        """
+        self.pow_engine = pow_engine or SerialProofOfWork()
+        self.initial_difficulty = difficulty
+        self.retarget_interval = retarget_interval
+        self.target_block_time = target_block_time
+        self.store = store
+        self.validator = validator or ChainValidator()
+        self.peers = peers or PeerClient()
+        self.sync_mode = sync_mode
+        self.sync_page_size = sync_page_size
+        self.mempool = mempool or Mempool()
+        self.max_block_transactions = max_block_transactions
+        self.chain = [] if store is None else store
+        self.snapshot_every = snapshot_every
+        self.verifier = verifier
+        self.tree = tree or BlockTree()
+        self.gossip = gossip or Gossip(peers=self.peers)
+        # cumulative work of our chain, see tree.block_work
+        self.work = 0
+        self.balances = BalanceIndex()
+        self.lookup = LookupIndex()
+        # replaced rather than changed in place, so rounds of consensus iterate over the nodes while others register
+        self.nodes = frozenset()
+        self._nodes_lock = Lock()
+        # held for writing while blocks are added or replaced, for reading while the chain and its indexes are read
+        self.lock = ReadWriteLock()
+        # snapshots of the indexes are numbered, so one taken before the last one written is not written over it
+        self._snapshots_taken = self._snapshots_written = 0
+        self._snapshot_lock = Lock()
+        self.metrics = metrics or Metrics(enabled=False)
+        self.instrument()
+
+        self.load_indexes()
+
+        if not len(self.chain):
+            self.new_block(previous_hash="1", proof=100)
+
+    @classmethod
+    def from_config(cls, config):
         """
-        self.current_transactions = []
-        self.chain = []
-        self.nodes = set()
-        self.new_block(previous_hash="1", proof=100)
+        Creates a new Blockchain configured from the application configuration
+        :param config: Application configuration
+        :type config dict
+        :return: new Blockchain
+        :rtype: Blockchain
+        """
+        metrics = Metrics.from_config(config)
+        peers = PeerClient.from_config(config, metrics)
+
+        return cls(
+            pow_engine=create_engine(config),
+            difficulty=config.get("DIFFICULTY", DIFFICULTY),
+            retarget_interval=config.get("RETARGET_INTERVAL", 10),
+            target_block_time=config.get("TARGET_BLOCK_TIME", 10),
+            store=(
+                ChainStore(
+                    config["CHAIN_STORE_PATH"],
+                    sync_every=config.get("CHAIN_STORE_SYNC_EVERY", 100),
+                )
+                if config.get("CHAIN_STORE_PATH")
+                else None
+            ),
+            validator=ChainValidator.from_config(config),
+            peers=peers,
+            sync_mode=config.get("CONSENSUS_MODE", "full"),
+            sync_page_size=config.get("SYNC_PAGE_SIZE", 500),
+            mempool=Mempool.from_config(config),
+            max_block_transactions=config.get("BLOCK_MAX_TRANSACTIONS", 1000),
+            snapshot_every=config.get("INDEX_SNAPSHOT_EVERY", 1000),
+            metrics=metrics,
+            verifier=(
+                SignatureVerifier.from_config(config, metrics)
+                if config.get("REQUIRE_SIGNATURES", True)
+                else None
+            ),
+            tree=BlockTree.from_config(config),
+            gossip=Gossip.from_config(config, peers, metrics),
+        )
 
-    def new_block(self, proof, previous_hash=None):
+    def instrument(self):
+        """
+        Registers the metrics of the blockchain. Counters and histograms are updated as the chain is mined, validated
+        and synced, gauges are read from the chain when metrics are scraped
+        """
+        metrics = self.metrics
+
+        self._hashes = metrics.counter(
+            "blockchain_hashes_total",
+            "Candidate proofs hashed by proof of work searches",
+        )
+        self._pow_seconds = metrics.histogram(
+            "blockchain_proof_of_work_seconds", "Seconds proof of work searches take"
+        )
+        self._hash_rate = metrics.gauge(
+            "blockchain_hash_rate", "Hashes per second of the last proof of work search"
+        )
+        self._blocks_mined = metrics.counter(
+            "blockchain_blocks_mined_total", "Blocks mined by this node"
+        )
+        self._transactions = metrics.counter(
+            "blockchain_transactions_total",
+            "Transactions posted to the pool, accepted or rejected",
+            ("result",),
+        )
+        self._validation_seconds = metrics.histogram(
+            "blockchain_chain_validation_seconds",
+            "Seconds taken to validate chains, or the blocks after a fork point",
+        )
+        self._blocks_validated = metrics.counter(
+            "blockchain_blocks_validated_total", "Blocks of other chains validated"
+        )
+        self._consensus_seconds = metrics.histogram(
+            "blockchain_consensus_seconds", "Seconds consensus rounds take", ("mode",)
+        )
+        self._consensus_rounds = metrics.counter(
+            "blockchain_consensus_rounds_total",
+            "Consensus rounds, whether our chain was replaced or kept",
+            ("result",),
+        )
+        self._peer_sync_seconds = metrics.histogram(
+            "blockchain_peer_sync_seconds",
+            "Seconds spent on the chain of a peer in a consensus round, validating its whole chain in full mode or "
+            "fetching and validating the blocks after the fork point otherwise",
+            ("peer",),
+        )
+        self._reorganizations = metrics.counter(
+            "blockchain_reorganizations_total",
+            "Switches of our chain to a side branch with more work, rolling back at least one block",
+        )
+        self._reorganization_depth = metrics.histogram(
+            "blockchain_reorganization_depth",
+            "Blocks of our chain rolled back by reorganizations",
+            buckets=(1, 2, 5, 10, 20, 50, 100),
+        )
+
+        metrics.gauge(
+            "blockchain_chain_length",
+            "Blocks in our chain",
+            function=lambda: len(self.chain),
+        )
+        metrics.gauge(
+            "blockchain_mempool_size",
+            "Pending transactions in the pool",
+            function=lambda: len(self.mempool),
+        )
+        metrics.gauge(
+            "blockchain_nodes", "Registered nodes", function=lambda: len(self.nodes)
+        )
+        metrics.gauge(
+            "blockchain_difficulty",
+            "Difficulty of the next block, in leading zero bits",
+            function=self.next_difficulty,
+        )
+        metrics.gauge(
+            "blockchain_chain_work",
+            "Cumulative work of our chain, in expected hashes",
+            function=lambda: self.work,
+        )
+        metrics.gauge(
+            "blockchain_block_tree_size",
+            "Blocks held in the block tree, our recent blocks and those of side branches",
+            function=lambda: len(self.tree),
+        )
+
+    def render_metrics(self):
+        """
+        Metrics of the blockchain in the Prometheus text exposition format
+        :rtype: str
+        """
+        return self.metrics.render()
+
+    @property
+    def snapshot_path(self):
+        """Path of the snapshot of the indexes, None if the chain is not stored"""
+        return None if self.store is None else f"{self.store.path}.indexes"
+
+    def load_indexes(self):
+        """
+        Builds the balance and lookup indexes and the work of our chain. For a stored chain they are loaded from their
+        last snapshot and only the blocks added after it are indexed. The block tree starts with the recent blocks of
+        the chain
+        """
+        start = 0
+
+        if self.store is not None:
+            snapshot = load_snapshot(self.snapshot_path, self.chain)
+            if snapshot is not None:
+                start, indexes, lookup = snapshot
+                self.balances = BalanceIndex.from_dict(indexes["balances"])
+                self.lookup = LookupIndex.load(lookup)
+                self.work = indexes["work"]
+
+        for position in range(start, len(self.chain)):
+            self.index_block(self.chain[position])
+
+        self.track_tail()
+
+    def save_indexes(self):
+        """
+        Saves a snapshot of the balance and lookup indexes of a stored chain. The indexes are copied under the lock,
+        the lookup index as a view, and the snapshot is written once the lock is released, so readers do not wait on
+        it being pickled and synced to disk
+        """
+        if self.store is None:
+            return
+
+        with self.lock.write():
+            length = len(self.chain)
+            self._snapshots_taken += 1
+            snapshot = dict(
+                sequence=self._snapshots_taken,
+                length=length,
+                tip=self.chain[length - 1].hash if length else None,
+                balances=self.balances.to_dict(),
+                work=self.work,
+                lookup=self.lookup.view(),
+            )
+            self.lock.defer(lambda: self.write_snapshot(snapshot))
+
+    def write_snapshot(self, snapshot):
+        """
+        Writes a snapshot taken by save_indexes, unless a later one was written already or blocks were rolled back
+        since it was taken
+        :param snapshot: Indexes copied under the lock
+        :type snapshot dict
+        """
+        with self._snapshot_lock:
+            if snapshot["sequence"] < self._snapshots_written:
+                return
+
+            lookup = self.lookup.state(snapshot["lookup"], snapshot["length"])
+            if lookup is None:
+                logger.debug("Blocks were rolled back while snapshotting, skipped")
+                return
+
+            save_snapshot(
+                self.snapshot_path,
+                snapshot["length"],
+                snapshot["tip"],
+                dict(balances=snapshot["balances"], work=snapshot["work"]),
+                lookup,
+            )
+            self._snapshots_written = snapshot["sequence"]
+
+    def index_block(self, block):
+        """
+        Updates the indexes with a block added to the chain
+        :param block: Block added
+        :type block Block
+        """
+        self.balances.apply(block)
+        self.lookup.apply(block)
+        self.work += block_work(block)
+
+    def unindex_block(self, block):
+        """
+        Updates the indexes with a block dropped from the tip of the chain
+        :param block: Block dropped
+        :type block Block
+        """
+        self.balances.revert(block)
+        self.lookup.revert(block)
+        self.work -= block_work(block)
+
+    def track_tail(self):
+        """
+        Adds the recent blocks of our chain the block tree does not hold yet, and prunes the blocks too far below the
+        tip of our chain
+        """
+        tail = self.chain[max(len(self.chain) - self.tree.depth, 0) :]
+        work = self.work - sum(block_work(block) for block in tail)
+        self.tree.extend(tail, work)
+        self.tree.prune(len(self.chain) - self.tree.depth)
+
+    @property
+    def current_transactions(self):
+        """Pending transactions in the order they will be mined"""
+        return list(self.mempool)
+
+    def new_block(self, proof, previous_hash=None, transactions=None):
         """
         creates a new block and adds it to the chain
         :param previous_hash: (Optional) Previous hash of the block in the chain
         :type previous_hash str
         :param proof Proof given by proof of work algorithm
         :type proof int
+        :param transactions: (Optional) Transactions of the block, defaults to the pending transactions paying the
+        highest fees, as many as fit in a block
+        :type transactions list
         :return: new Block
-        :rtype: dict
+        :rtype: Block
         """
-        block = dict(
-            index=len(self.chain) + 1,
-            timestamp=time(),
-            transactions=self.current_transactions,
-            proof=proof,
-            previous_hash=previous_hash or self.hash(self.chain[-1]),
-        )
+        with self.lock.write():
+            if transactions is None:
+                transactions = self.mempool.take(self.max_block_transactions)
 
-        # reset the current list of transactions
-        self.current_transactions = []
+            if self.chain:
+                # a clock behind the blocks before keeps the block valid
+                timestamp = max(time(), just_after(self.median_time()))
+            else:
+                timestamp = GENESIS_TIMESTAMP
 
-        # add the block to the chain
-        self.chain.append(block)
+            block = Block(
+                index=len(self.chain) + 1,
+                timestamp=timestamp,
+                transactions=transactions,
+                proof=proof,
+                difficulty=self.next_difficulty(),
+                previous_hash=previous_hash or self.hash(self.chain[-1]),
+            )
 
-        return block
+            # add the block to the chain
+            self.chain.append(block)
+            self.index_block(block)
+            self.tree.add(block, self.work - block_work(block))
+            self.tree.prune(block["index"] - self.tree.depth)
+
+            if len(self.chain) % self.snapshot_every == 0:
+                self.save_indexes()
 
-    def new_transaction(self, sender, recipient, amount):
+            return block
+
+    def new_transaction(
+        self, sender, recipient, amount, fee=0, signature=None, nonce=None
+    ):
         """
-        Adds a new transaction to the block
+        Adds a new transaction to the pool of pending transactions
         :param sender Address of sender
         :type sender str
         :param recipient Address of recipient
         :type recipient str
         :param amount Amount being sent
         :type amount int
-        :return: Index of the block that will hold this transaction
+        :param fee (Optional) Fee paid to the miner, transactions paying more are mined first
+        :type fee int
+        :param signature (Optional) Signature of the transaction by the sender, required if signatures are
+        :type signature str
+        :param nonce (Optional) Nonce of the transaction, see signatures.sign
+        :type nonce int
+        :return: Index of the next block, that will hold this transaction if it pays enough to fit in it
+        :rtype: int
+        :raises TransactionRejected if the transaction is not validly signed, is already pending or mined, overdraws the
+        sender or the pool is full, see mempool for the reasons
+        """
+        transaction = Transaction(sender, recipient, amount, fee, signature, nonce)
+
+        try:
+            if not self.valid_signatures([transaction]):
+                raise TransactionRejected(UNSIGNED)
+
+            # funds are checked against balances no block is being applied to
+            with self.lock.read():
+                if self.is_mined(transaction):
+                    raise TransactionRejected(MINED)
+                self.mempool.offer(transaction, funds=self.balances.balance)
+                index = self.last_block["index"] + 1
+        except TransactionRejected:
+            self._transactions.inc(1, "rejected")
+            raise
+
+        self._transactions.inc(1, "accepted")
+        self.gossip.announce(self.nodes, transactions=[transaction.id])
+        return index
+
+    def new_transactions(self, transactions, origin=None):
+        """
+        Adds a batch of transactions to the pool of pending transactions, the transactions added are announced to the
+        nodes
+        :param transactions: Transactions to add
+        :type transactions list
+        :param origin: (Optional) Address of the node that announced the transactions, which they are not announced to
+        :type origin str
+        :return: Number of transactions added, transactions not validly signed, duplicates, overdrafts and transactions
+        turned away by a full pool are left out
         :rtype: int
         """
-        self.current_transactions.append(
-            {"sender": sender, "recipient": recipient, "amount": amount}
+        signed = transactions
+        if self.verifier is not None:
+            signed = [
+                transaction
+                for transaction, valid in zip(
+                    transactions, self.verifier.verify_many(transactions)
+                )
+                if valid
+            ]
+
+        with self.lock.read():
+            fresh = [
+                transaction
+                for transaction in signed
+                if transaction.id not in self.mempool and not self.is_mined(transaction)
+            ]
+            added = self.mempool.add_many(fresh, funds=self.balances.balance)
+
+        self._transactions.inc(added, "accepted")
+        self._transactions.inc(len(transactions) - added, "rejected")
+
+        if added and self.gossip.enabled:
+            self.gossip.announce(
+                self.nodes,
+                transactions=[
+                    transaction.id
+                    for transaction in fresh
+                    if transaction.id in self.mempool
+                ],
+                origin=origin,
+            )
+        return added
+
+    def is_mined(self, transaction):
+        """
+        Whether a signed transaction is already held by a block of our chain, posting it again would replay it. Unsigned
+        transactions, which are only accepted when signatures are not required, may be mined again. The caller holds
+        the lock
+        :param transaction: Transaction
+        :type transaction Transaction
+        :rtype: bool
+        """
+        return transaction.signature is not None and bool(
+            self.lookup.locate(transaction.id)
         )
 
-        return self.last_block["index"] + 1
+    def valid_signatures(self, transactions, mint=False):
+        """
+        Checks the signatures of transactions, when signatures are required
+        :param transactions: Transactions to check
+        :type transactions list
+        :param mint: (Optional) Whether mining rewards are valid unsigned, as they are in blocks
+        :type mint bool
+        :return: True if every transaction is validly signed or signatures are not required, False otherwise
+        :rtype: bool
+        """
+        if self.verifier is None:
+            return True
+        return all(self.verifier.verify_many(transactions, mint))
+
+    def balance(self, address):
+        """
+        Balance of an address in our chain, pending transactions left out
+        :param address: Address
+        :type address str
+        :rtype: int
+        """
+        with self.lock.read():
+            return self.balances.balance(address)
+
+    def find_transaction(self, transaction_id):
+        """
+        Finds the blocks holding a transaction
+        :param transaction_id: Id of the transaction
+        :type transaction_id str
+        :return: Block and position in the block of every copy of the transaction, in chain order
+        :rtype: list
+        """
+        with self.lock.read():
+            return [
+                (self.chain[index - 1], position)
+                for index, position in self.lookup.locate(transaction_id)
+            ]
+
+    def address_transactions(self, address, start=0, limit=100):
+        """
+        Gets the transactions sent or received by an address
+        :param address: Address
+        :type address str
+        :param start: (Optional) Number of transactions to skip
+        :type start int
+        :param limit: (Optional) Most transactions returned
+        :type limit int
+        :return: Block and position in the block of every transaction, in chain order
+        :rtype: list
+        """
+        with self.lock.read():
+            return [
+                (self.chain[index - 1], position)
+                for index, position in self.lookup.postings(address, start, limit)
+            ]
+
+    def spending(self, address):
+        """
+        Amount and fees an address spends in its pending transactions
+        :param address: Address
+        :type address str
+        :rtype: int
+        """
+        return self.mempool.spending(address)
+
+    def is_pending(self, transaction_id):
+        """
+        Whether a transaction is waiting in the pool to be mined
+        :param transaction_id: Id of the transaction
+        :type transaction_id str
+        :rtype: bool
+        """
+        return transaction_id in self.mempool
+
+    def pending_transactions(self, transaction_ids):
+        """
+        Gets pending transactions by id, e.g those missing from a node they were announced to
+        :param transaction_ids: Ids of the transactions
+        :type transaction_ids list
+        :return: Transactions found pending, in the order of the ids
+        :rtype: list
+        """
+        transactions = [
+            self.mempool.get(transaction_id) for transaction_id in transaction_ids
+        ]
+        return [transaction for transaction in transactions if transaction is not None]
+
+    def has_block(self, block_hash):
+        """
+        Whether a block is in the block tree, one of the recent blocks of our chain or of its side branches
+        :param block_hash: Hash of the block
+        :type block_hash str
+        :rtype: bool
+        """
+        return block_hash in self.tree
+
+    def find_blocks(self, block_hashes):
+        """
+        Finds blocks by hash in the block tree, see has_block
+        :param block_hashes: Hashes of the blocks
+        :type block_hashes list
+        :return: Blocks found, in the order of the hashes
+        :rtype: list
+        """
+        with self.lock.read():
+            nodes = [self.tree.get(block_hash) for block_hash in block_hashes]
+        return [tree_node.block for tree_node in nodes if tree_node is not None]
+
+    def address_page(self, address, start=0, limit=100):
+        """
+        Gets a page of the transactions sent or received by an address, see address_transactions, with the number of
+        transactions of the address in the same view of the chain
+        :return: Number of transactions of the address, and block and position in the block of the transactions of
+        the page
+        :rtype: tuple
+        """
+        with self.lock.read():
+            count = self.lookup.count(address)
+            return count, self.address_transactions(address, start, limit)
+
+    def tip(self):
+        """
+        Length and last block of the chain, read together
+        :rtype: tuple
+        """
+        with self.lock.read():
+            return len(self.chain), self.chain[-1]
+
+    def cumulative_work(self, block_hash):
+        """
+        Cumulative work of the chain ending with a block of the block tree
+        :param block_hash: Hash of the block
+        :type block_hash str
+        :return: Cumulative work or None if the block is not in the tree
+        :rtype: int
+        """
+        with self.lock.read():
+            return self.tree.work(block_hash)
+
+    def work_at(self, height):
+        """
+        Cumulative work of the first blocks of our chain, the caller holds the lock
+        :param height: Number of blocks
+        :type height int
+        :rtype: int
+        """
+        if height == 0:
+            return 0
+
+        work = self.tree.work(self.hash(self.chain[height - 1]))
+        if work is not None:
+            return work
+
+        # the block was pruned from the tree, the work of the blocks following it is taken off ours
+        return self.work - sum(block_work(block) for block in self.chain[height:])
+
+    def branch_work(self, fork, blocks):
+        """
+        Cumulative work of the chain made of the first blocks of our chain followed by other blocks
+        :param fork: Number of blocks of our chain the blocks follow
+        :type fork int
+        :param blocks: Blocks or headers following them
+        :type blocks list
+        :return: Cumulative work, 0 if our chain no longer has that many blocks
+        :rtype: int
+        """
+        with self.lock.read():
+            if fork > len(self.chain):
+                return 0
+            return self.work_at(fork) + sum(block_work(block) for block in blocks)
+
+    def known_length(self, chain, fork):
+        """
+        Number of blocks a chain starts with that are either shared with our chain or in the block tree, which holds
+        validated blocks only
+        :param chain: Chain of a node
+        :type chain list
+        :param fork: Number of blocks of our chain it starts with
+        :type fork int
+        :rtype: int
+        """
+        position = fork
+
+        with self.lock.read():
+            while position < len(chain) and self.hash(chain[position]) in self.tree:
+                position += 1
+
+        return position
+
+    def chain_range(self, start, limit):
+        """
+        Gets a range of blocks with the length of the chain they were read from
+        :param start: Index of the first block
+        :type start int
+        :param limit: Most blocks returned
+        :type limit int
+        :return: Length of the chain and the blocks of the range
+        :rtype: tuple
+        """
+        with self.lock.read():
+            return len(self.chain), self.chain[start - 1 : start - 1 + limit]
+
+    def node_list(self):
+        """
+        Addresses of the registered nodes
+        :rtype: list
+        """
+        return list(self.nodes)
 
     @staticmethod
     def hash(block):
         """
-        Creates a SHA-256 hash of a block
-        :param block:
+        Creates a SHA-256 hash of a block. Forged blocks keep their hash, so it is only computed once per block
+        :param block: Block or header of a block
         :type block dict
         :return: Hash of the given block
         :rtype: str
         """
-        block_string = json.dumps(block, sort_keys=True).encode()
-        return hashlib.sha256(block_string).hexdigest()
+        if isinstance(block, Model):
+            return block.hash
+        return Block.from_dict(block).hash
+
+    def verify_integrity(self):
+        """
+        Integrity check of our chain, every block is hashed again and checked against its stored hash and against the
+        previous hash of the block following it
+        :return: Index of the first block that fails the check or None if the chain is intact
+        :rtype: int
+        """
+        previous = None
+
+        with self.lock.read():
+            for block in self.chain:
+                if not block.verify():
+                    return block["index"]
+                if previous is not None and block["previous_hash"] != previous.hash:
+                    return block["index"]
+                previous = block
+
+        return None
 
     @property
     def last_block(self):
         """Returns the last block on the chain"""
         return self.chain[-1]
 
-    def proof_of_work(self, last_proof):
+    def next_difficulty(self, chain=None, height=None):
+        """
+        Difficulty of the block following the first height blocks of the chain. It is the difficulty of the last of
+        those blocks, retargeted from their timestamps every retarget_interval blocks
+        :param chain: (Optional) Chain the block is added to, defaults to this chain
+        :type chain list
+        :param height: (Optional) Number of blocks before the new block, defaults to the length of the chain
+        :type height int
+        :return: Difficulty in leading zero bits
+        :rtype: int
+        """
+        chain = self.chain if chain is None else chain
+        height = len(chain) if height is None else height
+
+        if height == 0:
+            return self.initial_difficulty
+
+        last_block = chain[height - 1]
+        interval = self.retarget_interval
+
+        if interval < 2 or height % interval != 0:
+            return last_block["difficulty"]
+
+        # the genesis block was not mined when it is timestamped, the first window starts after it
+        first = max(height - interval, 1)
+        if first == height - 1:
+            return last_block["difficulty"]
+
+        timespan = last_block["timestamp"] - chain[first]["timestamp"]
+        expected_timespan = (height - 1 - first) * self.target_block_time
+
+        return retarget(last_block["difficulty"], timespan, expected_timespan)
+
+    def median_time(self, chain=None, height=None):
+        """
+        Median timestamp of the last MEDIAN_TIME_BLOCKS of the first height blocks of the chain, the block following
+        them must be timestamped after it
+        :param chain: (Optional) Chain the block is added to, defaults to this chain
+        :type chain list
+        :param height: (Optional) Number of blocks before the new block, at least one, defaults to the length of the
+        chain
+        :type height int
+        :rtype: float
+        """
+        chain = self.chain if chain is None else chain
+        height = len(chain) if height is None else height
+
+        return median(
+            chain[position]["timestamp"]
+            for position in range(max(height - MEDIAN_TIME_BLOCKS, 0), height)
+        )
+
+    def proof_of_work(self, last_proof, progress=None, difficulty=None):
         """
         Simple Proof of Work Algorithm:
-         - Find a number p' such that hash(pp') contains leading 4 zeroes, where p is the previous p'
+         - Find a number p' such that hash(pp') has difficulty leading zero bits, where p is the previous p'
          - p is the previous proof, and p' is the new proof
+        The search itself is delegated to the configured proof of work engine
         :param last_proof
         :type last_proof int
-        :return: Proof of work
+        :param progress: (Optional) Progress of the search, used to report hashes tried and to cancel the search
+        :type progress MiningJob
+        :param difficulty: (Optional) Difficulty of the proof, defaults to the difficulty of the next block
+        :type difficulty int
+        :return: Proof of work or None if the search was cancelled
         :rtype: int
         """
-        proof = 0
+        if difficulty is None:
+            difficulty = self.next_difficulty()
+
+        start = perf_counter()
+        proof = self.pow_engine.search(last_proof, difficulty, progress)
+        seconds = perf_counter() - start
 
-        while self.valid_proof(last_proof, proof) is False:
-            proof += 1
+        # engines find the smallest valid proof, so every candidate up to it was hashed
+        if proof is not None:
+            hashes = proof + 1
+        else:
+            hashes = getattr(progress, "hashes", 0)
+
+        self._hashes.inc(hashes)
+        self._pow_seconds.observe(seconds)
+        if seconds:
+            self._hash_rate.set(hashes / seconds)
 
         return proof
 
+    def mine(self, reward_address, progress=None):
+        """
+        Mines a new block:
+        1. Calculate the Proof of Work
+        2. Fill the block with the pending transactions paying the highest fees
+        3. Reward the miner by adding a transaction granting it MINING_REWARD coins and the fees of the block
+        4. Forge the new Block by adding it to the chain
+        :param reward_address: Address of the miner
+        :type reward_address str
+        :param progress: (Optional) Progress of the proof of work search
+        :type progress MiningJob
+        :return: The forged block or None if the search was cancelled or the chain changed while mining
+        :rtype: dict
+        """
+        last_block = self.last_block
+        last_hash = self.hash(last_block)
+        proof = self.proof_of_work(last_block["proof"], progress)
+
+        if proof is None:
+            return None
+
+        # the proof is searched without the lock, the block is forged with it so the chain cannot change in between
+        with self.lock.write():
+            if self.hash(self.last_block) != last_hash:
+                logger.debug("Chain changed while mining, discarding proof")
+                return None
+
+            transactions = self.mempool.take(self.max_block_transactions - 1)
+            fees = sum(transaction.fee for transaction in transactions)
+
+            # The sender is "0" to signify that this node has mined a new coin.
+            reward = Transaction(
+                sender="0", recipient=reward_address, amount=MINING_REWARD + fees
+            )
+
+            block = self.new_block(proof, last_hash, transactions + [reward])
+
+        self._blocks_mined.inc()
+        self.gossip.announce(self.nodes, blocks=[block.hash])
+        return block
+
     @staticmethod
-    def valid_proof(last_proof, proof):
+    def valid_proof(last_proof, proof, difficulty=DIFFICULTY):
         """
-        Validates the Proof: Does hash(last_proof, proof) contain 4 leading zeroes?
+        Validates the Proof: Does hash(last_proof, proof) have difficulty leading zero bits?
         :param last_proof: <int> Previous Proof
         :type last_proof int
         :param proof: Current Proof
         :type proof int
+        :param difficulty: Number of leading zero bits
+        :type difficulty int
         :return: True if correct, False if not.
         :rtype: bool
         """
-        guess = f"{last_proof}{proof}".encode()
-        guess_hash = hashlib.sha256(guess).hexdigest()
-        return guess_hash[:4] == "0000"
+        return valid_proof(last_proof, proof, difficulty)
 
     def register_node(self, address):
         """
@@ -140,82 +995,797 @@ class Blockchain(object):
         """
         parsed_url = urlparse(address)
         if parsed_url.netloc:
-            self.nodes.add(parsed_url.netloc)
+            node = parsed_url.netloc
         elif parsed_url.path:
             # Accepts a URL without scheme
-            self.nodes.add(parsed_url.path)
+            node = parsed_url.path
         else:
             raise ValueError("Invalid URL")
 
-    def valid_chain(self, chain):
+        with self._nodes_lock:
+            self.nodes = self.nodes | {node}
+
+    def valid_block(self, chain, position):
         """
-        Determine if a given blockchain is valid
+        Determine if the block at the given position of a chain is valid, checking it against the block before it
         :param chain: Blockchain
-        :type chain Blockchain
+        :type chain list
+        :param position: Position of the block in the chain, after the genesis block
+        :type position int
         :return: True if valid, False otherwise
         :rtype: bool
         """
+        last_block = chain[position - 1]
+        block = chain[position]
+
+        try:
+            # check that the block links to the hash of the block before it, and that it has a hash itself, blocks
+            # with fields out of range of the canonical encoding have none
+            if block["previous_hash"] != self.hash(last_block) or not self.hash(block):
+                return False
 
-        last_block = chain[0]
-        current_index = 1
+            # check that the transactions are the ones the header commits to, headers are checked without them
+            if not isinstance(block, Header):
+                block = Block.from_dict(block)
+                if not block.valid_merkle_root():
+                    return False
 
-        while current_index < len(chain):
-            block = chain[current_index]
-            logger.debug(f"Last block {last_block}")
-            logger.debug(f"block {block}")
-            logger.debug("\n-----------\n")
+                # a signed transaction is only accepted once, see first_replayed_block for those of other blocks
+                signed = [
+                    transaction.id
+                    for transaction in block.transactions
+                    if transaction.signature is not None
+                ]
+                if len(set(signed)) != len(signed) or not self.valid_reward(block):
+                    return False
+        except EncodingError:
+            return False
 
-            # check that the hash of the block is correct
-            last_block_hash = self.hash(block)
+        # check that the block is timestamped after the median of the blocks before it and not far ahead of our clock
+        if not (
+            self.median_time(chain, position)
+            < block["timestamp"]
+            <= time() + MAX_FUTURE_DRIFT
+        ):
+            return False
 
-            if block["previous_hash"] != last_block_hash:
+        # check that the difficulty follows from the retargeting of the blocks before it
+        if block["difficulty"] != self.next_difficulty(chain, position):
+            return False
+
+        # Check that the Proof of Work is correct
+        if not self.valid_proof(
+            last_block["proof"], block["proof"], block["difficulty"]
+        ):
+            return False
+
+        # signatures are checked last, they cost the most
+        return isinstance(block, Header) or self.valid_signatures(
+            Block.from_dict(block).transactions, mint=True
+        )
+
+    @staticmethod
+    def valid_reward(block):
+        """
+        Determine if a block rewards its miner the way mine does, with a single transaction sent by MINT after all the
+        others, granting MINING_REWARD coins and the fees of the block. Every amount of the block must be positive and
+        every fee not negative, as for posted transactions
+        :param block: Block
+        :type block Block
+        :return: True if valid, False otherwise
+        :rtype: bool
+        """
+        if not block.transactions:
+            return False
+
+        # a negative amount would take coins from the recipient
+        for transaction in block.transactions:
+            if not is_number(transaction.amount) or transaction.amount <= 0:
+                return False
+            if not is_number(transaction.fee) or transaction.fee < 0:
                 return False
 
-            # check that the proof of work is correct
+        *transactions, reward = block.transactions
+        if reward.sender != MINT or reward.fee:
+            return False
+        if any(transaction.sender == MINT for transaction in transactions):
+            return False
+
+        # summed in the order mine sums them, so float fees add up to the same amount
+        fees = sum(transaction.fee for transaction in transactions)
+        return reward.amount == MINING_REWARD + fees
+
+    def first_invalid_block(self, chain, start=1):
+        """
+        Finds the first invalid block of a chain, validating long chains in parallel
+        :param chain: Blockchain
+        :type chain list
+        :param start: (Optional) Position of the first block to validate, the blocks before it are trusted
+        :type start int
+        :return: Index of the first invalid block or None if the chain is valid
+        :rtype: int
+        """
+        begin = perf_counter()
+        position = self.validator.first_invalid(self, chain, start)
+
+        self._validation_seconds.observe(perf_counter() - begin)
+        self._blocks_validated.inc(
+            (len(chain) if position is None else position + 1) - max(start, 1)
+        )
+
+        invalid = [
+            self.first_replayed_block(chain, start),
+            self.first_overdrawn_block(chain, start, position),
+        ]
+        if position is not None:
+            invalid.append(chain[position]["index"])
+        return min((index for index in invalid if index is not None), default=None)
+
+    def first_replayed_block(self, chain, start=1):
+        """
+        Finds the first block of a chain holding a signed transaction a block before it already holds, a replay of the
+        transaction. Blocks the chain shares with ours are checked with the lookup index, the blocks after them against
+        one another. Chains of headers have no transactions to check
+        :param chain: Blockchain
+        :type chain list
+        :param start: (Optional) Position of the first block to check, the blocks before it were checked already
+        :type start int
+        :return: Index of the first block replaying a transaction or None if no block does
+        :rtype: int
+        """
+        with self.lock.read():
+            shared = min(self.shared_length(chain), max(start, 1))
+
+        seen, signed, replayed = set(), [], None
+        for position in range(shared, len(chain)):
+            block = chain[position]
+            if isinstance(block, Header):
+                return None
+
+            for transaction in Block.from_dict(block).transactions:
+                if transaction.signature is None:
+                    continue
+                if transaction.id in seen:
+                    replayed = block["index"]
+                    break
+                seen.add(transaction.id)
+                signed.append((block["index"], transaction.id))
+
+            if replayed is not None:
+                break
+
+        with self.lock.read():
+            for index, transaction_id in signed:
+                if any(
+                    mined <= shared for mined, _ in self.lookup.locate(transaction_id)
+                ):
+                    return index
+        return replayed
+
+    def first_overdrawn_block(self, chain, start=1, stop=None):
+        """
+        Finds the first block of a chain holding transactions of a sender spending more than the balance it had before
+        the block. The balances after the blocks the chain shares with ours are those of our balance index with the
+        blocks of our chain after them rolled back, the blocks after them are checked one after the other. Chains of
+        headers have no transactions to check
+        :param chain: Blockchain
+        :type chain list
+        :param start: (Optional) Position of the first block to check, the blocks before it were checked already
+        :type start int
+        :param stop: (Optional) Position of the first block not to check, the first invalid block, defaults to the
+        length of the chain
+        :type stop int
+        :return: Index of the first block overdrawing a balance or None if no block does
+        :rtype: int
+        """
+        stop = len(chain) if stop is None else stop
+
+        with self.lock.read():
+            shared = min(self.shared_length(chain), max(start, 1))
+            if shared >= stop or isinstance(chain[shared], Header):
+                return None
+
+            balances = BalanceIndex.from_dict(self.balances.to_dict())
+            for block in reversed(self.chain[shared:]):
+                balances.revert(block)
 
-            # Check that the Proof of Work is correct
-            if not self.valid_proof(
-                last_block["proof"], block["proof"], last_block_hash
+        for position in range(shared, stop):
+            block = Block.from_dict(chain[position])
+
+            spent = defaultdict(int)
+            for transaction in block.transactions:
+                if transaction.sender != MINT:
+                    spent[transaction.sender] += transaction.amount + transaction.fee
+
+            if any(
+                amount > balances.balance(sender) for sender, amount in spent.items()
             ):
-                return False
+                return block["index"]
+            balances.apply(block)
 
-            last_block = block
-            current_index += 1
+        return None
 
-        return True
+    def valid_chain(self, chain):
+        """
+        Determine if a given blockchain is valid
+        :param chain: Blockchain
+        :type chain Blockchain
+        :return: True if valid, False otherwise
+        :rtype: bool
+        """
+        return self.first_invalid_block(chain) is None
 
     def resolve_conflicts(self):
         """
         This is our consensus algorithm, it resolves conflicts
-        by replacing our chain with the longest one in the network.
+        by reorganizing our chain onto the valid chain in the network that took the most work to mine.
+        Chains are fetched from all the nodes concurrently and each is validated as soon as it arrives. In incremental
+        sync mode only the blocks following the fork point with each node are fetched and validated, in headers sync
+        mode only their headers are and blocks are only fetched for the chain picked
         :return: True if our chain was replaced, False if not
         """
+        start = perf_counter()
 
-        neighbours = self.nodes
-        new_chain = None
+        if self.sync_mode in ("incremental", "headers"):
+            replaced = self.sync()
+        else:
+            replaced = self.sync_full()
 
-        # We're only looking for chains longer than ours
-        max_length = len(self.chain)
+        self._consensus_seconds.observe(perf_counter() - start, self.sync_mode)
+        self._consensus_rounds.inc(1, "replaced" if replaced else "kept")
+
+        if replaced:
+            self.gossip.announce(self.nodes, blocks=[self.last_block.hash])
+        return replaced
+
+    def sync_full(self):
+        """
+        Full consensus. The whole chains of all the nodes are fetched, and the blocks following the fork point with our
+        chain of the valid chain with the most work are added to the block tree. Only chains with more work than ours
+        and the chains picked so far are validated, from the first block that is neither ours nor in the tree
+        :return: True if our chain was replaced, False if not
+        """
+        best = None
+        # We're only looking for chains with more work than ours
+        best_work = self.work
 
         # Grab and verify the chains from all the nodes in our network
-        for node in neighbours:
-            response = get(f"http://{node}/chain")
+        for node, response in self.peers.get_all(self.nodes, "/api/block/chain"):
+            try:
+                # peer blocks are hashed once while validating and keep their hash if they replace ours
+                chain = [Block.from_dict(block) for block in response["chain"]]
+            except (KeyError, TypeError, EncodingError):
+                logger.info(f"Chain of {node} is malformed")
+                continue
 
-            if response.status_code == 200:
-                length = response.json()["length"]
-                chain = response.json()["chain"]
+            with self.lock.read():
+                fork = self.shared_length(chain)
+            blocks = chain[fork:]
 
-                # Check if the length is longer and the chain is valid
-                if length > max_length and self.valid_chain(chain):
-                    max_length = length
-                    new_chain = chain
+            if not fork:
+                logger.info(f"Chain of {node} does not start with our genesis block")
+                continue
 
-        # Replace our chain if we discovered a new, valid chain longer than ours
-        if new_chain:
-            self.chain = new_chain
-            return True
+            work = self.branch_work(fork, blocks)
+            if not blocks or work <= best_work:
+                continue
+
+            start = perf_counter()
+            invalid = self.first_invalid_block(
+                chain, start=self.known_length(chain, fork)
+            )
+            self._peer_sync_seconds.observe(perf_counter() - start, node)
+
+            if invalid is None:
+                best_work = work
+                best = fork, blocks
+            else:
+                logger.info(f"Chain of {node} is invalid at block {invalid}")
+
+        # Reorganize our chain if we discovered a valid chain with more work, and it still has more once we hold the lock
+        return best is not None and self.add_branch(*best)
+
+    def sync(self):
+        """
+        Incremental consensus. The tips of all the nodes are fetched, then starting with the chain with the most work
+        the fork point with our chain is found and only the blocks, or the headers in headers sync mode, following it
+        are fetched and validated. Our chain is reorganized onto the first of those chains that is valid
+        :return: True if our chain was replaced, False if not
+        """
+        sync_with = self.sync_headers if self.sync_mode == "headers" else self.sync_with
+
+        with self.lock.read():
+            length, work = len(self.chain), self.work
+
+        tips = []
+        for node, tip in self.peers.get_all(self.nodes, "/api/block/chain/tip"):
+            if not isinstance(tip, dict) or not isinstance(tip.get("length"), int):
+                continue
+
+            # nodes not reporting the work of their chain are compared by length
+            if isinstance(tip.get("work"), int):
+                if tip["work"] > work:
+                    tips.append((tip["work"], tip["length"], node))
+            elif tip["length"] > length:
+                tips.append((0, tip["length"], node))
+
+        for _, length, node in sorted(tips, reverse=True):
+            start = perf_counter()
+            synced = sync_with(node, length)
+            self._peer_sync_seconds.observe(perf_counter() - start, node)
+
+            if synced:
+                return True
 
         return False
 
+    def _peer_header(self, node, index):
+        """
+        Fetches the header of a single block of a node
+        :return: Header or None if the node does not have it
+        :rtype: Header
+        """
+        response = self.peers.get_json(
+            node, "/api/block/headers", params={"from": index, "limit": 1}
+        )
+        try:
+            return Header.from_dict(response["headers"][0])
+        except (KeyError, IndexError, TypeError):
+            return None
+
+    def common_ancestor(self, node, length):
+        """
+        Finds the number of blocks our chain shares with the chain of a node. Blocks link to the hash of the block before
+        them, so once a block matches all blocks before it match, which allows a binary search over the block hashes
+        :param node: Address of the node
+        :type node str
+        :param length: Length of the chain of the node
+        :type length int
+        :return: Number of blocks both chains start with
+        :rtype: int
+        """
+
+        def matches(index):
+            header = self._peer_header(node, index)
+            return header is not None and header.hash == self.hash(
+                self.chain[index - 1]
+            )
+
+        # usually the node has simply extended our chain
+        shared, mismatch = 0, min(len(self.chain), length)
+        if matches(mismatch):
+            return mismatch
+
+        while mismatch - shared > 1:
+            middle = (shared + mismatch) // 2
+            if matches(middle):
+                shared = middle
+            else:
+                mismatch = middle
+
+        return shared
+
+    def sync_with(self, node, length):
+        """
+        Syncs our chain with a chain of a node with more work, fetching only the blocks after the fork point and
+        validating those that are not in the block tree
+        :param node: Address of the node
+        :type node str
+        :param length: Length of the chain of the node
+        :type length int
+        :return: True if our chain was replaced, False if not
+        """
+        fork = self.common_ancestor(node, length)
+        if not fork:
+            logger.info(f"Chain of {node} does not start with our genesis block")
+            return False
+        blocks = []
+
+        while fork + len(blocks) < length:
+            response = self.peers.get_json(
+                node,
+                "/api/block/chain",
+                params={"from": fork + len(blocks) + 1, "limit": self.sync_page_size},
+            )
+            try:
+                page = [Block.from_dict(block) for block in response["chain"]]
+            except (KeyError, TypeError, EncodingError):
+                logger.info(f"Chain of {node} is malformed")
+                return False
+
+            if not page:
+                break
+            blocks.extend(page)
+
+        if not blocks or self.branch_work(fork, blocks) <= self.work:
+            return False
+
+        chain = SplicedChain(self.chain, fork, blocks)
+        invalid = self.first_invalid_block(chain, start=self.known_length(chain, fork))
+        if invalid is not None:
+            logger.info(f"Chain of {node} is invalid at block {invalid}")
+            return False
+
+        logger.debug(f"Syncing {len(blocks)} blocks from {node} after block {fork}")
+        return self.add_branch(fork, blocks)
+
+    def fetch_range(self, node, path, model, start, stop):
+        """
+        Fetches the blocks or headers of a node in a range of block indexes, all pages of the range at the same time.
+        They are fetched in their canonical binary encoding, which is smaller than their JSON and decoded without
+        building dicts first
+        :param node: Address of the node
+        :type node str
+        :param path: Path of the range e.g /api/block/headers
+        :type path str
+        :param model: Model the blocks or headers are decoded as
+        :type model type
+        :param start: Index of the first block
+        :type start int
+        :param stop: Index of the last block
+        :type stop int
+        :return: Blocks or headers, or None if the node did not answer with all of them
+        :rtype: list
+        """
+        params = [
+            {"from": index, "limit": min(self.sync_page_size, stop - index + 1)}
+            for index in range(start, stop + 1, self.sync_page_size)
+        ]
+        items = []
+
+        responses = self.peers.get_many(node, path, params, binary=True)
+        for query, response in zip(params, responses):
+            try:
+                page = [model.decode(record) for record in decode_records(response)]
+            except (EncodingError, TypeError):
+                logger.info(f"Range of {node} from {query['from']} is malformed")
+                return None
+
+            if len(page) != query["limit"]:
+                logger.info(f"Range of {node} from {query['from']} is incomplete")
+                return None
+            items.extend(page)
+
+        return items
+
+    def sync_headers(self, node, length):
+        """
+        Headers first sync with a chain of a node with more work. Only the headers following the fork point are fetched
+        and validated, the blocks are then fetched for the headers, all pages at the same time, and checked against
+        them. Blocks already in the block tree are taken from it instead of being fetched and validated again
+        :param node: Address of the node
+        :type node str
+        :param length: Length of the chain of the node
+        :type length int
+        :return: True if our chain was replaced, False if not
+        """
+        fork = self.common_ancestor(node, length)
+        if not fork:
+            logger.info(f"Chain of {node} does not start with our genesis block")
+            return False
+        headers = self.fetch_range(node, "/api/block/headers", Header, fork + 1, length)
+        if headers is None:
+            return False
+        if not headers or self.branch_work(fork, headers) <= self.work:
+            return False
+
+        chain = SplicedChain(self.chain, fork, headers)
+        known = self.known_length(chain, fork)
+        invalid = self.first_invalid_block(chain, known)
+        if invalid is not None:
+            logger.info(f"Headers of {node} are invalid at block {invalid}")
+            return False
+
+        with self.lock.read():
+            nodes = [self.tree.get(header.hash) for header in headers[: known - fork]]
+        # blocks pruned from the tree in the meantime are fetched along with the others
+        if None in nodes:
+            nodes = nodes[: nodes.index(None)]
+        tree_blocks = [tree_node.block for tree_node in nodes]
+
+        blocks = self.fetch_range(
+            node, "/api/block/chain", Block, fork + len(tree_blocks) + 1, length
+        )
+        if blocks is None:
+            return False
+
+        for header, block in zip(headers[len(tree_blocks) :], blocks):
+            # the header hash covers the Merkle root, which covers the transactions
+            if block.hash != header.hash or not block.valid_merkle_root():
+                logger.info(
+                    f"Block {block['index']} of {node} does not match its header"
+                )
+                return False
+            if not self.valid_reward(block):
+                logger.info(f"Block {block['index']} of {node} has an invalid reward")
+                return False
+
+        # the signatures of all the blocks are verified at once, in as many batches as they fill
+        transactions = [
+            transaction for block in blocks for transaction in block.transactions
+        ]
+        if not self.valid_signatures(transactions, mint=True):
+            logger.info(f"Blocks of {node} hold transactions not validly signed")
+            return False
+
+        branch = SplicedChain(self.chain, fork, tree_blocks + blocks)
+        replayed = self.first_replayed_block(branch, fork + len(tree_blocks))
+        if replayed is not None:
+            logger.info(f"Block {replayed} of {node} replays a transaction")
+            return False
+
+        overdrawn = self.first_overdrawn_block(branch, fork + len(tree_blocks))
+        if overdrawn is not None:
+            logger.info(f"Block {overdrawn} of {node} overdraws a balance")
+            return False
+
+        logger.debug(f"Syncing {len(blocks)} blocks from {node} after block {fork}")
+        return self.add_branch(fork, tree_blocks + blocks)
+
+    def receive_inventory(self, node, blocks=(), transactions=()):
+        """
+        Handles the hashes of blocks and ids of transactions announced by a registered node, the blocks and transactions
+        we do not have are fetched from it in the background, see gossip
+        :param node: Address of the node
+        :type node str
+        :param blocks: (Optional) Hashes of the blocks, in chain order
+        :type blocks list
+        :param transactions: (Optional) Ids of the transactions
+        :type transactions list
+        :return: Number of blocks and transactions fetched, or None if the node is not registered
+        :rtype: int
+        """
+        if node not in self.nodes:
+            return None
+        return self.gossip.receive(self, node, blocks, transactions)
+
+    def receive_block(self, block, origin=None):
+        """
+        Adds a block announced by a node. The block must follow a block of the block tree, our last block or that of a
+        branch we know, and is the only block validated. Our chain is reorganized onto it if it has the most work, and
+        it is announced to the other nodes
+        :param block: Block
+        :type block Block
+        :param origin: (Optional) Address of the node that announced the block
+        :type origin str
+        :return: True if the block was added, False if it is known or invalid, None if the block it follows is unknown
+        :rtype: bool
+        """
+        block = Block.from_dict(block)
+
+        with self.lock.read():
+            if block.hash in self.tree:
+                return False
+
+            parent = self.tree.get(block["previous_hash"])
+            blocks = None if parent is None else self.branch_of(parent)
+            if blocks is None:
+                return None
+
+            fork = parent.index - len(blocks)
+            chain = SplicedChain(self.chain, fork, blocks + [block])
+
+        if (
+            block["index"] != parent.index + 1
+            or self.first_invalid_block(chain, start=len(chain) - 1) is not None
+        ):
+            logger.info(f"Block {block.hash} of {origin} is invalid")
+            return False
+
+        self.add_branch(fork, blocks + [block])
+        if block.hash not in self.tree:
+            return False
+
+        self.gossip.announce(self.nodes, blocks=[block.hash], origin=origin)
+        return True
+
+    def sync_node(self, node):
+        """
+        Syncs our chain with the chain of a single node if it has more work, e.g a node that announced a block following
+        blocks we do not have. Only the blocks after the fork point are fetched, whatever the sync mode, as they are in
+        incremental and headers mode
+        :param node: Address of the node
+        :type node str
+        :return: True if our chain was replaced, False if not
+        :rtype: bool
+        """
+        sync_with = self.sync_headers if self.sync_mode == "headers" else self.sync_with
+
+        tip = self.peers.get_json(node, "/api/block/chain/tip")
+        if not isinstance(tip, dict) or not isinstance(tip.get("length"), int):
+            return False
+        if isinstance(tip.get("work"), int) and tip["work"] <= self.work:
+            return False
+
+        if not sync_with(node, tip["length"]):
+            return False
+
+        self.gossip.announce(self.nodes, blocks=[self.last_block.hash], origin=node)
+        return True
+
+    def add_branch(self, fork, blocks):
+        """
+        Adds validated blocks following the first blocks of our chain to the block tree, then reorganizes our chain
+        onto the tip with the most work. The blocks are fetched and validated without the lock and our chain may have
+        changed in the meantime, they are only added if the block they follow is still known
+        :param fork: Number of blocks of our chain the blocks follow
+        :type fork int
+        :param blocks: Blocks following them
+        :type blocks list
+        :return: True if our chain was reorganized, False if it still has the most work
+        :rtype: bool
+        """
+        with self.lock.write():
+            parent = blocks[0]["previous_hash"]
+
+            if parent in self.tree:
+                self.tree.extend(blocks)
+            elif 0 < fork <= len(self.chain) and parent == self.hash(
+                self.chain[fork - 1]
+            ):
+                self.tree.extend(blocks, self.work_at(fork))
+            else:
+                logger.debug("Chain changed while syncing, discarding blocks")
+                return False
+
+            return self.reorganize()
+
+    def reorganize(self):
+        """
+        Reorganizes our chain onto the tip of the block tree with the most work, if it has more work than our chain.
+        Only the blocks of our chain following the fork point with the branch of the tip are rolled back and those of
+        the branch replayed, the blocks rolled back stay in the tree as a side branch
+        :return: True if our chain was reorganized, False if it has the most work
+        :rtype: bool
+        """
+        with self.lock.write():
+            for tip in self.tree.tips():
+                if tip.work <= self.work:
+                    return False
+
+                blocks = self.branch_of(tip)
+                if not blocks:
+                    continue
+
+                fork = blocks[0]["index"] - 1
+                depth = len(self.chain) - fork
+                self.splice_chain(fork, blocks)
+
+                if depth:
+                    logger.info(f"Reorganized {depth} blocks after block {fork}")
+                    self._reorganizations.inc()
+                    self._reorganization_depth.observe(depth)
+                return True
+
+            return False
+
+    def branch_of(self, tip):
+        """
+        Blocks of the branch of a tip of the block tree following the fork point with our chain, the caller holds the
+        lock
+        :param tip: Tip of the tree
+        :type tip TreeNode
+        :return: Blocks of the branch, none for a block of our chain, or None if the fork point was pruned from the tree
+        :rtype: list
+        """
+        blocks = []
+
+        for tree_node in self.tree.branch(tip.hash):
+            index = tree_node.index
+            if (
+                index <= len(self.chain)
+                and self.hash(self.chain[index - 1]) == tree_node.hash
+            ):
+                break
+            blocks.append(tree_node.block)
+        else:
+            # the branch starts at the first block the tree holds, which must follow a block of our chain
+            first = blocks[-1]
+            fork = first["index"] - 1
+            if fork > len(self.chain) or (
+                fork and first["previous_hash"] != self.hash(self.chain[fork - 1])
+            ):
+                return None
+
+        blocks.reverse()
+        return blocks
+
+    def adopt_chain(self, chain):
+        """
+        Makes a chain we trust our chain without validating it, e.g a chain mined by another node we run or our chain
+        rolled back. A chain with more work is added to the block tree as a branch and our chain reorganized onto it,
+        any other chain is spliced in after the fork point and the blocks it drops are forgotten by the block tree. In
+        both cases only the blocks after the fork point are rolled back and replayed in the indexes, all of them for a
+        chain that does not start with our genesis block
+        :param chain: Chain
+        :type chain list
+        """
+        chain = [Block.from_dict(block) for block in chain]
+
+        with self.lock.write():
+            fork = self.shared_length(chain)
+            if fork < len(chain) and self.add_branch(fork, chain[fork:]):
+                return
+
+            self.splice_chain(fork, chain[fork:])
+            self.tree.clear()
+            self.track_tail()
+
+    def splice_chain(self, fork, blocks):
+        """
+        Replaces the blocks of our chain following the fork point with the given blocks, rolling back the blocks
+        dropped and replaying the new ones in the indexes
+        :param fork: Number of blocks of our chain to keep
+        :type fork int
+        :param blocks: Blocks following the fork point
+        :type blocks list
+        """
+        blocks = [Block.from_dict(block) for block in blocks]
+
+        with self.lock.write():
+            dropped = self.chain[fork:]
+
+            for block in reversed(dropped):
+                self.unindex_block(block)
+            for block in blocks:
+                self.index_block(block)
+
+            self.restore_transactions(dropped, blocks)
+
+            # a chain in memory is replaced by a new list rather than changed in place, readers holding the old one
+            # keep a consistent chain
+            if self.store is None:
+                self.chain = self.chain[:fork] + blocks
+            else:
+                self.store.truncate(fork)
+                self.store.extend(blocks)
+                self.store.sync()
+                self.save_indexes()
+
+            self.track_tail()
+
+    def restore_transactions(self, dropped, blocks):
+        """
+        Updates the pool of pending transactions once blocks of our chain are replaced. Transactions of the blocks
+        dropped are pending again, unless the new blocks hold them or their senders no longer have the funds, and
+        transactions of the new blocks are no longer pending
+        :param dropped: Blocks dropped from our chain
+        :type dropped list
+        :param blocks: Blocks replacing them
+        :type blocks list
+        """
+        included = {
+            transaction for block in blocks for transaction in block.transactions
+        }
+        self.mempool.remove(included)
+        self.mempool.add_many(
+            (
+                transaction
+                for block in dropped
+                for transaction in block.transactions
+                if transaction.sender != MINT and transaction not in included
+            ),
+            funds=self.balances.balance,
+        )
+
+    def shared_length(self, chain):
+        """
+        Number of blocks our chain starts with that the given chain starts with too. Blocks link to the hash of the
+        block before them, so once a block matches all blocks before it match, which allows a binary search
+        :param chain: Chain to compare ours with
+        :type chain list
+        :rtype: int
+        """
+        shared, mismatch = 0, min(len(self.chain), len(chain)) + 1
+
+        while mismatch - shared > 1:
+            middle = (shared + mismatch) // 2
+            if self.hash(self.chain[middle - 1]) == self.hash(chain[middle - 1]):
+                shared = middle
+            else:
+                mismatch = middle
+
+        return shared
+
     def __len__(self):
         return len(self.chain)
@@ -0,0 +1,336 @@
+"""
+Canonical binary encoding of blocks, headers and transactions, used for hashing, for storing blocks and for sending
+blocks and headers to peers. JSON stays the format of the API.
+
+A header has a fixed size of 91 bytes, all integers being big endian:
+
+    +-------------+-----------+---------------+-----------+----------------+--------------------+------------------+
+    | version (1) | index (8) | timestamp (8) | proof (8) | difficulty (1) | previous hash (33) | merkle root (32) |
+    +-------------+-----------+---------------+-----------+----------------+--------------------+------------------+
+
+The timestamp is an IEEE 754 double. Hashes are stored as their 32 raw bytes, the previous hash is prefixed with a tag
+byte as the genesis block, and tests, link to a short string instead of a hash. A block is its header followed by the
+number of its transactions (4) and its transactions. A transaction is the lengths of its sender and recipient (2 each),
+its sender and recipient in UTF-8, then its amount and fee, followed by its nonce (8) if it has one and its 64 byte
+signature if it is signed. The top bits of the lengths of the sender and of the recipient tell whether it is signed and
+whether it has a nonce, so transactions with neither encode as they did before signatures.
+
+Amounts and fees are numbers tagged with their kind, integers being stored as such whether they are given as int or
+float, so 100 and 100.0 encode the same, while other floats are stored as doubles. Unlike JSON, the bytes of a block
+only depend on its values, never on how they happen to be typed or formatted
+"""
+import struct
+
+VERSION = 1
+
+HEADER = struct.Struct(">BQdQB33s32s")
+COUNT = struct.Struct(">I")
+LENGTHS = struct.Struct(">HH")
+INTEGER = struct.Struct(">Bq")
+INTEGERS = struct.Struct(">BqBq")
+DOUBLE = struct.Struct(">Bd")
+BIG_INTEGER = struct.Struct(">BB")
+INT64_VALUE = struct.Struct(">q")
+NONCE_VALUE = struct.Struct(">Q")
+DOUBLE_VALUE = struct.Struct(">d")
+
+# tags of the kinds of hashes
+DIGEST, SHORT_STRING = 0, 1
+
+# tags of the kinds of numbers
+INTEGER_TAG, DOUBLE_TAG, BIG_INTEGER_TAG = 0, 1, 2
+
+INT64 = 2 ** 63
+
+# flag of the length of the sender of a signed transaction
+SIGNED = 0x8000
+SIGNATURE_SIZE = 64
+# flag of the length of the recipient of a transaction with a nonce
+NONCED = 0x8000
+
+
+class EncodingError(ValueError):
+    """
+    Raised when values cannot be encoded, e.g a proof that does not fit in 8 bytes, or bytes cannot be decoded
+    """
+
+
+def encode_hash(value):
+    if len(value) == 64:
+        try:
+            return bytes([DIGEST]) + bytes.fromhex(value)
+        except ValueError:
+            pass
+
+    raw = value.encode()
+    if len(raw) > 31:
+        raise EncodingError(
+            f"Hash {value!r} is neither a SHA-256 hash nor a short string"
+        )
+    return bytes([SHORT_STRING, len(raw)]) + raw.ljust(31, b"\0")
+
+
+def decode_hash(raw):
+    if raw[0] == DIGEST:
+        return raw[1:].hex()
+    if raw[0] != SHORT_STRING or raw[1] > 31:
+        raise EncodingError(f"Unknown hash tag {raw[0]} or length {raw[1]}")
+    return raw[2 : 2 + raw[1]].decode()
+
+
+def encode_number(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+
+    if isinstance(value, int) and not isinstance(value, bool):
+        if -INT64 <= value < INT64:
+            return INTEGER.pack(INTEGER_TAG, value)
+        size = (value.bit_length() + 8) // 8
+        return BIG_INTEGER.pack(BIG_INTEGER_TAG, size) + value.to_bytes(
+            size, "big", signed=True
+        )
+
+    if isinstance(value, float):
+        return DOUBLE.pack(DOUBLE_TAG, value)
+
+    raise EncodingError(f"{value!r} is not a number")
+
+
+def decode_number(buffer, offset):
+    tag = buffer[offset]
+
+    if tag == INTEGER_TAG:
+        return INT64_VALUE.unpack_from(buffer, offset + 1)[0], offset + INTEGER.size
+    if tag == DOUBLE_TAG:
+        return DOUBLE_VALUE.unpack_from(buffer, offset + 1)[0], offset + DOUBLE.size
+    if tag == BIG_INTEGER_TAG:
+        size = buffer[offset + 1]
+        start = offset + BIG_INTEGER.size
+        return (
+            int.from_bytes(buffer[start : start + size], "big", signed=True),
+            start + size,
+        )
+
+    raise EncodingError(f"Unknown number tag {tag}")
+
+
+def encode_transaction(sender, recipient, amount, fee, signature=None, nonce=None):
+    """
+    Encodes a transaction. Without its signature, the encoding is the message the sender signs
+    :param signature: (Optional) Hex encoded signature of the transaction
+    :type signature str
+    :param nonce: (Optional) Number the sender picks to tell its transactions apart, from 0 to 2 ** 64 - 1
+    :type nonce int
+    :return: Encoded transaction
+    :rtype: bytes
+    """
+    try:
+        sender, recipient = sender.encode(), recipient.encode()
+        if len(sender) >= SIGNED:
+            raise EncodingError("Sender is too long")
+        if len(recipient) >= NONCED:
+            raise EncodingError("Recipient is too long")
+
+        if nonce is None:
+            nonced, raw_nonce = 0, b""
+        elif isinstance(nonce, bool) or not isinstance(nonce, int):
+            raise EncodingError(f"Nonce {nonce!r} is not an integer")
+        else:
+            nonced, raw_nonce = NONCED, NONCE_VALUE.pack(nonce)
+
+        if signature is None:
+            signed, raw_signature = 0, b""
+        else:
+            signed, raw_signature = SIGNED, bytes.fromhex(signature)
+            if len(raw_signature) != SIGNATURE_SIZE:
+                raise EncodingError(f"Signature is not {SIGNATURE_SIZE} bytes")
+
+        return b"".join(
+            (
+                LENGTHS.pack(len(sender) | signed, len(recipient) | nonced),
+                sender,
+                recipient,
+                encode_number(amount),
+                encode_number(fee),
+                raw_nonce,
+                raw_signature,
+            )
+        )
+    except EncodingError:
+        raise
+    except (AttributeError, TypeError, ValueError, struct.error) as e:
+        raise EncodingError(f"Transaction cannot be encoded: {e}")
+
+
+def decode_transaction(buffer, offset=0):
+    """
+    Decodes a transaction
+    :param buffer: Buffer holding the transaction
+    :type buffer bytes
+    :param offset: (Optional) Offset of the transaction in the buffer
+    :type offset int
+    :return: Sender, recipient, amount, fee, signature and nonce of the transaction, None for a signature or a nonce it
+    does not have, and the offset following it
+    :rtype: tuple
+    """
+    sender_length, recipient_length = LENGTHS.unpack_from(buffer, offset)
+    signed, nonced = sender_length & SIGNED, recipient_length & NONCED
+    start = offset + LENGTHS.size
+    middle = start + (sender_length & ~SIGNED)
+    offset = middle + (recipient_length & ~NONCED)
+    sender = str(buffer[start:middle], "utf-8")
+    recipient = str(buffer[middle:offset], "utf-8")
+
+    # most amounts and fees are integers, decoded together
+    if buffer[offset] == INTEGER_TAG and buffer[offset + INTEGER.size] == INTEGER_TAG:
+        _, amount, _, fee = INTEGERS.unpack_from(buffer, offset)
+        offset += INTEGERS.size
+    else:
+        amount, offset = decode_number(buffer, offset)
+        fee, offset = decode_number(buffer, offset)
+
+    nonce = None
+    if nonced:
+        (nonce,) = NONCE_VALUE.unpack_from(buffer, offset)
+        offset += NONCE_VALUE.size
+
+    if not signed:
+        return (sender, recipient, amount, fee, None, nonce), offset
+
+    signature = buffer[offset : offset + SIGNATURE_SIZE]
+    if len(signature) != SIGNATURE_SIZE:
+        raise EncodingError("Signature is truncated")
+    return (
+        sender,
+        recipient,
+        amount,
+        fee,
+        signature.hex(),
+        nonce,
+    ), offset + SIGNATURE_SIZE
+
+
+def encode_header(index, timestamp, proof, difficulty, previous_hash, merkle_root):
+    """
+    Encodes the header of a block
+    :return: Encoded header, HEADER.size bytes
+    :rtype: bytes
+    """
+    try:
+        return HEADER.pack(
+            VERSION,
+            index,
+            timestamp,
+            proof,
+            difficulty,
+            encode_hash(previous_hash),
+            bytes.fromhex(merkle_root),
+        )
+    except (AttributeError, TypeError, ValueError, struct.error) as e:
+        raise EncodingError(f"Header cannot be encoded: {e}")
+
+
+def decode_header(buffer, offset=0):
+    """
+    Decodes the header of a block
+    :param buffer: Buffer holding the header
+    :type buffer bytes
+    :param offset: (Optional) Offset of the header in the buffer
+    :type offset int
+    :return: Index, timestamp, proof, difficulty, previous hash and Merkle root of the block, and the offset following
+    the header
+    :rtype: tuple
+    """
+    try:
+        version, index, timestamp, proof, difficulty, previous_hash, root = (
+            HEADER.unpack_from(buffer, offset)
+        )
+        if version != VERSION:
+            raise EncodingError(f"Unknown encoding version {version}")
+
+        fields = (
+            index,
+            timestamp,
+            proof,
+            difficulty,
+            decode_hash(previous_hash),
+            root.hex(),
+        )
+    except (IndexError, UnicodeDecodeError, struct.error) as e:
+        raise EncodingError(f"Header cannot be decoded: {e}")
+
+    return fields, offset + HEADER.size
+
+
+def encode_block(header, transactions):
+    """
+    Encodes a block from its encoded header and transactions
+    :param header: Encoded header
+    :type header bytes
+    :param transactions: Encoded transactions
+    :type transactions list
+    :return: Encoded block
+    :rtype: bytes
+    """
+    return header + COUNT.pack(len(transactions)) + b"".join(transactions)
+
+
+def decode_block(buffer):
+    """
+    Decodes a block
+    :param buffer: Encoded block
+    :type buffer bytes
+    :return: Fields of the header, see decode_header, and fields of the transactions, see decode_transaction
+    :rtype: tuple
+    """
+    try:
+        header, offset = decode_header(buffer)
+        (count,) = COUNT.unpack_from(buffer, offset)
+        offset += COUNT.size
+
+        transactions = []
+        for _ in range(count):
+            transaction, offset = decode_transaction(buffer, offset)
+            transactions.append(transaction)
+    except (IndexError, UnicodeDecodeError, struct.error) as e:
+        raise EncodingError(f"Block cannot be decoded: {e}")
+
+    if offset != len(buffer):
+        raise EncodingError("Block is followed by trailing bytes")
+
+    return header, transactions
+
+
+def encode_records(records):
+    """
+    Frames encoded blocks or headers to send them in a single response, each prefixed with its length
+    :param records: Encoded blocks or headers
+    :type records iterable
+    :rtype: bytes
+    """
+    return b"".join(COUNT.pack(len(record)) + record for record in records)
+
+
+def decode_records(buffer):
+    """
+    Splits a response framed by encode_records into its records
+    :param buffer: Framed records
+    :type buffer bytes
+    :return: Encoded blocks or headers
+    :rtype: list
+    """
+    records = []
+    offset = 0
+
+    try:
+        while offset < len(buffer):
+            (length,) = COUNT.unpack_from(buffer, offset)
+            offset += COUNT.size
+            if offset + length > len(buffer):
+                raise EncodingError("Record is cut short")
+            records.append(bytes(buffer[offset : offset + length]))
+            offset += length
+    except struct.error as e:
+        raise EncodingError(f"Records cannot be decoded: {e}")
+
+    return records
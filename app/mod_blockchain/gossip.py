@@ -0,0 +1,297 @@
+"""
+Push propagation of blocks and transactions between registered nodes. Once a node mines or accepts a block, or accepts
+transactions, it announces them to its nodes by hash, the block hashes and transaction ids making up an inventory,
+instead of leaving the nodes to find them in their next round of consensus. A node announced an inventory only fetches
+the blocks and transactions it does not have, adds them as if they had been posted to it and announces those it
+accepted in turn, so items spread from node to node.
+
+Propagation is bounded twice. An inventory is announced to at most fanout of the registered nodes, picked at random
+and leaving out the node the items came from, and the hashes of the items seen are remembered in a bounded LRU set,
+so an item announced by several nodes is fetched and relayed once. Inventories are sent and handled on a pool of
+threads, neither mining nor the request carrying an inventory waits on other nodes.
+
+A block following a block we do not know means we missed blocks, the chain of the node announcing it is then synced
+as a chain with more work is in a round of consensus
+"""
+import random
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from app import logger
+from .encoding import EncodingError
+from .metrics import Metrics
+from .models import Block, parse_transaction
+from .peers import PeerClient
+
+# most blocks or transactions fetched from a node in a single request
+FETCH_BATCH_SIZE = 100
+
+
+def batches(keys):
+    return [
+        keys[start : start + FETCH_BATCH_SIZE]
+        for start in range(0, len(keys), FETCH_BATCH_SIZE)
+    ]
+
+
+class Gossip(object):
+    """
+    Announces new blocks and transactions to the registered nodes and fetches those announced by them
+    """
+
+    def __init__(
+        self,
+        address=None,
+        fanout=8,
+        seen_size=100000,
+        workers=4,
+        peers=None,
+        metrics=None,
+    ):
+        """
+        :param address: (Optional) Address the nodes reach this node at, host:port, nothing is announced if not given
+        :type address str
+        :param fanout: (Optional) Most nodes an inventory is announced to
+        :type fanout int
+        :param seen_size: (Optional) Number of hashes of the blocks and transactions seen that are remembered
+        :type seen_size int
+        :param workers: (Optional) Number of threads sending inventories and fetching the items announced
+        :type workers int
+        :param peers: (Optional) Client used to talk to the nodes
+        :type peers PeerClient
+        :param metrics: (Optional) Registry announcements are recorded in
+        :type metrics Metrics
+        """
+        self.address = address
+        self.fanout = fanout
+        self.seen_size = seen_size
+        self.peers = peers or PeerClient()
+        # (kind, hash) of the blocks and transactions seen, least recently seen first
+        self._seen = OrderedDict()
+        self._lock = Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+        metrics = metrics or Metrics(enabled=False)
+        self._announcements = metrics.counter(
+            "blockchain_gossip_announcements_total",
+            "Inventories announced to nodes, sent, or by nodes, received",
+            ("direction",),
+        )
+        self._fetched = metrics.counter(
+            "blockchain_gossip_fetched_total",
+            "Blocks and transactions fetched from the nodes announcing them",
+            ("kind",),
+        )
+        self._duplicates = metrics.counter(
+            "blockchain_gossip_duplicates_total",
+            "Blocks and transactions announced that were already seen, and not fetched",
+            ("kind",),
+        )
+
+    @classmethod
+    def from_config(cls, config, peers=None, metrics=None):
+        """
+        Creates the gossip from the application configuration
+        :param config: Application configuration
+        :type config dict
+        :param peers: (Optional) Client used to talk to the nodes
+        :type peers PeerClient
+        :param metrics: (Optional) Registry announcements are recorded in
+        :type metrics Metrics
+        :rtype: Gossip
+        """
+        return cls(
+            address=config.get("NODE_ADDRESS"),
+            fanout=config.get("GOSSIP_FANOUT", 8),
+            seen_size=config.get("GOSSIP_SEEN_SIZE", 100000),
+            workers=config.get("GOSSIP_WORKERS", 4),
+            peers=peers,
+            metrics=metrics,
+        )
+
+    @property
+    def enabled(self):
+        """Whether items are announced, which takes the address the nodes reach us at"""
+        return self.address is not None
+
+    def unseen(self, kind, keys):
+        """
+        Marks blocks or transactions as seen
+        :param kind: Either block or transaction
+        :type kind str
+        :param keys: Hashes of the blocks or ids of the transactions
+        :type keys list
+        :return: Keys of those not seen before, in order
+        :rtype: list
+        """
+        fresh = []
+        with self._lock:
+            for key in keys:
+                entry = (kind, key)
+                if entry in self._seen:
+                    self._seen.move_to_end(entry)
+                else:
+                    self._seen[entry] = None
+                    fresh.append(key)
+            while len(self._seen) > self.seen_size:
+                self._seen.popitem(last=False)
+        return fresh
+
+    def forget(self, kind, keys):
+        """
+        Forgets blocks or transactions seen, e.g those a node failed to send, so they are fetched if announced again
+        :param kind: Either block or transaction
+        :type kind str
+        :param keys: Hashes of the blocks or ids of the transactions
+        :type keys list
+        """
+        with self._lock:
+            for key in keys:
+                self._seen.pop((kind, key), None)
+
+    def announce(self, nodes, blocks=(), transactions=(), origin=None):
+        """
+        Announces blocks and transactions to at most fanout of the nodes, in the background
+        :param nodes: Addresses of the registered nodes
+        :type nodes frozenset
+        :param blocks: (Optional) Hashes of the blocks, in chain order
+        :type blocks list
+        :param transactions: (Optional) Ids of the transactions
+        :type transactions list
+        :param origin: (Optional) Address of the node the items came from, which is not announced to
+        :type origin str
+        :return: Addresses of the nodes announced to
+        :rtype: list
+        """
+        if not self.enabled or not (blocks or transactions):
+            return []
+
+        # nodes announcing our own items back to us are not fetched from
+        self.unseen("block", blocks)
+        self.unseen("transaction", transactions)
+
+        candidates = sorted(nodes - {origin, self.address})
+        targets = random.sample(candidates, min(self.fanout, len(candidates)))
+        inventory = dict(
+            node=self.address, blocks=list(blocks), transactions=list(transactions)
+        )
+
+        for node in targets:
+            self._executor.submit(self._send, node, inventory)
+        return targets
+
+    def _send(self, node, inventory):
+        if self.peers.post_json(node, "/api/block/inventory", inventory):
+            self._announcements.inc(1, "sent")
+
+    def receive(self, blockchain, node, blocks=(), transactions=()):
+        """
+        Handles an inventory announced by a node, fetching in the background the blocks and transactions neither seen
+        nor held by the blockchain
+        :param blockchain: Blockchain the items are added to
+        :type blockchain Blockchain
+        :param node: Address of the node, the items are fetched from it
+        :type node str
+        :param blocks: (Optional) Hashes of the blocks, in chain order
+        :type blocks list
+        :param transactions: (Optional) Ids of the transactions
+        :type transactions list
+        :return: Number of blocks and transactions fetched
+        :rtype: int
+        """
+        self._announcements.inc(1, "received")
+
+        blocks = self._wanted("block", blocks, blockchain.has_block)
+        transactions = self._wanted("transaction", transactions, blockchain.is_pending)
+
+        if blocks or transactions:
+            self._executor.submit(self._fetch, blockchain, node, blocks, transactions)
+        return len(blocks) + len(transactions)
+
+    def _wanted(self, kind, keys, held):
+        """Keys of the items neither seen nor held, which are marked as seen"""
+        fresh = self.unseen(kind, keys)
+        self._duplicates.inc(len(keys) - len(fresh), kind)
+        return [key for key in fresh if not held(key)]
+
+    def _fetch(self, blockchain, node, blocks, transactions):
+        # errors of tasks of the executor are otherwise lost
+        try:
+            if blocks:
+                self.fetch_blocks(blockchain, node, blocks)
+            if transactions:
+                self.fetch_transactions(blockchain, node, transactions)
+        except Exception:
+            logger.exception(f"Failed to fetch the inventory of {node}")
+
+    def fetch_blocks(self, blockchain, node, hashes):
+        """
+        Fetches blocks from a node and adds them to the blockchain in chain order. Once a block follows a block we do
+        not know, the chain of the node is synced instead
+        :param blockchain: Blockchain the blocks are added to
+        :type blockchain Blockchain
+        :param node: Address of the node
+        :type node str
+        :param hashes: Hashes of the blocks
+        :type hashes list
+        """
+        documents = self.peers.get_many(
+            node, "/api/block/blocks", [dict(hash=batch) for batch in batches(hashes)]
+        )
+
+        fetched = {}
+        for document in documents:
+            try:
+                for values in document["blocks"]:
+                    block = Block.from_dict(values)
+                    fetched[block.hash] = block
+            except (KeyError, TypeError, EncodingError):
+                logger.info(f"Blocks of {node} are malformed")
+
+        # blocks are keyed by the hash we compute, a node cannot send other blocks than those it announced
+        self.forget("block", [key for key in hashes if key not in fetched])
+        blocks = sorted(
+            (fetched[key] for key in hashes if key in fetched),
+            key=lambda block: block["index"],
+        )
+        self._fetched.inc(len(blocks), "block")
+
+        for block in blocks:
+            if blockchain.receive_block(block, node) is None:
+                blockchain.sync_node(node)
+                return
+
+    def fetch_transactions(self, blockchain, node, ids):
+        """
+        Fetches pending transactions from a node and adds them to the pool of the blockchain
+        :param blockchain: Blockchain the transactions are added to
+        :type blockchain Blockchain
+        :param node: Address of the node
+        :type node str
+        :param ids: Ids of the transactions
+        :type ids list
+        """
+        documents = self.peers.get_many(
+            node, "/api/block/mempool", [dict(id=batch) for batch in batches(ids)]
+        )
+
+        wanted = set(ids)
+        fetched = {}
+        for document in documents:
+            try:
+                for values in document["transactions"]:
+                    transaction = parse_transaction(values)
+                    if transaction is not None and transaction.id in wanted:
+                        fetched[transaction.id] = transaction
+            except (KeyError, TypeError, EncodingError):
+                logger.info(f"Transactions of {node} are malformed")
+
+        self.forget("transaction", [key for key in ids if key not in fetched])
+        self._fetched.inc(len(fetched), "transaction")
+
+        if fetched:
+            blockchain.new_transactions(list(fetched.values()), origin=node)
+
+    def close(self):
+        """Stops the threads once the announcements and fetches under way are done"""
+        self._executor.shutdown()
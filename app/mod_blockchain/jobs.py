@@ -0,0 +1,216 @@
+"""
+Background mining jobs. Mining a block can take a long time, so instead of searching for a proof inside the request
+thread the mine endpoint starts a MiningJob on a background thread and returns straight away. The job keeps track of
+the number of hashes tried, which is used to report the hash rate, and holds the forged block once the search is done.
+Only one job mines at a time, since concurrent searches on the same chain would compete for the same block
+"""
+from collections import OrderedDict
+from threading import Event, Lock, Thread
+from time import time
+from uuid import uuid4
+from app import logger
+
+
+class MiningJob(object):
+    """
+    A single mining job. It is passed to the proof of work search as its progress object
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    CANCELLED = "cancelled"
+    FAILED = "failed"
+
+    def __init__(self):
+        self.id = uuid4().hex
+        self.status = self.PENDING
+        self.hashes = 0
+        self.started = None
+        self.finished = None
+        self.block = None
+        self.error = None
+        self._cancel = Event()
+        self._finished = Event()
+
+    @property
+    def cancelled(self):
+        """Whether the job has been asked to stop"""
+        return self._cancel.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Waits for the job to stop running, either because it is done, cancelled or failed
+        :param timeout: (Optional) Seconds to wait for
+        :type timeout float
+        :return: True if the job stopped running, False if the wait timed out
+        :rtype: bool
+        """
+        return self._finished.wait(timeout)
+
+    def add(self, hashes):
+        """
+        Records hashes tried by the proof of work search
+        :param hashes: Number of candidate proofs hashed
+        :type hashes int
+        """
+        self.hashes += hashes
+
+    def cancel(self):
+        """Asks the proof of work search to stop"""
+        self._cancel.set()
+
+    @property
+    def elapsed(self):
+        """Seconds the job has been running for"""
+        if self.started is None:
+            return 0.0
+        return (self.finished or time()) - self.started
+
+    @property
+    def hash_rate(self):
+        """Hashes tried per second"""
+        elapsed = self.elapsed
+        return self.hashes / elapsed if elapsed else 0.0
+
+    def to_dict(self):
+        """
+        Status of the job as returned by the API
+        :rtype: dict
+        """
+        job = dict(
+            id=self.id,
+            status=self.status,
+            hashes=self.hashes,
+            hash_rate=self.hash_rate,
+            elapsed=self.elapsed,
+        )
+
+        if self.block is not None:
+            job["block"] = self.block.to_dict()
+        if self.error is not None:
+            job["error"] = self.error
+
+        return job
+
+
+class MiningJobs(object):
+    """
+    Starts mining jobs on a blockchain and keeps the most recent ones around so their status can be queried
+    """
+
+    def __init__(self, blockchain, reward_address, max_jobs=100):
+        """
+        :param blockchain: Blockchain to mine blocks on
+        :type blockchain Blockchain
+        :param reward_address: Address rewarded for mining a block
+        :type reward_address str
+        :param max_jobs: Number of jobs kept for status queries
+        :type max_jobs int
+        """
+        self.blockchain = blockchain
+        self.reward_address = reward_address
+        self.max_jobs = max_jobs
+        self.current = None
+        self._jobs = OrderedDict()
+        self._lock = Lock()
+
+    def start(self):
+        """
+        Starts a new mining job on a background thread
+        :return: The new job or None if a job is already running
+        :rtype: MiningJob
+        """
+        with self._lock:
+            if self.current is not None:
+                return None
+
+            job = MiningJob()
+            self.current = job
+            self._jobs[job.id] = job
+
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+
+        Thread(target=self._run, args=(job,), daemon=True).start()
+        return job
+
+    def get(self, job_id):
+        """
+        Gets a job by its id
+        :param job_id: Id of the job
+        :type job_id str
+        :return: Job or None if there is no such job
+        :rtype: MiningJob
+        """
+        return self._jobs.get(job_id)
+
+    def submit(self):
+        """
+        Starts a new mining job unless one is already running. Unlike start and get, submit, status and cancel only
+        take and return plain values, so they also work on mining jobs served to other processes, see shared
+        :return: Id of the job started, or of the job already running, and whether the job was started
+        :rtype: tuple
+        """
+        while True:
+            job = self.start()
+            if job is not None:
+                return job.id, True
+
+            # the running job may finish before it is looked up, in which case a new one is started
+            current = self.current
+            if current is not None:
+                return current.id, False
+
+    def status(self, job_id):
+        """
+        Status of a job, see MiningJob.to_dict
+        :param job_id: Id of the job
+        :type job_id str
+        :return: Status of the job or None if there is no such job
+        :rtype: dict
+        """
+        job = self.get(job_id)
+        return None if job is None else job.to_dict()
+
+    def cancel(self, job_id):
+        """
+        Cancels a job if it is pending or running
+        :param job_id: Id of the job
+        :type job_id str
+        :return: Status the job had when it was asked to stop, or None if there is no such job
+        :rtype: str
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+
+        status = job.status
+        if status in (MiningJob.PENDING, MiningJob.RUNNING):
+            job.cancel()
+        return status
+
+    def _run(self, job):
+        job.started = time()
+        job.status = MiningJob.RUNNING
+        status = MiningJob.FAILED
+
+        try:
+            job.block = self.blockchain.mine(self.reward_address, progress=job)
+
+            if job.block is not None:
+                status = MiningJob.DONE
+            elif job.cancelled:
+                status = MiningJob.CANCELLED
+            else:
+                job.error = "Chain changed while mining"
+        except Exception as e:
+            logger.exception(f"Mining job {job.id} failed")
+            job.error = str(e)
+        finally:
+            job.finished = time()
+            # free the slot before publishing the status, so a client that sees the job finish can start another
+            with self._lock:
+                self.current = None
+            job.status = status
+            job._finished.set()
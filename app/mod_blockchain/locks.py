@@ -0,0 +1,116 @@
+"""
+Readers-writer lock guarding the chain and its indexes. Requests reading the chain, its balances or its transactions
+share the lock, while adding blocks and replacing blocks after a fork point take it alone, so readers never see a block
+added to the chain before it is indexed, or a chain half way through being replaced.
+
+Writers are preferred: once a writer waits, new readers wait behind it, so a steady flow of reads never starves mining
+or consensus. A thread holding the lock may take it again, for reading or writing if it is the writer and for reading
+if it is a reader. A reader cannot take the lock for writing, which would deadlock against the other readers, it raises
+a RuntimeError instead.
+
+The writer can defer work to the moment it releases the lock for the last time, e.g writing a snapshot of the indexes
+taken under the lock, so that work holds up neither readers nor other writers
+"""
+from contextlib import contextmanager
+from threading import Condition, Lock, get_ident, local
+
+
+class ReadWriteLock(object):
+    """
+    Reentrant, writer preferring readers-writer lock
+    """
+
+    def __init__(self):
+        self._condition = Condition(Lock())
+        # number of read acquisitions held, across all threads
+        self._readers = 0
+        # thread holding the lock for writing and how many times it took it
+        self._writer = None
+        self._writes = 0
+        self._waiting_writers = 0
+        # callbacks of the writer run once it releases the lock
+        self._deferred = []
+        # read acquisitions held by the current thread
+        self._local = local()
+
+    @property
+    def _reads(self):
+        return getattr(self._local, "reads", 0)
+
+    def acquire_read(self):
+        with self._condition:
+            # a thread already holding the lock goes ahead of waiting writers, which wait for it anyway
+            if self._writer != get_ident() and not self._reads:
+                while self._writer is not None or self._waiting_writers:
+                    self._condition.wait()
+            self._readers += 1
+        self._local.reads = self._reads + 1
+
+    def release_read(self):
+        self._local.reads = self._reads - 1
+        with self._condition:
+            self._readers -= 1
+            if not self._readers:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        with self._condition:
+            if self._writer == get_ident():
+                self._writes += 1
+                return
+
+            if self._reads:
+                raise RuntimeError("A reader cannot take the lock for writing")
+
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._condition.wait()
+            finally:
+                self._waiting_writers -= 1
+
+            self._writer = get_ident()
+            self._writes = 1
+
+    def release_write(self):
+        deferred = []
+        with self._condition:
+            self._writes -= 1
+            if not self._writes:
+                self._writer = None
+                deferred, self._deferred = self._deferred, []
+                self._condition.notify_all()
+
+        for callback in deferred:
+            callback()
+
+    def defer(self, callback):
+        """
+        Runs a callback in the thread of the writer once it has released the lock, outside of it
+        :param callback: Function called without arguments
+        :type callback callable
+        :raises RuntimeError if the current thread does not hold the lock for writing
+        """
+        if self._writer != get_ident():
+            raise RuntimeError(
+                "Only the writer can defer work to the release of the lock"
+            )
+        self._deferred.append(callback)
+
+    @contextmanager
+    def read(self):
+        """Holds the lock for reading, shared with other readers"""
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        """Holds the lock for writing, alone"""
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
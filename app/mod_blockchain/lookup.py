@@ -0,0 +1,205 @@
+"""
+Secondary indexes of the transactions of a chain, mapping a transaction id to the blocks holding it and an address to
+its postings, the transactions it sends or receives in chain order. Like balances they are updated block by block as
+blocks are added to or dropped from the tip of the chain, so a lookup never walks the chain.
+
+A location is a pair of block index and position of the transaction in the block. Identical transactions, e.g mining
+rewards of the same amount to the same miner, share an id, which is why an id maps to a tuple of locations.
+
+The index is the largest state of a node, so snapshots of it are taken from a view, shallow copies of its dicts taken
+under the lock of the chain, and written once the lock is released. Locations are tuples and the postings of an address
+are only appended to as blocks are added, so the view only needs trimming to the blocks it was taken at, unless blocks
+were rolled back meanwhile, which makes the view unusable. An index loaded from a snapshot is only unpickled the first
+time it is read, the blocks indexed before that are indexed on top of it then
+"""
+import pickle
+from bisect import bisect_right
+from math import inf
+from threading import Lock
+
+
+class LookupIndex(object):
+    """
+    Transaction id and address indexes of a chain
+    """
+
+    def __init__(self, chain=()):
+        """
+        :param chain: (Optional) Chain whose transactions are indexed
+        :type chain list
+        """
+        # transaction id -> locations of the transaction
+        self._locations = {}
+        # address -> locations of the transactions sent or received by it, in chain order
+        self._postings = {}
+        # number of times blocks were rolled back, see view
+        self._generation = 0
+        # pickled state of an index loaded from a snapshot, and blocks indexed or rolled back before it is unpickled
+        self._pickled = None
+        self._deferred = []
+        self._lock = Lock()
+
+        for block in chain:
+            self.apply(block)
+
+    @classmethod
+    def load(cls, pickled):
+        """
+        Creates the index from the state of an index, unpickled the first time the index is read
+        :param pickled: Pickled state of an index, see state
+        :type pickled bytes
+        :rtype: LookupIndex
+        """
+        index = cls()
+        index._pickled = pickled
+        return index
+
+    def _ready(self):
+        """Unpickles the state the index was loaded from, if it has not been yet"""
+        if self._pickled is None:
+            return
+
+        with self._lock:
+            if self._pickled is not None:
+                self._locations, self._postings = pickle.loads(self._pickled)
+                for update, block in self._deferred:
+                    update(block)
+                self._deferred = []
+                self._pickled = None
+
+    def _defer(self, update, block):
+        """Defers an update of an index that has not been unpickled yet, returns whether it was deferred"""
+        if self._pickled is None:
+            return False
+
+        with self._lock:
+            if self._pickled is not None:
+                self._deferred.append((update, block))
+                return True
+        return False
+
+    def view(self):
+        """
+        View of the index for a snapshot, taken by the caller holding the lock of the chain. Only the dicts are copied,
+        not the postings of every address
+        :return: View of the index, see state
+        :rtype: tuple
+        """
+        self._ready()
+        return self._generation, dict(self._locations), dict(self._postings)
+
+    def state(self, view, length):
+        """
+        State of the index as it was when a view was taken, which can be done without the lock of the chain
+        :param view: View of the index
+        :type view tuple
+        :param length: Length of the chain when the view was taken
+        :type length int
+        :return: Locations and postings the index held, or None if blocks were rolled back since the view was taken
+        :rtype: tuple
+        """
+        generation, locations, postings = view
+
+        trimmed = {}
+        for address, locations_of in postings.items():
+            # blocks added since then are the last postings of their addresses, locations are (index, position) pairs
+            end = bisect_right(locations_of, (length, inf))
+            if end:
+                trimmed[address] = locations_of[:end]
+
+        if generation != self._generation:
+            return None
+        return locations, trimmed
+
+    def locate(self, transaction_id):
+        """
+        Locations of a transaction
+        :param transaction_id: Id of the transaction
+        :type transaction_id str
+        :return: Block index and position in the block of every block holding the transaction, in chain order
+        :rtype: tuple
+        """
+        self._ready()
+        return self._locations.get(transaction_id, ())
+
+    def postings(self, address, start=0, limit=None):
+        """
+        Locations of the transactions sent or received by an address
+        :param address: Address
+        :type address str
+        :param start: (Optional) Number of postings to skip
+        :type start int
+        :param limit: (Optional) Most postings returned, all of them by default
+        :type limit int
+        :return: Block index and position in the block of the transactions, in chain order
+        :rtype: list
+        """
+        self._ready()
+        postings = self._postings.get(address, [])
+        return postings[start : None if limit is None else start + limit]
+
+    def count(self, address):
+        """
+        Number of transactions sent or received by an address
+        :param address: Address
+        :type address str
+        :rtype: int
+        """
+        self._ready()
+        return len(self._postings.get(address, ()))
+
+    def _addresses(self, transaction):
+        if transaction.sender == transaction.recipient:
+            return (transaction.sender,)
+        return transaction.sender, transaction.recipient
+
+    def apply(self, block):
+        """
+        Indexes the transactions of a block added to the chain
+        :param block: Block added
+        :type block Block
+        """
+        if not self._defer(self._apply, block):
+            self._apply(block)
+
+    def _apply(self, block):
+        for position, transaction in enumerate(block.transactions):
+            location = (block.index, position)
+            self._locations[transaction.id] = self._locations.get(
+                transaction.id, ()
+            ) + (location,)
+            for address in self._addresses(transaction):
+                self._postings.setdefault(address, []).append(location)
+
+    def revert(self, block):
+        """
+        Drops the transactions of a block dropped from the tip of the chain, their postings are the last ones of their
+        addresses
+        :param block: Block dropped
+        :type block Block
+        """
+        self._generation += 1
+        if not self._defer(self._revert, block):
+            self._revert(block)
+
+    def _revert(self, block):
+        for position in reversed(range(len(block.transactions))):
+            transaction = block.transactions[position]
+            location = (block.index, position)
+
+            locations = tuple(
+                found
+                for found in self._locations.get(transaction.id, ())
+                if found != location
+            )
+            if locations:
+                self._locations[transaction.id] = locations
+            else:
+                self._locations.pop(transaction.id, None)
+
+            for address in self._addresses(transaction):
+                postings = self._postings.get(address)
+                if postings and postings[-1] == location:
+                    postings.pop()
+                    if not postings:
+                        del self._postings[address]
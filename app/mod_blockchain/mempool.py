@@ -0,0 +1,262 @@
+"""
+Pool of pending transactions waiting to be mined. Transactions are deduplicated by id and ordered by fee, highest first
+and in order of arrival for equal fees, so blocks are filled with the transactions paying the most. The pool holds at
+most max_size transactions, once it is full a new transaction evicts the pending transaction with the lowest fee if it
+pays more, and is turned away otherwise.
+
+The order is kept in two heaps, one popping the next transaction to mine and one popping the next to evict. Entries
+are not removed from a heap when their transaction leaves the pool through the other one, they are skipped when they
+come up and the heaps are rebuilt once stale entries outnumber live ones.
+
+The pool also keeps how much each sender spends in its pending transactions, so a transaction can be checked against
+the funds of its sender without going through the pending transactions.
+
+A transaction turned away from the pool is turned away for one of the reasons below, which TransactionRejected carries
+back to whoever posted it
+"""
+import heapq
+from collections import defaultdict
+from itertools import count
+from threading import Lock
+from .models import Transaction
+
+# reasons transactions are turned away for
+UNSIGNED = "unsigned"
+PENDING = "pending"
+MINED = "mined"
+OVERDRAFT = "overdraft"
+FULL = "full"
+
+
+class TransactionRejected(ValueError):
+    """
+    Raised when a transaction is turned away, its reason is one of UNSIGNED, PENDING, MINED, OVERDRAFT or FULL
+    """
+
+    def __init__(self, reason):
+        """
+        :param reason: Reason the transaction was turned away for
+        :type reason str
+        """
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Mempool(object):
+    """
+    Bounded, deduplicated pool of pending transactions ordered by fee
+    """
+
+    def __init__(self, max_size=10000):
+        """
+        :param max_size: Most transactions held in the pool
+        :type max_size int
+        """
+        self.max_size = max_size
+        # transaction id -> (transaction, arrival sequence number)
+        self._pending = {}
+        # (-fee, sequence, id), the transaction to mine next on top
+        self._by_priority = []
+        # (fee, -sequence, id), the transaction to evict next on top
+        self._by_eviction = []
+        # sender -> amount and fees of its pending transactions
+        self._spending = defaultdict(int)
+        self._sequence = count()
+        self._lock = Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Creates the pool from the application configuration
+        :param config: Application configuration
+        :type config dict
+        :return: Transaction pool
+        :rtype: Mempool
+        """
+        return cls(max_size=config.get("MEMPOOL_MAX_SIZE", 10000))
+
+    def __len__(self):
+        return len(self._pending)
+
+    def __contains__(self, transaction_id):
+        return transaction_id in self._pending
+
+    def get(self, transaction_id):
+        """
+        Pending transaction with the given id
+        :param transaction_id: Id of the transaction
+        :type transaction_id str
+        :return: Transaction or None if it is not pending
+        :rtype: Transaction
+        """
+        pending = self._pending.get(transaction_id)
+        return None if pending is None else pending[0]
+
+    def spending(self, sender):
+        """
+        Amount and fees a sender spends in its pending transactions
+        :param sender: Address of the sender
+        :type sender str
+        :rtype: int
+        """
+        return self._spending.get(sender, 0)
+
+    def __iter__(self):
+        """Pending transactions in the order they will be mined"""
+        with self._lock:
+            entries = sorted(
+                (-transaction.fee, sequence, transaction)
+                for transaction, sequence in self._pending.values()
+            )
+        return iter([transaction for _, _, transaction in entries])
+
+    def _live(self, entry, sequence):
+        pending = self._pending.get(entry[2])
+        return pending is not None and pending[1] == sequence
+
+    def _top(self, heap, sequence_of):
+        """Drops the stale entries on top of the heap and returns the live entry left on top, None if empty"""
+        while heap and not self._live(heap[0], sequence_of(heap[0])):
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def _top_priority(self):
+        return self._top(self._by_priority, lambda entry: entry[1])
+
+    def _top_eviction(self):
+        return self._top(self._by_eviction, lambda entry: -entry[1])
+
+    def _compact(self):
+        if (
+            len(self._by_priority) + len(self._by_eviction)
+            <= 4 * len(self._pending) + 64
+        ):
+            return
+
+        self._by_priority = [
+            (-transaction.fee, sequence, transaction.id)
+            for transaction, sequence in self._pending.values()
+        ]
+        self._by_eviction = [
+            (transaction.fee, -sequence, transaction.id)
+            for transaction, sequence in self._pending.values()
+        ]
+        heapq.heapify(self._by_priority)
+        heapq.heapify(self._by_eviction)
+
+    def _discard(self, transaction_id):
+        """Removes a transaction from the pool, returns it or None if it was not pending"""
+        pending = self._pending.pop(transaction_id, None)
+        if pending is None:
+            return None
+
+        transaction = pending[0]
+        self._spending[transaction.sender] -= transaction.amount + transaction.fee
+        if not self._spending[transaction.sender]:
+            del self._spending[transaction.sender]
+        return transaction
+
+    def _add(self, transaction, funds):
+        """Adds a transaction to the pool, returns None if it was added or the reason it was turned away for"""
+        transaction = Transaction.from_dict(transaction)
+
+        if transaction.id in self._pending:
+            return PENDING
+
+        if funds is not None:
+            cost = transaction.amount + transaction.fee
+            if funds(transaction.sender) - self.spending(transaction.sender) < cost:
+                return OVERDRAFT
+
+        if len(self._pending) >= self.max_size:
+            lowest = self._top_eviction()
+            if lowest is None or transaction.fee <= lowest[0]:
+                return FULL
+            self._discard(lowest[2])
+
+        sequence = next(self._sequence)
+        self._pending[transaction.id] = (transaction, sequence)
+        self._spending[transaction.sender] += transaction.amount + transaction.fee
+        heapq.heappush(self._by_priority, (-transaction.fee, sequence, transaction.id))
+        heapq.heappush(self._by_eviction, (transaction.fee, -sequence, transaction.id))
+        return None
+
+    def add(self, transaction, funds=None):
+        """
+        Adds a transaction to the pool
+        :param transaction: Transaction to add
+        :type transaction Transaction
+        :param funds: (Optional) Gives the funds of a sender, transactions spending more than their sender has left
+        after its pending transactions are turned away
+        :type funds callable
+        :return: True if the transaction was added, False if it is already pending, overdraws its sender or the pool is
+        full of transactions paying at least as much
+        :rtype: bool
+        """
+        try:
+            self.offer(transaction, funds)
+        except TransactionRejected:
+            return False
+        return True
+
+    def offer(self, transaction, funds=None):
+        """
+        Adds a transaction to the pool, see add
+        :param transaction: Transaction to add
+        :type transaction Transaction
+        :param funds: (Optional) Gives the funds of a sender, see add
+        :type funds callable
+        :raises TransactionRejected with reason PENDING, OVERDRAFT or FULL if the transaction is turned away
+        """
+        with self._lock:
+            reason = self._add(transaction, funds)
+            self._compact()
+
+        if reason is not None:
+            raise TransactionRejected(reason)
+
+    def add_many(self, transactions, funds=None):
+        """
+        Adds a batch of transactions to the pool, taking the lock once for the whole batch
+        :param transactions: Transactions to add
+        :type transactions list
+        :param funds: (Optional) Gives the funds of a sender, see add
+        :type funds callable
+        :return: Number of transactions added
+        :rtype: int
+        """
+        with self._lock:
+            added = sum(
+                self._add(transaction, funds) is None for transaction in transactions
+            )
+            self._compact()
+            return added
+
+    def take(self, limit):
+        """
+        Removes the transactions paying the highest fees from the pool
+        :param limit: Most transactions to take
+        :type limit int
+        :return: Transactions in the order they were taken
+        :rtype: list
+        """
+        transactions = []
+
+        with self._lock:
+            while len(transactions) < limit and self._top_priority() is not None:
+                _, _, transaction_id = heapq.heappop(self._by_priority)
+                transactions.append(self._discard(transaction_id))
+            self._compact()
+
+        return transactions
+
+    def remove(self, transactions):
+        """
+        Removes transactions from the pool, e.g because they were mined in a block received from a peer
+        :param transactions: Transactions to remove, whether they are pending or not
+        :type transactions iterable
+        """
+        with self._lock:
+            for transaction in transactions:
+                self._discard(Transaction.from_dict(transaction).id)
+            self._compact()
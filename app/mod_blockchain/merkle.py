@@ -0,0 +1,121 @@
+"""
+Merkle trees of the transactions of a block. The leaves are the ids of the transactions in the order they appear in the
+block, each level hashes pairs of nodes of the level below until a single root is left. The root commits to every
+transaction of the block, so the block header only needs to hold the root and a transaction is proven to be in a block
+with the log2(n) sibling hashes on its path to the root. Trees are built from the raw digests the ids are the hex
+encoding of.
+
+Leaves and inner nodes are hashed with different prefixes, so a leaf can never pass for an inner node. A node left
+without a sibling at the end of a level is carried up to the next level as it is instead of being paired with itself,
+which would let two different lists of transactions share a root
+"""
+import hashlib
+
+LEAF = b"\x00"
+NODE = b"\x01"
+
+# root of a block without transactions
+EMPTY_ROOT = hashlib.sha256(b"").hexdigest()
+
+
+def hash_leaf(digest):
+    return hashlib.sha256(LEAF + digest).digest()
+
+
+def hash_node(left, right):
+    return hashlib.sha256(NODE + left + right).digest()
+
+
+def tree_levels(digests):
+    """
+    Builds the levels of the tree of the given transactions
+    :param digests: Raw digests of the transactions, the ids as bytes, the leaves of the tree
+    :type digests list
+    :return: Levels of the tree from the leaves up to the root
+    :rtype: list
+    """
+    level = [hash_leaf(digest) for digest in digests]
+    levels = [level]
+
+    while len(level) > 1:
+        level = [
+            hash_node(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+            for i in range(0, len(level), 2)
+        ]
+        levels.append(level)
+
+    return levels
+
+
+def merkle_root(transaction_ids):
+    """
+    Root of the tree of the given transactions
+    :param transaction_ids: Ids of the transactions in block order
+    :type transaction_ids list
+    :return: Hex encoded root
+    :rtype: str
+    """
+    return digest_root(
+        [bytes.fromhex(transaction_id) for transaction_id in transaction_ids]
+    )
+
+
+def digest_root(digests):
+    """
+    Root of the tree of the given transactions, given by their raw digests so their hex ids need not be built
+    :param digests: Raw digests of the transactions in block order
+    :type digests list
+    :return: Hex encoded root
+    :rtype: str
+    """
+    if not digests:
+        return EMPTY_ROOT
+    return tree_levels(digests)[-1][0].hex()
+
+
+def merkle_proof(transaction_ids, position):
+    """
+    Inclusion proof of a transaction, the sibling hashes on the path from its leaf to the root
+    :param transaction_ids: Ids of the transactions in block order
+    :type transaction_ids list
+    :param position: Position of the transaction in the block
+    :type position int
+    :return: Sibling hashes from the leaf up, each with the side it is hashed on
+    :rtype: list
+    """
+    proof = []
+
+    digests = [bytes.fromhex(transaction_id) for transaction_id in transaction_ids]
+    for level in tree_levels(digests)[:-1]:
+        sibling = position ^ 1
+        if sibling < len(level):
+            side = "left" if sibling < position else "right"
+            proof.append(dict(hash=level[sibling].hex(), side=side))
+        position //= 2
+
+    return proof
+
+
+def verify_proof(transaction_id, proof, root):
+    """
+    Checks an inclusion proof of a transaction against a Merkle root
+    :param transaction_id: Id of the transaction
+    :type transaction_id str
+    :param proof: Proof given by merkle_proof
+    :type proof list
+    :param root: Hex encoded Merkle root of the block
+    :type root str
+    :return: True if the proof leads from the transaction to the root, False otherwise
+    :rtype: bool
+    """
+    node = hash_leaf(bytes.fromhex(transaction_id))
+
+    for step in proof:
+        sibling = bytes.fromhex(step["hash"])
+        node = (
+            hash_node(sibling, node)
+            if step["side"] == "left"
+            else hash_node(node, sibling)
+        )
+
+    return node.hex() == root
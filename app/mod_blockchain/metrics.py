@@ -0,0 +1,270 @@
+"""
+Instrumentation of the node, exposed at /metrics in the Prometheus text exposition format. Counters and histograms are
+updated by the hot paths of the blockchain, its peer client and the views, while gauges such as the length of the chain
+are only read when metrics are scraped.
+
+A registry created with metrics disabled hands out null instruments whose methods do nothing, so instrumented code
+never checks whether metrics are enabled and pays a single empty method call when they are not
+"""
+from bisect import bisect_left
+from threading import Lock
+
+# upper bounds of the buckets of a histogram, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def format_value(value):
+    """
+    Formats a sample value as the exposition format expects it
+    :type value float
+    :rtype: str
+    """
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def escape(value):
+    """
+    Escapes a label value
+    :rtype: str
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values):
+    """
+    Formats the labels of a sample, e.g {peer="127.0.0.1:5000"}
+    :param names: Names of the labels
+    :type names tuple
+    :param values: Values of the labels
+    :type values tuple
+    :rtype: str
+    """
+    if not names:
+        return ""
+    pairs = (f'{name}="{escape(value)}"' for name, value in zip(names, values))
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metric(object):
+    """
+    Metric with a value for each combination of its label values
+    """
+
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        """
+        :param name: Name of the metric e.g blockchain_hashes_total
+        :type name str
+        :param documentation: Help text of the metric
+        :type documentation str
+        :param labels: (Optional) Names of the labels of the metric
+        :type labels tuple
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = Lock()
+
+    def samples(self):
+        """
+        Samples of the metric
+        :return: Generator of suffix of the sample name, label names, label values and value
+        :rtype: generator
+        """
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in sorted(values):
+            yield "", self.labels, label_values, value
+
+    def render(self):
+        """
+        Renders the metric in the text exposition format
+        :rtype: str
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for suffix, names, values, value in self.samples():
+            lines.append(
+                f"{self.name}{suffix}{format_labels(names, values)} {format_value(value)}"
+            )
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    """
+    Value that only goes up, e.g the number of hashes tried
+    """
+
+    type = "counter"
+
+    def inc(self, amount=1, *labels):
+        """
+        Increases the counter
+        :param amount: (Optional) Amount to increase the counter by
+        :type amount float
+        :param labels: Values of the labels of the metric
+        """
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    Value that goes up and down, e.g the length of the chain. A gauge given a function reads its value from it when
+    metrics are scraped
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, labels=(), function=None):
+        """
+        :param function: (Optional) Returns the value of the gauge when scraped
+        :type function callable
+        """
+        super(Gauge, self).__init__(name, documentation, labels)
+        self.function = function
+
+    def set(self, value, *labels):
+        """
+        Sets the value of the gauge
+        :type value float
+        :param labels: Values of the labels of the metric
+        """
+        with self._lock:
+            self._values[labels] = value
+
+    def samples(self):
+        if self.function is not None:
+            yield "", (), (), self.function()
+            return
+        yield from super(Gauge, self).samples()
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values in buckets, e.g the seconds a consensus round takes
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        """
+        :param buckets: (Optional) Upper bounds of the buckets, in increasing order
+        :type buckets tuple
+        """
+        super(Histogram, self).__init__(name, documentation, labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value, *labels):
+        """
+        Records an observed value
+        :type value float
+        :param labels: Values of the labels of the metric
+        """
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # a count per bucket, then the sum of the values
+                counts = self._values[labels] = [0] * len(self.buckets) + [0]
+            counts[bucket] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = [(labels, list(counts)) for labels, counts in self._values.items()]
+
+        names = self.labels + ("le",)
+        for label_values, counts in sorted(values):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield "_bucket", names, label_values + (
+                    format_value(bound),
+                ), cumulative
+            yield "_sum", self.labels, label_values, counts[-1]
+            yield "_count", self.labels, label_values, cumulative
+
+
+class NullMetric(object):
+    """
+    Instrument of disabled metrics, recording nothing
+    """
+
+    def inc(self, amount=1, *labels):
+        pass
+
+    def set(self, value, *labels):
+        pass
+
+    def observe(self, value, *labels):
+        pass
+
+
+NULL_METRIC = NullMetric()
+
+
+class Metrics(object):
+    """
+    Registry of the metrics of a node
+    """
+
+    def __init__(self, enabled=True):
+        """
+        :param enabled: (Optional) Whether metrics are recorded, instruments do nothing if not
+        :type enabled bool
+        """
+        self.enabled = enabled
+        self._metrics = {}
+        self._lock = Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Creates the registry from the application configuration
+        :param config: Application configuration
+        :type config dict
+        :rtype: Metrics
+        """
+        return cls(enabled=config.get("METRICS_ENABLED", True))
+
+    def register(self, metric):
+        """
+        Registers a metric, or gets the metric already registered under its name so that components sharing the
+        registry share their instruments
+        :param metric: Metric to register
+        :type metric Metric
+        :return: Registered metric, or a null instrument if metrics are disabled
+        :rtype: Metric
+        """
+        if not self.enabled:
+            return NULL_METRIC
+
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=(), function=None):
+        return self.register(Gauge(name, documentation, labels, function))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self):
+        """
+        Renders all the metrics in the text exposition format
+        :rtype: str
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        return "".join(metric.render() for metric in metrics)
@@ -0,0 +1,465 @@
+"""
+Block and transaction models. Both use __slots__ instead of a dict per object, which saves the dict and the repeated
+key strings on every block and transaction held in memory. They convert to and from the JSON shape blocks and
+transactions have always had with to_dict and from_dict, and support item access, so block["index"] keeps working.
+
+A block is immutable once it has been forged, which means its canonical encoding and hash never change. Both are
+computed the first time they are needed and stored on the block, so hashing a block over and over, when mining, forging
+or validating a chain, only costs a lookup. The hash is only recomputed when verify asks for it. The canonical encoding
+is the binary encoding of the encoding module, JSON is only the shape models have in the API.
+
+The hash of a block is the hash of its header, every field but the transactions, which the header commits to with the
+Merkle root of the transactions. Hashing a block costs the same however many transactions it holds, and a transaction
+is proven to be in a block with the header and a Merkle proof instead of the whole block
+"""
+import hashlib
+from math import isfinite
+from string import hexdigits
+from . import encoding
+from .merkle import digest_root, merkle_proof
+
+
+def canonical_encoding(model):
+    """
+    Canonical encoding of a block, header or transaction, used for hashing, for storing blocks and for sending them to
+    peers
+    :param model: Block, header or transaction to encode
+    :type model Model
+    :return: Encoded model
+    :rtype: bytes
+    """
+    return model.encode()
+
+
+class Model(object):
+    """
+    Base of the slotted models. Fields are set once when the model is created, any later attempt to set them raises an
+    AttributeError
+    """
+
+    __slots__ = ()
+    fields = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    __delattr__ = __setattr__
+
+    def _set(self, name, value):
+        object.__setattr__(self, name, value)
+
+    def __getitem__(self, name):
+        if name not in self.fields:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def get(self, name, default=None):
+        return getattr(self, name) if name in self.fields else default
+
+    def __reduce__(self):
+        return type(self), tuple(getattr(self, name) for name in self.fields)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()})"
+
+    def encode(self):
+        """
+        Binary encoding of the model, see canonical_encoding
+        :rtype: bytes
+        """
+        raise NotImplementedError
+
+    def to_dict(self):
+        """
+        Converts the model to its JSON shape
+        :rtype: dict
+        """
+        return {name: getattr(self, name) for name in self.fields}
+
+    @classmethod
+    def from_dict(cls, values):
+        """
+        Creates the model from its JSON shape
+        :param values: Fields of the model
+        :type values dict
+        """
+        if isinstance(values, cls):
+            return values
+        return cls(**{name: values[name] for name in cls.fields})
+
+
+class Transaction(Model):
+    """
+    Transfer of an amount from a sender to a recipient, paying a fee to the miner of the block holding it, signed by the
+    sender, see signatures. A signed transaction is only accepted once, its nonce tells apart transactions a sender
+    signs for the same amount to the same recipient. A transaction without a fee, a signature or a nonce has the same
+    JSON shape as before fees and signatures existed
+    """
+
+    __slots__ = ("sender", "recipient", "amount", "fee", "signature", "nonce", "_id")
+    fields = __slots__[:-1]
+
+    def __init__(self, sender, recipient, amount, fee=0, signature=None, nonce=None):
+        self._set("sender", sender)
+        self._set("recipient", recipient)
+        self._set("amount", amount)
+        self._set("fee", fee)
+        self._set("signature", signature)
+        self._set("nonce", nonce)
+        self._set("_id", None)
+
+    @classmethod
+    def from_dict(cls, values):
+        if isinstance(values, cls):
+            return values
+        return cls(
+            values["sender"],
+            values["recipient"],
+            values["amount"],
+            values.get("fee", 0),
+            values.get("signature"),
+            values.get("nonce"),
+        )
+
+    def to_dict(self):
+        transaction = Model.to_dict(self)
+        if not self.fee:
+            del transaction["fee"]
+        if self.signature is None:
+            del transaction["signature"]
+        if self.nonce is None:
+            del transaction["nonce"]
+        return transaction
+
+    def encode(self):
+        return encoding.encode_transaction(
+            self.sender,
+            self.recipient,
+            self.amount,
+            self.fee,
+            self.signature,
+            self.nonce,
+        )
+
+    def message(self):
+        """
+        Message the sender signs, the canonical encoding of the transaction without its signature, nonce included
+        :rtype: bytes
+        """
+        return encoding.encode_transaction(
+            self.sender, self.recipient, self.amount, self.fee, nonce=self.nonce
+        )
+
+    @property
+    def id(self):
+        """
+        SHA-256 hash of the canonical encoding of the transaction, signature included so the Merkle root of a block
+        commits to the signatures of its transactions. Identical transactions share it
+        """
+        if self._id is None:
+            self._set("_id", self.digest().hex())
+        return self._id
+
+    def digest(self):
+        """
+        Raw SHA-256 digest the id is the hex encoding of. Unlike the id it is not stored on the transaction, so
+        computing the Merkle root of a block does not leave an id on each of its transactions
+        :rtype: bytes
+        """
+        if self._id is not None:
+            return bytes.fromhex(self._id)
+        return hashlib.sha256(self.encode()).digest()
+
+    def __eq__(self, other):
+        if not isinstance(other, Transaction):
+            return NotImplemented
+        return self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+def is_number(value):
+    """
+    Whether a posted value is a number a balance can be computed with, NaN and infinities compare false with every
+    amount and would never be caught by a balance check
+    :param value: Posted value
+    :rtype: bool
+    """
+    if isinstance(value, bool):
+        return False
+    return isinstance(value, int) or isinstance(value, float) and isfinite(value)
+
+
+def parse_transaction(values):
+    """
+    Creates a transaction from the values posted for it
+    :param values: Posted values, sender, recipient, amount and optionally fee, signature and nonce
+    :type values dict
+    :return: Transaction or None if values are missing, the sender, recipient, amount, fee, signature or nonce is
+    invalid, or the transaction cannot be encoded
+    :rtype: Transaction
+    """
+    if not isinstance(values, dict):
+        return None
+
+    sender, recipient, amount, fee, signature, nonce = (
+        values.get("sender"),
+        values.get("recipient"),
+        values.get("amount"),
+        values.get("fee", 0),
+        values.get("signature"),
+        values.get("nonce"),
+    )
+
+    if not isinstance(sender, str) or not isinstance(recipient, str) or amount is None:
+        return None
+
+    if not is_number(amount) or amount <= 0 or not is_number(fee) or fee < 0:
+        return None
+
+    if signature is not None and not (
+        isinstance(signature, str)
+        and len(signature) == 2 * encoding.SIGNATURE_SIZE
+        and all(digit in hexdigits for digit in signature)
+    ):
+        return None
+
+    if nonce is not None and (
+        isinstance(nonce, bool) or not isinstance(nonce, int) or not 0 <= nonce < 2 ** 64
+    ):
+        return None
+
+    transaction = Transaction(sender, recipient, amount, fee, signature, nonce)
+    try:
+        # the id hashes the canonical encoding, which holds neither addresses too long nor amounts too large
+        transaction.id
+    except encoding.EncodingError:
+        return None
+    return transaction
+
+
+class Header(Model):
+    """
+    Header of a block, every field of the block but its transactions, which it commits to with their Merkle root. A
+    header is all that is needed to check the link of a block to the block before it, its difficulty and its proof, and
+    it has the same hash as its block
+    """
+
+    __slots__ = (
+        "index",
+        "timestamp",
+        "proof",
+        "difficulty",
+        "previous_hash",
+        "merkle_root",
+        "_hash",
+    )
+    fields = __slots__[:-1]
+
+    def __init__(self, index, timestamp, proof, difficulty, previous_hash, merkle_root):
+        self._set("index", index)
+        self._set("timestamp", timestamp)
+        self._set("proof", proof)
+        self._set("difficulty", difficulty)
+        self._set("previous_hash", previous_hash)
+        self._set("merkle_root", merkle_root)
+        self._set("_hash", None)
+
+    @classmethod
+    def decode(cls, encoded):
+        """
+        Creates a header from its canonical encoding
+        :param encoded: Canonical encoding of the header
+        :type encoded bytes
+        :return: Header
+        :rtype: Header
+        """
+        fields, offset = encoding.decode_header(encoded)
+        if offset != len(encoded):
+            raise encoding.EncodingError("Header is followed by trailing bytes")
+        return cls(*fields)
+
+    def encode(self):
+        return encoding.encode_header(*(getattr(self, name) for name in self.fields))
+
+    @property
+    def hash(self):
+        """SHA-256 hash of the canonical encoding of the header"""
+        if self._hash is None:
+            self._set("_hash", hashlib.sha256(canonical_encoding(self)).hexdigest())
+        return self._hash
+
+    def __eq__(self, other):
+        if not isinstance(other, Header):
+            return NotImplemented
+        return self.hash == other.hash
+
+    def __hash__(self):
+        return hash(self.hash)
+
+
+class Block(Model):
+    """
+    Immutable block holding a tuple of transactions
+    """
+
+    __slots__ = (
+        "index",
+        "timestamp",
+        "transactions",
+        "proof",
+        "difficulty",
+        "previous_hash",
+        "merkle_root",
+        "_encoded",
+        "_hash",
+    )
+    fields = __slots__[:-2]
+
+    def __init__(
+        self,
+        index,
+        timestamp,
+        transactions,
+        proof,
+        difficulty,
+        previous_hash,
+        merkle_root=None,
+    ):
+        """
+        :param merkle_root: (Optional) Merkle root of the transactions, computed from them if not given. A root given
+        with the transactions is not checked against them here, see verify
+        :type merkle_root str
+        """
+        transactions = tuple(
+            Transaction.from_dict(transaction) for transaction in transactions
+        )
+        self._set("index", index)
+        self._set("timestamp", timestamp)
+        self._set("transactions", transactions)
+        self._set(
+            "merkle_root",
+            merkle_root or self.compute_merkle_root(transactions),
+        )
+        self._set("proof", proof)
+        self._set("difficulty", difficulty)
+        self._set("previous_hash", previous_hash)
+        self._set("_encoded", None)
+        self._set("_hash", None)
+
+    @staticmethod
+    def compute_merkle_root(transactions):
+        """
+        Merkle root of transactions
+        :param transactions: Transactions in block order
+        :type transactions tuple
+        :return: Hex encoded root
+        :rtype: str
+        """
+        return digest_root([transaction.digest() for transaction in transactions])
+
+    def merkle_proof(self, position):
+        """
+        Inclusion proof of a transaction of the block, see merkle.merkle_proof
+        :param position: Position of the transaction in the block
+        :type position int
+        :return: Sibling hashes from the leaf of the transaction up to the Merkle root
+        :rtype: list
+        """
+        return merkle_proof(
+            [transaction.id for transaction in self.transactions], position
+        )
+
+    @classmethod
+    def from_dict(cls, values):
+        if isinstance(values, cls):
+            return values
+        return cls(
+            **{name: values[name] for name in cls.fields if name != "merkle_root"},
+            merkle_root=values.get("merkle_root"),
+        )
+
+    @classmethod
+    def decode(cls, encoded):
+        """
+        Creates a block from its canonical encoding, which is kept so it is not encoded again
+        :param encoded: Canonical encoding of the block
+        :type encoded bytes
+        :return: Block
+        :rtype: Block
+        """
+        header, transactions = encoding.decode_block(encoded)
+        index, timestamp, proof, difficulty, previous_hash, root = header
+        block = cls(
+            index,
+            timestamp,
+            [Transaction(*transaction) for transaction in transactions],
+            proof,
+            difficulty,
+            previous_hash,
+            merkle_root=root,
+        )
+        block._set("_encoded", bytes(encoded))
+        return block
+
+    def to_dict(self):
+        block = Model.to_dict(self)
+        block["transactions"] = [
+            transaction.to_dict() for transaction in self.transactions
+        ]
+        return block
+
+    def encode(self):
+        return encoding.encode_block(
+            self.header().encode(),
+            [transaction.encode() for transaction in self.transactions],
+        )
+
+    @property
+    def encoded(self):
+        """Canonical encoding of the block"""
+        if self._encoded is None:
+            self._set("_encoded", canonical_encoding(self))
+        return self._encoded
+
+    def header(self):
+        """
+        Header of the block, the fields its hash is computed from
+        :rtype: Header
+        """
+        return Header(**{name: getattr(self, name) for name in Header.fields})
+
+    def _hash_header(self):
+        return hashlib.sha256(canonical_encoding(self.header())).hexdigest()
+
+    @property
+    def hash(self):
+        """SHA-256 hash of the canonical encoding of the header of the block"""
+        if self._hash is None:
+            self._set("_hash", self._hash_header())
+        return self._hash
+
+    def valid_merkle_root(self):
+        """
+        Checks the Merkle root of the block against its transactions
+        :rtype: bool
+        """
+        return self.compute_merkle_root(self.transactions) == self.merkle_root
+
+    def verify(self):
+        """
+        Integrity check, hashes the header again and compares the result with the stored hash, and checks the Merkle root
+        against the transactions
+        :return: True if the stored hash is the hash of the block and the transactions match the root, False otherwise
+        :rtype: bool
+        """
+        return self._hash_header() == self.hash and self.valid_merkle_root()
+
+    def __eq__(self, other):
+        if not isinstance(other, Block):
+            return NotImplemented
+        return self.encoded == other.encoded
+
+    def __hash__(self):
+        return hash(self.hash)
@@ -0,0 +1,242 @@
+"""
+Client used to talk to the peers of a node. Requests to peers are sent concurrently from a pool of threads, each with
+its own requests Session so connections to a peer are kept alive and reused across consensus rounds. Every request has
+a timeout and a round of requests has an overall deadline, so a slow or dead peer never stalls the round
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import local
+from time import perf_counter
+from requests import RequestException, Session
+from requests.adapters import HTTPAdapter
+from app import logger
+from .metrics import Metrics
+
+BINARY = "application/octet-stream"
+
+
+class PeerClient(object):
+    """
+    Concurrent, pooled HTTP client for peers
+    """
+
+    def __init__(self, timeout=5.0, deadline=30.0, workers=8, metrics=None):
+        """
+        :param timeout: Seconds to wait on a single peer, for connecting and for each read
+        :type timeout float
+        :param deadline: Seconds a round of requests to all peers may take
+        :type deadline float
+        :param workers: Number of peers requested at the same time
+        :type workers int
+        :param metrics: (Optional) Registry the client records the latency of peers in
+        :type metrics Metrics
+        """
+        self.timeout = timeout
+        self.deadline = deadline
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._local = local()
+
+        metrics = metrics or Metrics(enabled=False)
+        self._request_seconds = metrics.histogram(
+            "blockchain_peer_request_seconds",
+            "Seconds requests to a peer take, failed requests included",
+            ("peer",),
+        )
+        self._request_failures = metrics.counter(
+            "blockchain_peer_request_failures_total",
+            "Requests to a peer that failed, timed out or were answered with an error",
+            ("peer",),
+        )
+
+    @classmethod
+    def from_config(cls, config, metrics=None):
+        """
+        Creates the client from the application configuration
+        :param config: Application configuration
+        :type config dict
+        :param metrics: (Optional) Registry the client records its metrics in
+        :type metrics Metrics
+        :return: Peer client
+        :rtype: PeerClient
+        """
+        return cls(
+            timeout=config.get("PEER_TIMEOUT", 5.0),
+            deadline=config.get("CONSENSUS_DEADLINE", 30.0),
+            workers=config.get("PEER_WORKERS", 8),
+            metrics=metrics,
+        )
+
+    @property
+    def session(self):
+        """Session of the current thread, keeping connections to peers alive"""
+        session = getattr(self._local, "session", None)
+
+        if session is None:
+            session = Session()
+            adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=1)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._local.session = session
+
+        return session
+
+    def _request(self, node, path, params, accept, method="GET", document=None):
+        """Sends a request to a peer, returns the response or None if the peer did not answer it successfully in time"""
+        start = perf_counter()
+        try:
+            response = self.session.request(
+                method,
+                f"http://{node}{path}",
+                params=params,
+                json=document,
+                headers={"Accept": accept},
+                timeout=self.timeout,
+            )
+        except RequestException as e:
+            logger.info(f"Peer {node} failed to answer {path}: {e}")
+            response = None
+        else:
+            if not 200 <= response.status_code < 300:
+                logger.info(f"Peer {node} answered {path} with {response.status_code}")
+                response = None
+        finally:
+            self._request_seconds.observe(perf_counter() - start, node)
+
+        if response is None:
+            self._request_failures.inc(1, node)
+
+        return response
+
+    def get_json(self, node, path, params=None):
+        """
+        Gets a JSON document from a peer
+        :param node: Address of the peer e.g 192.168.1.0:8000
+        :type node str
+        :param path: Path of the document e.g /api/block/chain
+        :type path str
+        :param params: (Optional) Query parameters
+        :type params dict
+        :return: Decoded document or None if the peer did not answer with one in time
+        :rtype: dict
+        """
+        response = self._request(node, path, params, "application/json")
+        if response is None:
+            return None
+
+        try:
+            return response.json()
+        except ValueError:
+            logger.info(f"Peer {node} answered {path} with invalid JSON")
+            return None
+
+    def post_json(self, node, path, document):
+        """
+        Posts a JSON document to a peer, e.g an inventory announced to it
+        :param node: Address of the peer e.g 192.168.1.0:8000
+        :type node str
+        :param path: Path the document is posted to
+        :type path str
+        :param document: Document posted
+        :type document dict
+        :return: True if the peer accepted the document in time, False otherwise
+        :rtype: bool
+        """
+        return (
+            self._request(node, path, None, "application/json", "POST", document)
+            is not None
+        )
+
+    def get_bytes(self, node, path, params=None):
+        """
+        Gets a binary document from a peer, e.g a range of blocks in their canonical encoding
+        :param node: Address of the peer e.g 192.168.1.0:8000
+        :type node str
+        :param path: Path of the document e.g /api/block/chain
+        :type path str
+        :param params: (Optional) Query parameters
+        :type params dict
+        :return: Body of the response or None if the peer did not answer with a binary document in time
+        :rtype: bytes
+        """
+        response = self._request(node, path, params, BINARY)
+        if response is None:
+            return None
+
+        if response.headers.get("Content-Type") != BINARY:
+            logger.info(f"Peer {node} answered {path} without a binary document")
+            return None
+
+        return response.content
+
+    def get_all(self, nodes, path, params=None):
+        """
+        Gets a JSON document from every peer concurrently. Documents are yielded as soon as they arrive, so the caller
+        can work on one while the others are still being fetched. Peers that have not answered by the deadline are
+        given up on. The deadline only bounds the time spent waiting on peers, documents that arrived while the caller
+        was working on an earlier one are yielded however long that took
+        :param nodes: Addresses of the peers
+        :type nodes set
+        :param path: Path of the document
+        :type path str
+        :param params: (Optional) Query parameters
+        :type params dict
+        :return: Generator of peer address and document pairs
+        :rtype: generator
+        """
+        futures = {
+            self._executor.submit(self.get_json, node, path, params): node
+            for node in nodes
+        }
+
+        deadline = perf_counter() + self.deadline
+        pending = set(futures)
+
+        try:
+            while pending:
+                done = {future for future in pending if future.done()}
+                if not done:
+                    remaining = deadline - perf_counter()
+                    if remaining <= 0:
+                        nodes = sorted(futures[future] for future in pending)
+                        logger.info(
+                            f"Consensus deadline passed, giving up on peers {nodes}"
+                        )
+                        return
+                    done, _ = wait(pending, remaining, FIRST_COMPLETED)
+
+                pending -= done
+                for future in done:
+                    document = future.result()
+                    if document is not None:
+                        yield futures[future], document
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def get_many(self, node, path, params, binary=False):
+        """
+        Gets several JSON documents from a peer concurrently, e.g the pages of a range of blocks. Documents not received
+        by the deadline are given up on
+        :param node: Address of the peer
+        :type node str
+        :param path: Path of the documents
+        :type path str
+        :param params: Query parameters of every document
+        :type params list
+        :param binary: (Optional) Whether to get binary documents instead, see get_bytes
+        :type binary bool
+        :return: Documents in the order of their parameters, None for documents the peer did not answer with in time
+        :rtype: list
+        """
+        get = self.get_bytes if binary else self.get_json
+        futures = [self._executor.submit(get, node, path, query) for query in params]
+        done, pending = wait(futures, timeout=self.deadline)
+
+        for future in pending:
+            future.cancel()
+        if pending:
+            logger.info(
+                f"Deadline passed, giving up on {len(pending)} requests to {node}"
+            )
+
+        return [future.result() if future in done else None for future in futures]
@@ -0,0 +1,367 @@
+"""
+Proof of work engines. An engine is responsible for finding the smallest proof p' such that hash(pp') has at least
+difficulty leading zero bits, where p is the previous proof. The serial engine walks candidates one at a time on a single core,
+while the parallel engine splits the nonce space into chunks that are searched across a pool of worker processes.
+
+Engines search with a MidstateSearch, which hashes the constant last proof prefix once and copies that hash state
+for every candidate instead of hashing the whole guess from scratch.
+
+Engines are registered in the engines dictionary with the key being the name of the engine and the value being the
+engine class. This allows the engine to be selected from the application configuration with POW_ENGINE
+"""
+import hashlib
+import math
+import multiprocessing
+from abc import ABCMeta, abstractmethod
+from functools import lru_cache
+from threading import Lock
+
+# how many candidates a worker tries before checking whether another worker has already found a proof
+ABORT_CHECK_INTERVAL = 1024
+
+# sentinel stored in the shared value when no worker has found a proof yet
+NOT_FOUND = 2 ** 62
+
+# default number of leading zero bits a proof hash needs, equivalent to 4 leading zeroes in the hex digest
+DIFFICULTY = 16
+
+# bounds for the difficulty of a block
+MIN_DIFFICULTY = 1
+MAX_DIFFICULTY = 255
+
+# the most a single retarget changes the difficulty by, in bits. 2 bits makes mining at most 4 times harder or easier
+MAX_RETARGET_STEP = 2
+
+# shared value set in each worker process by the pool initializer. Holds the lowest chunk index that has a proof
+_found_chunk = None
+
+
+def valid_proof(last_proof, proof, difficulty=DIFFICULTY):
+    """
+    Validates the Proof: Does hash(last_proof, proof) have difficulty leading zero bits?
+    :param last_proof: Previous Proof
+    :type last_proof int
+    :param proof: Current Proof
+    :type proof int
+    :param difficulty: Number of leading zero bits
+    :type difficulty int
+    :return: True if correct, False if not.
+    :rtype: bool
+    """
+    guess = f"{last_proof}{proof}".encode()
+    return hashlib.sha256(guess).digest() <= target(difficulty)
+
+
+def retarget(difficulty, timespan, expected_timespan):
+    """
+    Adjusts the difficulty so that blocks take the expected time to mine. Every extra bit of difficulty doubles the
+    work needed to find a proof, so the difficulty moves by log2 of how much faster or slower the blocks were mined
+    than expected, bounded by MAX_RETARGET_STEP
+    :param difficulty: Current difficulty
+    :type difficulty int
+    :param timespan: Seconds it took to mine the blocks since the last retarget
+    :type timespan float
+    :param expected_timespan: Seconds those blocks should have taken
+    :type expected_timespan float
+    :return: New difficulty
+    :rtype: int
+    """
+    if timespan <= 0:
+        step = MAX_RETARGET_STEP
+    else:
+        step = round(math.log2(expected_timespan / timespan))
+        step = max(-MAX_RETARGET_STEP, min(MAX_RETARGET_STEP, step))
+
+    return max(MIN_DIFFICULTY, min(MAX_DIFFICULTY, difficulty + step))
+
+
+@lru_cache(maxsize=None)
+def target(difficulty):
+    """
+    Returns the largest raw digest that has difficulty leading zero bits. Comparing the digest bytes against the
+    target avoids rendering and slicing the hex digest
+    :param difficulty: Number of leading zero bits
+    :type difficulty int
+    :return: Big endian target
+    :rtype: bytes
+    """
+    return ((1 << (256 - difficulty)) - 1).to_bytes(32, "big")
+
+
+class MidstateSearch(object):
+    """
+    Fast validation path for proofs of a single last proof. The last proof prefix is hashed once and the hash state is
+    copied for every candidate, the candidate nonce is kept as ASCII digits in a bytearray that is incremented in place
+    and the raw digest is compared against the target
+    """
+
+    __slots__ = ("_midstate", "_target")
+
+    def __init__(self, last_proof, difficulty=DIFFICULTY):
+        """
+        :param last_proof: Previous proof
+        :type last_proof int
+        :param difficulty: Number of leading zero bits
+        :type difficulty int
+        """
+        self._midstate = hashlib.sha256(str(last_proof).encode())
+        self._target = target(difficulty)
+
+    def is_valid(self, proof):
+        """
+        Validates a single proof, same result as valid_proof
+        :param proof: Current proof
+        :type proof int
+        :return: True if correct, False if not
+        :rtype: bool
+        """
+        guess_hash = self._midstate.copy()
+        guess_hash.update(b"%d" % proof)
+        return guess_hash.digest() <= self._target
+
+    def search(self, start, stop=None):
+        """
+        Searches for the smallest valid proof in the range [start, stop)
+        :param start: First candidate
+        :type start int
+        :param stop: (Optional) Candidate to stop at, the search is unbounded if not given
+        :type stop int
+        :return: Smallest valid proof in the range or None if there is none
+        :rtype: int
+        """
+        midstate, target_ = self._midstate, self._target
+        nonce = bytearray(b"%d" % start)
+        proof = start
+
+        while stop is None or proof < stop:
+            guess_hash = midstate.copy()
+            guess_hash.update(nonce)
+            if guess_hash.digest() <= target_:
+                return proof
+
+            proof += 1
+
+            # increment the ASCII digits in place, carrying over 9s
+            position = len(nonce) - 1
+            while position >= 0 and nonce[position] == 57:
+                nonce[position] = 48
+                position -= 1
+            if position < 0:
+                nonce.insert(0, 49)
+            else:
+                nonce[position] += 1
+
+        return None
+
+
+class ProofOfWork(metaclass=ABCMeta):
+    """
+    Base proof of work engine. Subclasses implement search which must return the smallest valid proof for the given
+    last proof, so that every engine forges the same block.
+
+    A search can be given a progress object, which has its add method called with the number of candidates hashed as
+    the search goes along and is polled through its cancelled attribute to stop the search early
+    """
+
+    @abstractmethod
+    def search(self, last_proof, difficulty=DIFFICULTY, progress=None):
+        """
+        Searches for the smallest valid proof
+        :param last_proof: Previous proof
+        :type last_proof int
+        :param difficulty: Number of leading zero bits the proof hash needs
+        :type difficulty int
+        :param progress: (Optional) Receives the number of candidates hashed and tells the search to stop
+        :type progress MiningJob
+        :return: Proof of work or None if the search was cancelled
+        :rtype: int
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Creates the engine from the application configuration
+        :param config: Application configuration
+        :type config dict
+        :return: Proof of work engine
+        :rtype: ProofOfWork
+        """
+        return cls()
+
+    def close(self):
+        """Releases any resources held by the engine"""
+        pass
+
+
+class SerialProofOfWork(ProofOfWork):
+    """
+    Walks candidate proofs one at a time starting from 0
+    """
+
+    def search(self, last_proof, difficulty=DIFFICULTY, progress=None):
+        search = MidstateSearch(last_proof, difficulty)
+
+        if progress is None:
+            return search.search(0)
+
+        offset = 0
+        while not progress.cancelled:
+            proof = search.search(offset, offset + ABORT_CHECK_INTERVAL)
+            if proof is not None:
+                progress.add(proof - offset + 1)
+                return proof
+
+            progress.add(ABORT_CHECK_INTERVAL)
+            offset += ABORT_CHECK_INTERVAL
+
+        return None
+
+
+def _init_worker(found_chunk):
+    """
+    Pool initializer, keeps a reference to the shared value used to signal workers to stop
+    :param found_chunk: Shared value holding the lowest chunk index with a proof
+    """
+    global _found_chunk
+    _found_chunk = found_chunk
+
+
+def _search_chunk(last_proof, difficulty, chunk, chunk_size):
+    """
+    Searches a single chunk of the nonce space for the smallest valid proof. The search is abandoned as soon as a
+    chunk lower than this one reports a proof, since any proof found here would not be the smallest
+    :param last_proof: Previous proof
+    :type last_proof int
+    :param difficulty: Number of leading zero bits the proof hash needs
+    :type difficulty int
+    :param chunk: Index of the chunk to search
+    :type chunk int
+    :param chunk_size: Number of candidates in a chunk
+    :type chunk_size int
+    :return: Smallest proof in the chunk or None if there is none or the search was abandoned, and the number of
+    candidates hashed
+    :rtype: tuple
+    """
+    start = chunk * chunk_size
+    stop = start + chunk_size
+    search = MidstateSearch(last_proof, difficulty)
+
+    for offset in range(start, stop, ABORT_CHECK_INTERVAL):
+        if _found_chunk.value < chunk:
+            return None, offset - start
+
+        proof = search.search(offset, min(offset + ABORT_CHECK_INTERVAL, stop))
+        if proof is not None:
+            with _found_chunk.get_lock():
+                if chunk < _found_chunk.value:
+                    _found_chunk.value = chunk
+            return proof, proof - start + 1
+
+    return None, chunk_size
+
+
+class ParallelProofOfWork(ProofOfWork):
+    """
+    Splits the nonce space in chunks of chunk_size candidates and searches them across a pool of worker processes.
+    Chunks are collected in order, so the first proof collected is the smallest one and matches the proof found by the
+    serial engine. Workers searching higher chunks stop as soon as a proof is found in a lower chunk
+    """
+
+    def __init__(self, workers=None, chunk_size=10000):
+        """
+        :param workers: Number of worker processes, defaults to the number of CPUs
+        :type workers int
+        :param chunk_size: Number of candidates handed to a worker at a time
+        :type chunk_size int
+        """
+        self.workers = workers or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        self._pool = None
+        self._found_chunk = None
+        self._lock = Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            workers=config.get("POW_WORKERS"),
+            chunk_size=config.get("POW_CHUNK_SIZE", 10000),
+        )
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._found_chunk = multiprocessing.Value("q", NOT_FOUND)
+            self._pool = multiprocessing.Pool(
+                self.workers, initializer=_init_worker, initargs=(self._found_chunk,)
+            )
+        return self._pool
+
+    def search(self, last_proof, difficulty=DIFFICULTY, progress=None):
+        with self._lock:
+            pool = self._get_pool()
+            self._found_chunk.value = NOT_FOUND
+
+            pending = {}
+            next_chunk = 0
+
+            while True:
+                if progress is not None and progress.cancelled:
+                    # every chunk is above -1, so all workers abandon their search
+                    self._found_chunk.value = -1
+                    for result in pending.values():
+                        result.wait()
+                    return None
+
+                # keep every worker busy with a chunk queued behind it, unless a proof below has been found
+                while (
+                    len(pending) < self.workers * 2
+                    and next_chunk < self._found_chunk.value
+                ):
+                    pending[next_chunk] = pool.apply_async(
+                        _search_chunk,
+                        (last_proof, difficulty, next_chunk, self.chunk_size),
+                    )
+                    next_chunk += 1
+
+                lowest = min(pending)
+                proof, hashes = pending.pop(lowest).get()
+                if progress is not None:
+                    progress.add(hashes)
+
+                if proof is not None:
+                    # remaining chunks are all higher and abandon their search, wait so they do not leak into the
+                    # next search
+                    for result in pending.values():
+                        result.wait()
+                    return proof
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+
+engines = {
+    "serial": SerialProofOfWork,
+    "parallel": ParallelProofOfWork,
+    "default": SerialProofOfWork,
+}
+
+
+def create_engine(config):
+    """
+    Creates the proof of work engine selected with POW_ENGINE in the application configuration
+    :param config: Application configuration
+    :type config dict
+    :return: Proof of work engine
+    :rtype: ProofOfWork
+    """
+    name = config.get("POW_ENGINE", "default")
+
+    try:
+        engine_class = engines[name]
+    except KeyError:
+        raise ValueError(f"Unknown proof of work engine {name}")
+
+    return engine_class.from_config(config)
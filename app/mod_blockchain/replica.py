@@ -0,0 +1,167 @@
+"""
+Read replica of a stored chain, kept by each worker process of a host sharing the chain of a state server, see shared.
+Forwarding every read to the state server would leave all reads to the one process holding the chain, so reads of the
+chain and its indexes are served by each worker from its own replica instead, and only writes and reads of the pool of
+pending transactions go to the state server.
+
+The replica follows the ChainStore the state server writes to. Records are read with pread instead of being memory
+mapped, a map of a log the state server truncates would fault once read past its new end. Before every read the
+replica catches up with the store: blocks appended since are indexed on top of the replica, and once the stored chain
+no longer holds the last block of the replica, e.g after a reorganization, the blocks following the fork point are
+spliced in as they are in the chain of the state server. A record read while the state server changes it is given up
+on, the replica serves the blocks it holds until the next read catches it up
+"""
+import os
+import zlib
+from threading import Lock
+from app import logger
+from .blockchain import Blockchain
+from .encoding import EncodingError
+from .mempool import Mempool
+from .store import OFFSET, RECORD_HEADER, decode_block
+
+
+class StoreChanged(IOError):
+    """
+    Raised when a record of the store is read while it is being truncated or written
+    """
+
+
+class StoreReader(object):
+    """
+    Read only view of a ChainStore written by another process, supporting len and indexing
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Path of the log of the store
+        :type path str
+        :raises FileNotFoundError if the store has not been created yet
+        """
+        self.path = path
+        self._log = os.open(path, os.O_RDONLY)
+        self._index = os.open(f"{path}.idx", os.O_RDONLY)
+
+    def __len__(self):
+        # an index entry is only written once its record is in the log
+        return os.fstat(self._index).st_size // OFFSET.size
+
+    def _pread(self, fd, size, offset):
+        data = os.pread(fd, size, offset)
+        if len(data) != size:
+            raise StoreChanged(f"Record at {offset} of {self.path} was cut short")
+        return data
+
+    def __getitem__(self, position):
+        if position < 0:
+            raise IndexError("block index out of range")
+
+        (offset,) = OFFSET.unpack(
+            self._pread(self._index, OFFSET.size, position * OFFSET.size)
+        )
+        length, checksum = RECORD_HEADER.unpack(
+            self._pread(self._log, RECORD_HEADER.size, offset)
+        )
+        payload = self._pread(self._log, length, offset + RECORD_HEADER.size)
+
+        if zlib.crc32(payload) != checksum:
+            raise StoreChanged(f"Record {position} of {self.path} is being written")
+        return decode_block(payload)
+
+    def close(self):
+        os.close(self._log)
+        os.close(self._index)
+
+
+class ChainReplica(object):
+    """
+    Blockchain kept in memory in step with a chain stored by another process
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Path of the log of the store
+        :type path str
+        """
+        self.path = path
+        self._reader = None
+        # the replica holds no pending transactions, those of rolled back blocks are the state server's to keep
+        self.blockchain = Blockchain(retarget_interval=0, mempool=Mempool(max_size=0))
+        self._synced = False
+        self._lock = Lock()
+
+    @property
+    def ready(self):
+        """Whether the replica has caught up with the store at least once, it holds a genesis block of its own before"""
+        return self._synced
+
+    def refresh(self):
+        """
+        Catches up with the store
+        :return: Whether the replica holds the blocks of the store, as of a moment during the call
+        :rtype: bool
+        """
+        with self._lock:
+            try:
+                if self._reader is None:
+                    self._reader = StoreReader(self.path)
+                self._catch_up()
+            except FileNotFoundError:
+                return False
+            except (StoreChanged, EncodingError, IndexError) as e:
+                logger.debug(f"Replica of {self.path} left behind: {e}")
+                return False
+
+            self._synced = True
+            return True
+
+    def _catch_up(self):
+        blockchain = self.blockchain
+        length = len(self._reader)
+        if not length:
+            raise StoreChanged(f"{self.path} is empty")
+
+        # blocks of the store read while comparing are read once
+        stored = {}
+
+        def read(position):
+            if position not in stored:
+                stored[position] = self._reader[position]
+            return stored[position]
+
+        with blockchain.lock.read():
+            chain = blockchain.chain
+            last = min(len(chain), length)
+            if self._synced and chain[last - 1].hash == read(last - 1).hash:
+                fork = last
+            else:
+                fork = shared_length(chain, read, last)
+
+        if fork == len(chain) == length:
+            return
+
+        blocks = [read(position) for position in range(fork, length)]
+        blockchain.splice_chain(fork, blocks)
+
+
+def shared_length(chain, read, length):
+    """
+    Number of blocks a chain shares with the first length blocks of the store, see Blockchain.shared_length
+    :param chain: Chain of the replica
+    :type chain list
+    :param read: Reads a block of the store by position
+    :type read callable
+    :param length: Number of blocks of the store compared
+    :type length int
+    :rtype: int
+    """
+    shared, mismatch = 0, length + 1
+
+    while mismatch - shared > 1:
+        middle = (shared + mismatch) // 2
+        if chain[middle - 1].hash == read(middle - 1).hash:
+            shared = middle
+        else:
+            mismatch = middle
+
+    return shared
@@ -0,0 +1,247 @@
+"""
+Chain state shared by the worker processes of a host. Without it every worker process of a WSGI server creates its own
+blockchain, so N workers end up with N diverging chains and pools of pending transactions.
+
+A single process, the state server, holds the blockchain, its pool and the mining jobs, and serves them over a socket
+with a multiprocessing manager. Applications configured with SHARED_STATE_ADDRESS connect to it instead of creating a
+blockchain, every call of a view is forwarded to the state server, so all workers see one chain and one pool, and every
+write is applied by the one process holding them. The server answers each connection on its own thread, which the
+readers-writer lock of the blockchain is there for, and each thread of a worker gets its own connection.
+
+Only methods are forwarded, with their arguments and results pickled, which is why views only call methods of the
+blockchain and mining jobs. Proxies connect on first use in each process, so an application created before a WSGI
+server forks its workers never shares a connection between them.
+
+Whoever connects to the state server may have it unpickle what they send, which runs code of their choosing, so the
+connections are authenticated with SHARED_STATE_KEY, a key of their own rather than the SECRET_KEY of the application,
+and the state server refuses to start without one. A Unix socket is only open to the user running the state server.
+
+Forwarding reads too would leave every read of every worker to the one process holding the chain. Once the chain is
+stored with CHAIN_STORE_PATH, each worker keeps a replica of the stored chain and serves reads of the chain and its
+indexes from it, see replica. Writes and reads of the pool of pending transactions are still forwarded
+"""
+import os
+from multiprocessing.managers import BaseManager
+from threading import Lock
+from app import logger
+from .replica import ChainReplica
+
+# methods of the blockchain called by the views
+BLOCKCHAIN_METHODS = (
+    "address_page",
+    "balance",
+    "chain_range",
+    "cumulative_work",
+    "find_blocks",
+    "find_transaction",
+    "is_pending",
+    "new_transaction",
+    "new_transactions",
+    "node_list",
+    "pending_transactions",
+    "receive_inventory",
+    "register_node",
+    "render_metrics",
+    "resolve_conflicts",
+    "spending",
+    "tip",
+)
+
+# methods of the blockchain served by the replica of a worker, which only read the chain and its indexes
+REPLICA_METHODS = ("address_page", "balance", "chain_range", "find_transaction", "tip")
+
+# methods of the mining jobs called by the views
+MINING_JOBS_METHODS = ("cancel", "status", "submit")
+
+# fewest characters of a key authenticating connections to the state server
+KEY_MIN_LENGTH = 16
+
+
+def parse_address(address):
+    """
+    Address of the state server, host:port for a TCP socket or the path of a Unix socket
+    :param address: Configured address
+    :type address str
+    :return: Address as multiprocessing expects it
+    :rtype: tuple or str
+    """
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit() and "/" not in address:
+        return host, int(port)
+    return address
+
+
+def state_key(config):
+    """
+    Key authenticating the connections to the state server
+    :param config: Application configuration
+    :type config dict
+    :return: Key
+    :rtype: bytes
+    :raises ValueError if SHARED_STATE_KEY is unset, too short or the SECRET_KEY of the application
+    """
+    key = config.get("SHARED_STATE_KEY")
+
+    if not key:
+        raise ValueError("SHARED_STATE_KEY must be set to share the chain state")
+    if len(key) < KEY_MIN_LENGTH:
+        raise ValueError(
+            f"SHARED_STATE_KEY must be at least {KEY_MIN_LENGTH} characters long"
+        )
+    if key == config.get("SECRET_KEY"):
+        raise ValueError("SHARED_STATE_KEY must differ from SECRET_KEY")
+    return key.encode()
+
+
+class StateServer(BaseManager):
+    """
+    Manager serving the blockchain and mining jobs of the state server
+    """
+
+
+class StateClient(BaseManager):
+    """
+    Manager connecting to the state server
+    """
+
+
+StateClient.register("blockchain")
+StateClient.register("mining_jobs")
+
+
+def serve(config, reward_address):
+    """
+    Runs the state server until it is interrupted, creating the blockchain from the application configuration
+    :param config: Application configuration
+    :type config dict
+    :param reward_address: Address mining rewards are sent to
+    :type reward_address str
+    """
+    from .blockchain import Blockchain
+    from .jobs import MiningJobs
+
+    authkey = state_key(config)
+    address = parse_address(config["SHARED_STATE_ADDRESS"])
+
+    blockchain = Blockchain.from_config(config)
+    mining_jobs = MiningJobs(blockchain, reward_address)
+
+    StateServer.register(
+        "blockchain", callable=lambda: blockchain, exposed=BLOCKCHAIN_METHODS
+    )
+    StateServer.register(
+        "mining_jobs", callable=lambda: mining_jobs, exposed=MINING_JOBS_METHODS
+    )
+
+    manager = StateServer(address=address, authkey=authkey)
+
+    # a Unix socket is created readable and writable by its owner only
+    umask = os.umask(0o177) if isinstance(address, str) else None
+    try:
+        server = manager.get_server()
+    finally:
+        if umask is not None:
+            os.umask(umask)
+
+    logger.info(f"Serving chain state on {server.address}")
+    server.serve_forever()
+
+
+class RemoteState(object):
+    """
+    Object served by the state server, the blockchain or the mining jobs. Calls are forwarded to a proxy connected on
+    first use in each process
+    """
+
+    def __init__(self, name, address, authkey):
+        """
+        :param name: Name the object is served under, blockchain or mining_jobs
+        :type name str
+        :param address: Address of the state server, see parse_address
+        :type address str
+        :param authkey: Key authenticating the connections to the state server
+        :type authkey bytes
+        """
+        self.name = name
+        self.address = parse_address(address)
+        self.authkey = authkey
+        self._pid = None
+        self._proxy = None
+        self._lock = Lock()
+
+    @classmethod
+    def from_config(cls, name, config):
+        """
+        Connects to an object of the state server configured in the application configuration
+        :param name: Name the object is served under
+        :type name str
+        :param config: Application configuration
+        :type config dict
+        :rtype: RemoteState
+        """
+        return cls(name, config["SHARED_STATE_ADDRESS"], state_key(config))
+
+    @property
+    def proxy(self):
+        """Proxy of the object for the current process"""
+        with self._lock:
+            if self._pid != os.getpid():
+                client = StateClient(address=self.address, authkey=self.authkey)
+                client.connect()
+                self._proxy = getattr(client, self.name)()
+                self._pid = os.getpid()
+            return self._proxy
+
+    def __getattr__(self, name):
+        return getattr(self.proxy, name)
+
+
+class ReplicatedState(RemoteState):
+    """
+    Blockchain of the state server, reads of its chain and indexes are served by a replica of the stored chain kept in
+    each process, other calls are forwarded. Reads are forwarded too while the replica cannot catch up with the store
+    """
+
+    def __init__(self, address, authkey, path):
+        """
+        :param address: Address of the state server, see parse_address
+        :type address str
+        :param authkey: Key authenticating the connections to the state server
+        :type authkey bytes
+        :param path: Path of the log the state server stores the chain in
+        :type path str
+        """
+        super().__init__("blockchain", address, authkey)
+        self.path = path
+        self._replica_pid = None
+        self._replica = None
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Connects to the blockchain of the state server configured in the application configuration
+        :param config: Application configuration
+        :type config dict
+        :rtype: ReplicatedState
+        """
+        return cls(
+            config["SHARED_STATE_ADDRESS"],
+            state_key(config),
+            config["CHAIN_STORE_PATH"],
+        )
+
+    @property
+    def replica(self):
+        """Replica of the stored chain for the current process"""
+        with self._lock:
+            if self._replica_pid != os.getpid():
+                self._replica = ChainReplica(self.path)
+                self._replica_pid = os.getpid()
+            return self._replica
+
+    def __getattr__(self, name):
+        if name in REPLICA_METHODS:
+            replica = self.replica
+            if replica.refresh():
+                return getattr(replica.blockchain, name)
+        return getattr(self.proxy, name)
@@ -0,0 +1,375 @@
+"""
+Ed25519 signatures of transactions. The address of a sender is its public key, hex encoded, and a transaction is signed
+by the private key of its sender over its canonical encoding without the signature, see Transaction.message. A signed
+transaction is only accepted once, so it cannot be replayed, and carries a nonce so that a sender can still send the
+same amount to the same recipient again. Mining rewards are sent by MINT, which has no key, and are only accepted
+unsigned in blocks.
+
+Signatures are checked when transactions are posted and again when the blocks of other chains are validated. A block
+can hold thousands of transactions, so signatures are verified in batches handed to a pool of worker processes instead
+of one after the other on the core validating the block. Small sets of signatures are verified in the calling process,
+where starting workers and pickling would cost more than the verification itself.
+
+Most transactions of a block were already verified when they were posted to the pool. The ids of transactions found
+validly signed are kept in a bounded LRU cache, and as the id of a transaction covers its signature along with every
+other field, a transaction whose id is cached is known to be validly signed without verifying it again
+"""
+import multiprocessing
+import secrets
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric.ed25519 import (
+    Ed25519PrivateKey,
+    Ed25519PublicKey,
+)
+from cryptography.hazmat.primitives.serialization import (
+    Encoding,
+    NoEncryption,
+    PrivateFormat,
+    PublicFormat,
+)
+
+from .balances import MINT
+from .encoding import EncodingError
+from .metrics import Metrics
+from .models import Transaction
+from .validation import worker_context
+
+# estimated bytes an id takes in the cache, its 32 byte digest and its entry in the ordered dict
+CACHE_ENTRY_SIZE = 192
+
+
+def generate_key():
+    """
+    Generates a private key, whose address is given by address_of
+    :rtype: Ed25519PrivateKey
+    """
+    return Ed25519PrivateKey.generate()
+
+
+def load_key(private_key):
+    """
+    Loads a private key from its hex encoding
+    :param private_key: Hex encoded 32 byte private key
+    :type private_key str
+    :rtype: Ed25519PrivateKey
+    """
+    return Ed25519PrivateKey.from_private_bytes(bytes.fromhex(private_key))
+
+
+def export_key(private_key):
+    """
+    Hex encoding of a private key, see load_key
+    :type private_key Ed25519PrivateKey
+    :rtype: str
+    """
+    return private_key.private_bytes(
+        Encoding.Raw, PrivateFormat.Raw, NoEncryption()
+    ).hex()
+
+
+def address_of(private_key):
+    """
+    Address of the holder of a private key, its hex encoded public key
+    :type private_key Ed25519PrivateKey
+    :rtype: str
+    """
+    return private_key.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw).hex()
+
+
+def sign(private_key, recipient, amount, fee=0, nonce=None):
+    """
+    Creates a transaction sent from the address of a private key, signed with it
+    :param private_key: Private key of the sender
+    :type private_key Ed25519PrivateKey
+    :param recipient: Address of the recipient
+    :type recipient str
+    :param amount: Amount sent
+    :type amount int
+    :param fee: (Optional) Fee paid to the miner
+    :type fee int
+    :param nonce: (Optional) Nonce of the transaction, which must differ from those of the other transactions of the
+    sender with the same recipient, amount and fee. Defaults to a random 64 bit number
+    :type nonce int
+    :return: Signed transaction
+    :rtype: Transaction
+    """
+    if nonce is None:
+        nonce = secrets.randbits(64)
+    unsigned = Transaction(address_of(private_key), recipient, amount, fee, nonce=nonce)
+    signature = private_key.sign(unsigned.message()).hex()
+    return Transaction(unsigned.sender, recipient, amount, fee, signature, nonce)
+
+
+def verify_signature(sender, signature, message):
+    """
+    Checks the signature of a message against the address of its sender
+    :param sender: Address of the sender, its hex encoded public key
+    :type sender str
+    :param signature: Hex encoded signature
+    :type signature str
+    :param message: Message signed
+    :type message bytes
+    :return: True if the signature is valid, False otherwise
+    :rtype: bool
+    """
+    try:
+        key = Ed25519PublicKey.from_public_bytes(bytes.fromhex(sender))
+        key.verify(bytes.fromhex(signature), message)
+    except (InvalidSignature, TypeError, ValueError):
+        return False
+    return True
+
+
+def _verify_batch(batch):
+    """Verifies a batch of sender, signature and message triples in a worker process"""
+    return [verify_signature(*item) for item in batch]
+
+
+class VerifiedCache(object):
+    """
+    Bounded LRU cache of the ids of transactions whose signatures were found valid, evicting the least recently used ids
+    once it holds as many as fit in its memory limit
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, metrics=None):
+        """
+        :param max_bytes: (Optional) Memory the cache may take, ids are evicted once it holds
+        max_bytes // CACHE_ENTRY_SIZE of them
+        :type max_bytes int
+        :param metrics: (Optional) Registry the cache records its hits and misses in
+        :type metrics Metrics
+        """
+        self.max_size = max_bytes // CACHE_ENTRY_SIZE
+        self._ids = OrderedDict()
+        self._lock = Lock()
+
+        metrics = metrics or Metrics(enabled=False)
+        self._hits = metrics.counter(
+            "blockchain_signature_cache_hits_total",
+            "Transactions known to be validly signed from the signature cache",
+        )
+        self._misses = metrics.counter(
+            "blockchain_signature_cache_misses_total",
+            "Transactions whose signatures were verified as they were not in the signature cache",
+        )
+        metrics.gauge(
+            "blockchain_signature_cache_entries",
+            "Ids of validly signed transactions held in the signature cache",
+            function=self.__len__,
+        )
+
+    @classmethod
+    def from_config(cls, config, metrics=None):
+        """
+        Creates the cache from the application configuration
+        :param config: Application configuration
+        :type config dict
+        :param metrics: (Optional) Registry the cache records its metrics in
+        :type metrics Metrics
+        :rtype: VerifiedCache
+        """
+        return cls(
+            max_bytes=config.get("SIGNATURE_CACHE_MAX_BYTES", 16 * 1024 * 1024),
+            metrics=metrics,
+        )
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, transaction_id):
+        return bytes.fromhex(transaction_id) in self._ids
+
+    def seen(self, transaction_ids):
+        """
+        Looks up ids in the cache, marking those found as recently used
+        :param transaction_ids: Ids of transactions
+        :type transaction_ids list
+        :return: Whether each id is cached, in the order of the ids
+        :rtype: list
+        """
+        keys = [bytes.fromhex(transaction_id) for transaction_id in transaction_ids]
+        found = []
+        with self._lock:
+            for key in keys:
+                cached = key in self._ids
+                if cached:
+                    self._ids.move_to_end(key)
+                found.append(cached)
+
+        hits = sum(found)
+        self._hits.inc(hits)
+        self._misses.inc(len(found) - hits)
+        return found
+
+    def add(self, transaction_ids):
+        """
+        Caches the ids of transactions found validly signed, evicting the least recently used ids beyond the limit
+        :param transaction_ids: Ids of transactions
+        :type transaction_ids list
+        """
+        keys = [bytes.fromhex(transaction_id) for transaction_id in transaction_ids]
+        with self._lock:
+            for key in keys:
+                self._ids[key] = None
+                self._ids.move_to_end(key)
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+
+class SignatureVerifier(object):
+    """
+    Verifies the signatures of transactions, in batches spread across worker processes for large sets of transactions
+    """
+
+    def __init__(self, workers=None, batch_size=256, cache=None):
+        """
+        :param workers: (Optional) Number of worker processes, defaults to the number of CPUs
+        :type workers int
+        :param batch_size: (Optional) Number of signatures verified by a worker at a time, sets of signatures no larger
+        than a batch are verified in the calling process
+        :type batch_size int
+        :param cache: (Optional) Cache of the ids of transactions already found validly signed, every signature is
+        verified if not given
+        :type cache VerifiedCache
+        """
+        self.workers = workers or multiprocessing.cpu_count()
+        self.batch_size = batch_size
+        self.cache = cache
+        self._executor = None
+        self._lock = Lock()
+
+    @classmethod
+    def from_config(cls, config, metrics=None):
+        """
+        Creates the verifier from the application configuration
+        :param config: Application configuration
+        :type config dict
+        :param metrics: (Optional) Registry the cache of the verifier records its metrics in
+        :type metrics Metrics
+        :return: Signature verifier
+        :rtype: SignatureVerifier
+        """
+        return cls(
+            workers=config.get("SIGNATURE_WORKERS"),
+            batch_size=config.get("SIGNATURE_BATCH_SIZE", 256),
+            cache=(
+                VerifiedCache.from_config(config, metrics)
+                if config.get("SIGNATURE_CACHE_MAX_BYTES", 16 * 1024 * 1024)
+                else None
+            ),
+        )
+
+    @property
+    def parallel(self):
+        """
+        Whether signatures can be verified across processes. Processes of a pool, e.g those of the chain validator,
+        cannot start processes of their own and verify signatures themselves
+        """
+        return self.workers > 1 and not multiprocessing.current_process().daemon
+
+    @property
+    def executor(self):
+        """Pool of worker processes, started the first time a large set of signatures is verified"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=worker_context(),
+                )
+            return self._executor
+
+    def verify(self, transaction, mint=False):
+        """
+        Verifies the signature of a single transaction
+        :param transaction: Transaction to verify
+        :type transaction Transaction
+        :param mint: (Optional) Whether transactions sent by MINT are valid unsigned, as mining rewards in blocks are
+        :type mint bool
+        :return: True if the transaction is validly signed, False otherwise
+        :rtype: bool
+        """
+        return self.verify_many([transaction], mint)[0]
+
+    def verify_many(self, transactions, mint=False):
+        """
+        Verifies the signatures of transactions, across the worker processes if there are more than a batch of them.
+        Transactions whose ids are cached are not verified again and the ids of those found valid are cached
+        :param transactions: Transactions to verify
+        :type transactions list
+        :param mint: (Optional) Whether transactions sent by MINT are valid unsigned, see verify
+        :type mint bool
+        :return: Whether each transaction is validly signed, in the order of the transactions
+        :rtype: list
+        """
+        results = [False] * len(transactions)
+        positions, ids, items = [], [], []
+
+        for position, transaction in enumerate(transactions):
+            if transaction.sender == MINT:
+                results[position] = mint and transaction.signature is None
+            elif transaction.signature is not None:
+                try:
+                    item = (
+                        transaction.sender,
+                        transaction.signature,
+                        transaction.message(),
+                    )
+                    transaction_id = transaction.id
+                except EncodingError:
+                    continue
+                positions.append(position)
+                ids.append(transaction_id)
+                items.append(item)
+
+        if self.cache is not None and positions:
+            unseen = []
+            for index, cached in enumerate(self.cache.seen(ids)):
+                if cached:
+                    results[positions[index]] = True
+                else:
+                    unseen.append(index)
+            positions = [positions[index] for index in unseen]
+            ids = [ids[index] for index in unseen]
+            items = [items[index] for index in unseen]
+
+        verified = []
+        for position, transaction_id, valid in zip(
+            positions, ids, self._verify_items(items)
+        ):
+            results[position] = valid
+            if valid:
+                verified.append(transaction_id)
+
+        if self.cache is not None and verified:
+            self.cache.add(verified)
+
+        return results
+
+    def _verify_items(self, items):
+        if len(items) <= self.batch_size or not self.parallel:
+            return _verify_batch(items)
+
+        batches = [
+            items[start : start + self.batch_size]
+            for start in range(0, len(items), self.batch_size)
+        ]
+        return [
+            valid
+            for batch in self.executor.map(_verify_batch, batches)
+            for valid in batch
+        ]
+
+    def close(self):
+        """Stops the worker processes"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
@@ -0,0 +1,75 @@
+"""
+Snapshots of the indexes derived from a chain kept in a ChainStore, so they do not have to be rebuilt from every block
+of the chain on restart. A snapshot records the length of the chain it was taken at and the hash of its last block.
+On loading, it is only used if that block is still in the chain, the blocks after it are then indexed on top of it.
+Snapshots are written to a temporary file first and moved over the previous snapshot, so a crash while writing one
+leaves the previous snapshot in place.
+
+A snapshot holds the small indexes, unpickled on loading, followed by the lookup index pickled on its own, which is only
+read as bytes and left to the index to unpickle the first time it is used, see LookupIndex.load. Snapshots written
+before that layout are not used, the indexes are rebuilt from the chain
+"""
+import os
+import pickle
+from app import logger
+
+# layout of the snapshots written
+SNAPSHOT_FORMAT = 2
+
+
+def save_snapshot(path, length, tip, indexes, lookup):
+    """
+    Saves a snapshot of indexes of a chain
+    :param path: Path of the snapshot
+    :type path str
+    :param length: Length of the chain the indexes are up to date with
+    :type length int
+    :param tip: Hash of the last block of the chain, None if it is empty
+    :type tip str
+    :param indexes: Indexes unpickled on loading, by name
+    :type indexes dict
+    :param lookup: State of the lookup index, see LookupIndex.state
+    :type lookup tuple
+    """
+    snapshot = dict(format=SNAPSHOT_FORMAT, length=length, tip=tip, indexes=indexes)
+
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(lookup, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def load_snapshot(path, chain):
+    """
+    Loads the snapshot of the indexes of a chain
+    :param path: Path of the snapshot
+    :type path str
+    :param chain: Chain the indexes were taken of
+    :type chain ChainStore
+    :return: Length of the chain the indexes are up to date with, the indexes by name and the pickled state of the
+    lookup index, or None if there is no usable snapshot
+    :rtype: tuple
+    """
+    try:
+        with open(path, "rb") as f:
+            snapshot = pickle.load(f)
+            lookup = f.read()
+    except FileNotFoundError:
+        return None
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+        logger.info(f"Index snapshot {path} is unreadable: {e}")
+        return None
+
+    if not isinstance(snapshot, dict) or snapshot.get("format") != SNAPSHOT_FORMAT:
+        logger.info(f"Index snapshot {path} has an older layout, rebuilding")
+        return None
+
+    length = snapshot["length"]
+    if length > len(chain) or (length and chain[length - 1].hash != snapshot["tip"]):
+        logger.info(f"Index snapshot {path} does not match the chain, rebuilding")
+        return None
+
+    return length, snapshot["indexes"], lookup
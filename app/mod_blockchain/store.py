@@ -0,0 +1,287 @@
+"""
+Persistent storage for the blocks of a chain. Blocks are written to an append-only log as they are added to the chain,
+each record being the length of the encoded block, its CRC32 checksum and the encoded block:
+
+    +----------------+---------------+------------------+
+    | length (4)     | crc32 (4)     | block (length)   |
+    +----------------+---------------+------------------+
+
+A separate index file holds the offset of every record in the log as an 8 byte integer, so block i is found by reading
+the offset at i * 8 in the index. Both files are memory mapped and blocks are only decoded when they are read, which
+keeps restart time independent of the length of the chain. Writes are flushed to the operating system straight away
+but only fsynced every sync_every blocks.
+
+On opening the store, a trailing record that is cut short or fails its checksum, for example because the process died
+while writing it, is detected and cut off together with its index entry
+"""
+import mmap
+import os
+import struct
+import zlib
+from collections import OrderedDict
+from threading import RLock
+from .models import Block
+
+RECORD_HEADER = struct.Struct("<II")
+OFFSET = struct.Struct("<Q")
+
+
+def decode_block(payload):
+    """
+    Decodes a block read from the log
+    :param payload: Encoded block
+    :type payload bytes
+    :return: Block
+    :rtype: Block
+    """
+    return Block.decode(payload)
+
+
+class ChainStore(object):
+    """
+    Append-only store of the blocks of a chain. It behaves like the list of blocks it replaces, supporting len,
+    indexing, slicing, iteration and append
+    """
+
+    def __init__(self, path, sync_every=100, cache_size=1024):
+        """
+        Opens the store, creating it if it does not exist
+        :param path: Path of the log, the index is kept next to it with an .idx suffix
+        :type path str
+        :param sync_every: Number of appended blocks after which the files are fsynced
+        :type sync_every int
+        :param cache_size: Number of decoded blocks kept in memory
+        :type cache_size int
+        """
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self.sync_every = sync_every
+        self.cache_size = cache_size
+
+        self._log = open(self.path, "a+b")
+        self._index = open(self.index_path, "a+b")
+        self._log_map = None
+        self._index_map = None
+        self._length = 0
+        self._end = 0
+        self._unsynced = 0
+        self._cache = OrderedDict()
+        self._lock = RLock()
+
+        self._recover()
+
+    @staticmethod
+    def _map(file, current, size):
+        """
+        Returns a memory map of the file covering at least size bytes, remapping it if the file has grown
+        """
+        if current is not None and len(current) >= size:
+            return current
+
+        if current is not None:
+            current.close()
+
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _unmap(self):
+        """Closes the memory maps, they are reopened on the next read"""
+        for current in (self._log_map, self._index_map):
+            if current is not None:
+                current.close()
+        self._log_map = None
+        self._index_map = None
+
+    def _record_end(self, log, offset):
+        """
+        Checks the record at the given offset of the log
+        :return: Offset following the record or None if the record is cut short or fails its checksum
+        :rtype: int
+        """
+        if offset + RECORD_HEADER.size > len(log):
+            return None
+
+        length, checksum = RECORD_HEADER.unpack_from(log, offset)
+        start = offset + RECORD_HEADER.size
+        end = start + length
+
+        if end > len(log) or zlib.crc32(log[start:end]) != checksum:
+            return None
+
+        return end
+
+    def _recover(self):
+        """
+        Finds the last valid record. Index entries pointing at records that are cut short or corrupted are dropped,
+        while valid records written to the log but missing from the index are added to it. Anything following the last
+        valid record is cut off
+        """
+        self._log.flush()
+        self._index.flush()
+        log_size = os.fstat(self._log.fileno()).st_size
+        index_size = os.fstat(self._index.fileno()).st_size
+
+        log = self._map(self._log, None, 1) if log_size else b""
+        index = self._map(self._index, None, 1) if index_size else b""
+
+        length = index_size // OFFSET.size
+        end = None
+
+        # only the tail of the index is checked, walking back until a valid record is found
+        while length:
+            (offset,) = OFFSET.unpack_from(index, (length - 1) * OFFSET.size)
+            end = self._record_end(log, offset)
+            if end is not None:
+                break
+            length -= 1
+
+        end = end or 0
+
+        # records that made it to the log before the process died, without their index entry
+        recovered = []
+        while True:
+            record_end = self._record_end(log, end)
+            if record_end is None:
+                break
+            recovered.append(end)
+            end = record_end
+
+        if not isinstance(log, bytes):
+            log.close()
+        if not isinstance(index, bytes):
+            index.close()
+
+        self._index.truncate(length * OFFSET.size)
+        for offset in recovered:
+            self._index.write(OFFSET.pack(offset))
+        self._log.truncate(end)
+
+        self._length = length + len(recovered)
+        self._end = end
+        self.sync()
+
+    def _offset(self, position):
+        self._index_map = self._map(
+            self._index, self._index_map, (position + 1) * OFFSET.size
+        )
+        return OFFSET.unpack_from(self._index_map, position * OFFSET.size)[0]
+
+    def _read(self, position):
+        """
+        Reads and decodes the block at the given position
+        :raises IOError if the record fails its checksum
+        """
+        offset = self._offset(position)
+        self._log_map = self._map(
+            self._log, self._log_map, offset + RECORD_HEADER.size
+        )
+        length, checksum = RECORD_HEADER.unpack_from(self._log_map, offset)
+
+        start = offset + RECORD_HEADER.size
+        self._log_map = self._map(self._log, self._log_map, start + length)
+        payload = self._log_map[start : start + length]
+
+        if zlib.crc32(payload) != checksum:
+            raise IOError(f"Block record {position} in {self.path} is corrupted")
+
+        return decode_block(payload)
+
+    def _cache_block(self, position, block):
+        self._cache[position] = block
+        self._cache.move_to_end(position)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(self._length))]
+
+        if position < 0:
+            position += self._length
+        if not 0 <= position < self._length:
+            raise IndexError("block index out of range")
+
+        with self._lock:
+            block = self._cache.get(position)
+            if block is None:
+                block = self._read(position)
+            self._cache_block(position, block)
+            return block
+
+    def __iter__(self):
+        for position in range(self._length):
+            yield self[position]
+
+    def append(self, block):
+        """
+        Appends a block to the log and its offset to the index
+        :param block: Block to append
+        :type block dict
+        """
+        block = Block.from_dict(block)
+        payload = block.encoded
+
+        with self._lock:
+            self._log.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+            self._log.write(payload)
+            self._log.flush()
+            self._index.write(OFFSET.pack(self._end))
+            self._index.flush()
+
+            self._cache_block(self._length, block)
+            self._end += RECORD_HEADER.size + len(payload)
+            self._length += 1
+
+            self._unsynced += 1
+            if self._unsynced >= self.sync_every:
+                self.sync()
+
+    def extend(self, blocks):
+        for block in blocks:
+            self.append(block)
+
+    def truncate(self, length):
+        """
+        Cuts the chain down to its first length blocks
+        :param length: Number of blocks to keep
+        :type length int
+        """
+        with self._lock:
+            if length >= self._length:
+                return
+
+            end = self._offset(length)
+
+            # the maps must not outlive the bytes they cover
+            self._unmap()
+            self._index.truncate(length * OFFSET.size)
+            self._log.truncate(end)
+
+            for position in [p for p in self._cache if p >= length]:
+                del self._cache[position]
+
+            self._length = length
+            self._end = end
+            self.sync()
+
+    def sync(self):
+        """Fsyncs the log and the index"""
+        with self._lock:
+            self._log.flush()
+            self._index.flush()
+            os.fsync(self._log.fileno())
+            os.fsync(self._index.fileno())
+            self._unsynced = 0
+
+    def close(self):
+        """Syncs and closes the store"""
+        with self._lock:
+            if self._log.closed:
+                return
+
+            self.sync()
+            self._unmap()
+            self._log.close()
+            self._index.close()
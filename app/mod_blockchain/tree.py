@@ -0,0 +1,189 @@
+"""
+Tree of the recent blocks of our chain and of the side branches competing with it, indexed by hash. The chain that wins
+consensus is the one that took the most work to mine, not the one with the most blocks: the work of a block is the
+number of hashes its proof is expected to take, 2 ** difficulty, and a chain of fewer blocks at a higher difficulty
+may well have taken more work than a longer one.
+
+Every block of the tree records the cumulative work of the chain ending with it, from the genesis block. The work is a
+property of the block itself rather than of the chain we hold, so the tips of our chain and of the side branches are
+compared with a single integer comparison, and switching to a side branch only rolls back the blocks of our chain
+after the fork point and replays the blocks of the branch. Blocks of a side branch are only added once validated, so
+blocks already in the tree are not validated again when a peer sends a chain extending them.
+
+The tree is bounded by pruning the blocks more than depth blocks below the tip of our chain, along with the side
+branches they leave behind. Our chain itself lives on in memory or in its store
+"""
+from .models import Block
+
+
+def block_work(block):
+    """
+    Work that went into mining a block, the number of hashes its proof is expected to take
+    :param block: Block or header of a block
+    :type block dict
+    :rtype: int
+    """
+    return 2 ** block["difficulty"]
+
+
+class TreeNode(object):
+    """
+    Block of the tree with the cumulative work of the chain ending with it
+    """
+
+    __slots__ = ("block", "work")
+
+    def __init__(self, block, work):
+        """
+        :param block: Block
+        :type block Block
+        :param work: Cumulative work of the chain ending with the block
+        :type work int
+        """
+        self.block = block
+        self.work = work
+
+    @property
+    def hash(self):
+        return self.block.hash
+
+    @property
+    def index(self):
+        return self.block["index"]
+
+    def __repr__(self):
+        return f"TreeNode({self.index}, {self.hash[:12]}, work={self.work})"
+
+
+class BlockTree(object):
+    """
+    Recent blocks of our chain and of its side branches, indexed by hash
+    """
+
+    def __init__(self, depth=100):
+        """
+        :param depth: (Optional) Number of blocks below the tip of our chain kept in the tree, side branches forking
+        further back are pruned
+        :type depth int
+        """
+        self.depth = depth
+        self._nodes = {}
+        # hashes of the blocks at each index, so blocks are pruned without going through the whole tree
+        self._heights = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Creates the tree from the application configuration
+        :param config: Application configuration
+        :type config dict
+        :rtype: BlockTree
+        """
+        return cls(depth=config.get("BLOCK_TREE_DEPTH", 100))
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, block_hash):
+        return block_hash in self._nodes
+
+    def get(self, block_hash):
+        """
+        Block of the tree with the given hash
+        :rtype: TreeNode
+        """
+        return self._nodes.get(block_hash)
+
+    def work(self, block_hash):
+        """
+        Cumulative work of the chain ending with a block
+        :param block_hash: Hash of the block
+        :type block_hash str
+        :return: Cumulative work or None if the block is not in the tree
+        :rtype: int
+        """
+        node = self._nodes.get(block_hash)
+        return None if node is None else node.work
+
+    def add(self, block, parent_work=None):
+        """
+        Adds a block to the tree. Its cumulative work follows from the block it links to, if that block is in the tree
+        :param block: Block to add
+        :type block Block
+        :param parent_work: (Optional) Cumulative work of the chain ending with the block the block links to, needed if
+        that block is not in the tree
+        :type parent_work int
+        :return: Block of the tree, or None if its parent is unknown and no parent work was given
+        :rtype: TreeNode
+        """
+        block = Block.from_dict(block)
+        node = self._nodes.get(block.hash)
+        if node is not None:
+            return node
+
+        parent = self._nodes.get(block["previous_hash"])
+        if parent is not None:
+            parent_work = parent.work
+        elif parent_work is None:
+            return None
+
+        node = self._nodes[block.hash] = TreeNode(
+            block, parent_work + block_work(block)
+        )
+        self._heights.setdefault(block["index"], set()).add(block.hash)
+        return node
+
+    def extend(self, blocks, parent_work=None):
+        """
+        Adds a branch of blocks, each linking to the one before it
+        :param blocks: Blocks of the branch
+        :type blocks list
+        :param parent_work: (Optional) Cumulative work of the chain the branch follows, see add
+        :type parent_work int
+        :return: Block of the tree at the tip of the branch, or None if the branch could not be added
+        :rtype: TreeNode
+        """
+        node = None
+        for block in blocks:
+            node = self.add(block, parent_work)
+            if node is None:
+                return None
+            parent_work = node.work
+        return node
+
+    def tips(self):
+        """
+        Blocks of the tree no other block of the tree links to, the tips of our chain and of its side branches
+        :return: Tips, those with the most work first
+        :rtype: list
+        """
+        parents = {node.block["previous_hash"] for node in self._nodes.values()}
+        tips = [node for node in self._nodes.values() if node.hash not in parents]
+        return sorted(tips, key=lambda node: node.work, reverse=True)
+
+    def branch(self, block_hash):
+        """
+        Blocks of the tree from a block back to the first block of its branch in the tree, following previous hashes
+        :param block_hash: Hash of the block to start from
+        :type block_hash str
+        :return: Generator of tree blocks, the given block first
+        :rtype: generator
+        """
+        node = self._nodes.get(block_hash)
+        while node is not None:
+            yield node
+            node = self._nodes.get(node.block["previous_hash"])
+
+    def prune(self, index):
+        """
+        Drops the blocks at or below an index, and with them the side branches ending there
+        :param index: Index of the last block dropped
+        :type index int
+        """
+        for height in [height for height in self._heights if height <= index]:
+            for block_hash in self._heights.pop(height):
+                del self._nodes[block_hash]
+
+    def clear(self):
+        self._nodes.clear()
+        self._heights.clear()
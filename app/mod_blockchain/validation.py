@@ -0,0 +1,207 @@
+"""
+Chain validation. Every block of a chain is checked against the block before it, its hash link, difficulty and proof,
+which does not depend on any other check. Long chains are therefore split in chunks of chunk_size blocks that are
+validated across a pool of worker processes.
+
+Validation stops at the first invalid block. Workers share the position of the lowest invalid block found so far and
+give up on their chunk as soon as it starts after that position, while chunks are collected in order so the block
+reported is always the first invalid one of the chain.
+
+Workers are not forked from the node, whose other threads may hold locks at the time of the fork that would then never
+be released in the worker. They are started from a fork server, or spawned where there is none, and build their own
+blockchain with the rules of the one validating. Each chunk is sent to them with the blocks before it that its first
+block is checked against. A validation taking longer than timeout seconds is given up on and the chain is validated
+serially instead, so a stuck worker never stalls consensus
+"""
+import multiprocessing
+from time import perf_counter
+from app import logger
+
+# how many blocks a worker checks before looking whether a lower invalid block has been found
+ABORT_CHECK_INTERVAL = 256
+
+# sentinel stored in the shared value when no invalid block has been found
+NOT_FOUND = 2 ** 62
+
+# set in every worker when it starts, see _start_worker
+_blockchain = None
+_first_invalid = None
+
+
+def worker_context():
+    """
+    Context starting worker processes from a fork server where there is one, spawning them otherwise. Workers are not
+    forked from the node, whose other threads may hold locks at the time of the fork
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context(
+        "forkserver" if "forkserver" in methods else "spawn"
+    )
+
+
+def _rules(blockchain):
+    """Arguments of the blockchain a worker validates with, see _start_worker"""
+    return dict(
+        difficulty=blockchain.initial_difficulty,
+        retarget_interval=blockchain.retarget_interval,
+        target_block_time=blockchain.target_block_time,
+        signatures=blockchain.verifier is not None,
+    )
+
+
+def _start_worker(rules, first_invalid):
+    """
+    Creates the blockchain a worker validates chunks with, following the given rules
+    :param rules: Rules of the blockchain validating, see _rules
+    :type rules dict
+    :param first_invalid: Position of the lowest invalid block found so far, shared by the workers
+    :type first_invalid multiprocessing.Value
+    """
+    global _blockchain, _first_invalid
+    # the blockchain module imports this one
+    from .blockchain import Blockchain
+    from .signatures import SignatureVerifier
+
+    _blockchain = Blockchain(
+        difficulty=rules["difficulty"],
+        retarget_interval=rules["retarget_interval"],
+        target_block_time=rules["target_block_time"],
+        validator=ChainValidator(workers=1),
+        verifier=SignatureVerifier(workers=1) if rules["signatures"] else None,
+    )
+    _first_invalid = first_invalid
+
+
+def _validate_chunk(offset, blocks, start, stop):
+    """
+    Validates the blocks at positions [start, stop) of the chain
+    :param offset: Position in the chain of the first of the blocks
+    :type offset int
+    :param blocks: Blocks at positions [offset, stop) of the chain
+    :type blocks list
+    :return: Position of the first invalid block in the chunk or None if they are all valid or the chunk was abandoned
+    :rtype: int
+    """
+    from .blockchain import SplicedChain
+
+    # the blocks before offset are never read
+    chain = SplicedChain([], offset, blocks)
+
+    for chunk in range(start, stop, ABORT_CHECK_INTERVAL):
+        if _first_invalid.value < start:
+            return None
+
+        for position in range(chunk, min(chunk + ABORT_CHECK_INTERVAL, stop)):
+            if not _blockchain.valid_block(chain, position):
+                with _first_invalid.get_lock():
+                    if position < _first_invalid.value:
+                        _first_invalid.value = position
+                return position
+
+    return None
+
+
+class ChainValidator(object):
+    """
+    Finds the first invalid block of a chain, in parallel for chains longer than two chunks
+    """
+
+    def __init__(self, workers=None, chunk_size=5000, timeout=600.0):
+        """
+        :param workers: Number of worker processes, defaults to the number of CPUs
+        :type workers int
+        :param chunk_size: Number of blocks validated by a worker at a time
+        :type chunk_size int
+        :param timeout: (Optional) Seconds a validation across the workers may take before the chain is validated
+        serially instead
+        :type timeout float
+        """
+        self.workers = workers or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Creates the validator from the application configuration
+        :param config: Application configuration
+        :type config dict
+        :return: Chain validator
+        :rtype: ChainValidator
+        """
+        return cls(
+            workers=config.get("VALIDATION_WORKERS"),
+            chunk_size=config.get("VALIDATION_CHUNK_SIZE", 5000),
+            timeout=config.get("VALIDATION_TIMEOUT", 600.0),
+        )
+
+    @property
+    def parallel(self):
+        """
+        Whether chains can be validated across processes. Processes of a pool, e.g the workers themselves, cannot start
+        processes of their own
+        """
+        return self.workers > 1 and not multiprocessing.current_process().daemon
+
+    def first_invalid(self, blockchain, chain, start=1):
+        """
+        Finds the first invalid block of the chain
+        :param blockchain: Blockchain whose rules the chain is validated with
+        :type blockchain Blockchain
+        :param chain: Chain to validate
+        :type chain list
+        :param start: (Optional) Position of the first block to validate, the blocks before it are trusted
+        :type start int
+        :return: Position of the first invalid block in the chain or None if the chain is valid
+        :rtype: int
+        """
+        start = max(start, 1)
+
+        if not self.parallel or len(chain) - start < 2 * self.chunk_size:
+            return self._first_invalid_serial(blockchain, chain, start)
+
+        try:
+            return self._first_invalid_parallel(blockchain, chain, start)
+        except multiprocessing.TimeoutError:
+            logger.warning(
+                f"Parallel validation took over {self.timeout}s, validating serially"
+            )
+            return self._first_invalid_serial(blockchain, chain, start)
+
+    @staticmethod
+    def _first_invalid_serial(blockchain, chain, start):
+        for position in range(start, len(chain)):
+            if not blockchain.valid_block(chain, position):
+                return position
+        return None
+
+    def _first_invalid_parallel(self, blockchain, chain, start):
+        from .blockchain import MEDIAN_TIME_BLOCKS
+
+        context = worker_context()
+        first_invalid = context.Value("q", NOT_FOUND)
+        # the blocks before a chunk its first block is checked against, those retargeting from and those whose median
+        # timestamp it follows
+        context_size = max(blockchain.retarget_interval, MEDIAN_TIME_BLOCKS)
+        deadline = perf_counter() + self.timeout
+
+        with context.Pool(
+            self.workers, _start_worker, (_rules(blockchain), first_invalid)
+        ) as pool:
+            results = []
+            for chunk in range(start, len(chain), self.chunk_size):
+                offset = max(chunk - context_size, 0)
+                stop = min(chunk + self.chunk_size, len(chain))
+                # the blocks are read here, workers never touch the chain or its store
+                blocks = [chain[position] for position in range(offset, stop)]
+                results.append(
+                    pool.apply_async(_validate_chunk, (offset, blocks, chunk, stop))
+                )
+
+            # every chunk below has been found valid once a result is collected
+            for result in results:
+                position = result.get(timeout=max(deadline - perf_counter(), 0))
+                if position is not None:
+                    return position
+
+            return None
@@ -1,13 +1,215 @@
+import json
 from . import block
-from flask import jsonify, request
+from flask import Response, current_app, g, jsonify, request
+from werkzeug.local import LocalProxy
+from time import perf_counter
 from uuid import uuid4
 from .blockchain import Blockchain
+from .encoding import encode_records
+from .jobs import MiningJob, MiningJobs
+from .mempool import MINED, OVERDRAFT, PENDING, UNSIGNED, TransactionRejected
+from .metrics import Metrics
+from .models import parse_transaction
+from .peers import BINARY
+from .shared import RemoteState, ReplicatedState
 from app import logger
 
 # generates a globally unique address for this node
 node_identifier = str(uuid4()).replace("-", "")
 
-blockchain = Blockchain()
+# every application gets its own blockchain, configured when the blueprint is registered on it, or shares the one of
+# the state server of its host. Views only call methods of the blockchain and mining jobs, which both support
+blockchain = LocalProxy(lambda: current_app.extensions["blockchain"])
+mining_jobs = LocalProxy(lambda: current_app.extensions["mining_jobs"])
+
+# blocks serialized into a single chunk of a streamed chain
+STREAM_BATCH_SIZE = 100
+
+NDJSON = "application/x-ndjson"
+
+# content type of the Prometheus text exposition format
+EXPOSITION = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@block.record_once
+def init_blockchain(state):
+    """
+    Creates the blockchain for the application the blueprint is registered on, or connects to the blockchain of the
+    state server if SHARED_STATE_ADDRESS is set, see shared
+    :param state: Blueprint setup state
+    """
+    config = state.app.config
+    extensions = state.app.extensions
+
+    if config.get("SHARED_STATE_ADDRESS"):
+        if config.get("CHAIN_STORE_PATH"):
+            extensions["blockchain"] = ReplicatedState.from_config(config)
+        else:
+            extensions["blockchain"] = RemoteState.from_config("blockchain", config)
+        extensions["mining_jobs"] = RemoteState.from_config("mining_jobs", config)
+        # the metrics of the blockchain are those of the state server, requests are recorded by each worker
+        extensions["metrics"] = Metrics.from_config(config)
+    else:
+        chain = Blockchain.from_config(config)
+        extensions["blockchain"] = chain
+        extensions["mining_jobs"] = MiningJobs(chain, node_identifier)
+        extensions["metrics"] = chain.metrics
+
+    extensions["request_seconds"] = extensions["metrics"].histogram(
+        "blockchain_http_request_seconds",
+        "Seconds taken to answer requests to the block API, streamed bodies left out",
+        ("endpoint", "method", "status"),
+    )
+    state.app.add_url_rule("/metrics", "metrics", export_metrics)
+
+
+@block.before_request
+def start_timer():
+    if current_app.extensions["metrics"].enabled:
+        g.request_started = perf_counter()
+
+
+@block.after_request
+def record_request(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        current_app.extensions["request_seconds"].observe(
+            perf_counter() - started,
+            request.endpoint,
+            request.method,
+            response.status_code,
+        )
+    return response
+
+
+def export_metrics():
+    """
+    Metrics of the node in the Prometheus text exposition format
+    :return: Metrics or 404 if metrics are disabled
+    :rtype: Response
+    """
+    metrics = current_app.extensions["metrics"]
+
+    if not metrics.enabled:
+        return jsonify(dict(message="Metrics are disabled")), 404
+
+    text = metrics.render()
+    if isinstance(blockchain._get_current_object(), RemoteState):
+        text = blockchain.render_metrics() + text
+
+    return Response(text, content_type=EXPOSITION)
+
+
+def encode_blocks(read_range, length):
+    """
+    Serializes the first length blocks of the chain, a batch of blocks at a time. Each batch is read on its own, holding
+    the lock of the blockchain for reading only while the batch is read, so a slow client never holds up mining
+    :param read_range: Reads the blocks of a range of the chain, given the index of its first block and its length
+    :type read_range callable
+    :param length: Number of blocks to serialize, blocks appended after the response started are left out
+    :type length int
+    :return: Generator of batches of JSON encoded blocks
+    :rtype: generator
+    """
+    for start in range(1, length + 1, STREAM_BATCH_SIZE):
+        blocks = read_range(start, min(STREAM_BATCH_SIZE, length - start + 1))
+        yield [json.dumps(block.to_dict()) for block in blocks]
+
+
+def chain_reader(chain):
+    """
+    Reader of ranges of the chain streamed and the length of the chain.
+
+    A chain in memory is replaced by a new list when blocks are dropped from it, so the blocks streamed are those of
+    the chain the response started with. A stored chain changes in place, as does the chain of a state server read one
+    range at a time, a batch read after it was reorganised holds the blocks of the new chain
+    :param chain: Blockchain streamed
+    :type chain Blockchain
+    :return: Reader of ranges of blocks and the length of the chain
+    :rtype: tuple
+    """
+    if not isinstance(chain, Blockchain):
+        length, _ = chain.tip()
+        return lambda start, limit: chain.chain_range(start, limit)[1], length
+
+    with chain.lock.read():
+        blocks = chain.chain
+        length = len(blocks)
+
+    def read_range(start, limit):
+        with chain.lock.read():
+            return blocks[start - 1 : start - 1 + limit]
+
+    return read_range, length
+
+
+def stream_chain(**fields):
+    """
+    Streams the chain as a JSON document with the given fields and the blocks of the chain, one batch of blocks at a
+    time, so the whole document is never held in memory however long the chain is. Clients asking for NDJSON get a
+    block per line instead, with the length of the chain in the X-Chain-Length header, see chain_reader for the blocks
+    streamed while the chain changes
+    :param fields: Other fields of the document, length is set to the length of the chain streamed if given
+    :return: Streamed response
+    :rtype: Response
+    """
+    # the response is streamed outside of the application context, the blockchain is not reachable from there
+    read_range, length = chain_reader(blockchain._get_current_object())
+    if "length" in fields:
+        fields["length"] = length
+
+    if request.accept_mimetypes.best_match(["application/json", NDJSON]) == NDJSON:
+
+        def generate():
+            for batch in encode_blocks(read_range, length):
+                yield "\n".join(batch) + "\n"
+
+        return Response(
+            generate(), mimetype=NDJSON, headers={"X-Chain-Length": str(length)}
+        )
+
+    def generate():
+        yield json.dumps(fields)[:-1] + (", " if fields else "") + '"chain": ['
+        separator = ""
+        for batch in encode_blocks(read_range, length):
+            yield separator + ", ".join(batch)
+            separator = ", "
+        yield "]}"
+
+    return Response(generate(), mimetype="application/json")
+
+
+def wants_binary():
+    """Whether the client asked for a range of blocks or headers in their canonical binary encoding"""
+    return request.accept_mimetypes.best_match(["application/json", BINARY]) == BINARY
+
+
+def binary_range(records, length, following):
+    """
+    Response holding a range of blocks or headers in their canonical binary encoding, framed by
+    encoding.encode_records. The length of the chain and the index of the following page, empty on the last page, are
+    given in the X-Chain-Length and X-Next headers
+    :param records: Encoded blocks or headers
+    :type records list
+    :param length: Length of the chain
+    :type length int
+    :param following: Index of the following page, None on the last page
+    :type following int
+    :rtype: Response
+    """
+    headers = {
+        "X-Chain-Length": str(length),
+        "X-Next": "" if following is None else str(following),
+    }
+    return Response(encode_records(records), mimetype=BINARY, headers=headers)
+
+
+def balance_of(address):
+    balance = blockchain.balance(address)
+    pending = blockchain.spending(address)
+    return dict(
+        address=address, balance=balance, pending=pending, available=balance - pending
+    )
 
 
 @block.route("/transactions/new", methods=["POST"])
@@ -18,23 +220,231 @@ def new_transaction():
     if values is None:
         return jsonify(dict(message="Missing values")), 400
 
-    sender, recipient, amount = (
-        values.get("sender"),
-        values.get("recipient"),
-        values.get("amount"),
-    )
+    transaction = parse_transaction(values)
 
-    if sender is None or recipient is None or amount is None:
+    if transaction is None:
         return jsonify(dict(message="Missing values")), 400
 
     # create a new transaction
-    index = blockchain.new_transaction(sender, recipient, amount)
+    try:
+        index = blockchain.new_transaction(
+            transaction.sender,
+            transaction.recipient,
+            transaction.amount,
+            transaction.fee,
+            transaction.signature,
+            transaction.nonce,
+        )
+    except TransactionRejected as e:
+        return rejection(e.reason, transaction)
+
+    response = dict(
+        message=f"Transaction will be added to block {index}", id=transaction.id
+    )
 
-    response = dict(message=f"Transaction will be added to block {index}")
+    return jsonify(response), 201
+
+
+def rejection(reason, transaction):
+    """
+    Response to a transaction turned away from the pool
+    :param reason: Reason the transaction was turned away for, see mempool
+    :type reason str
+    :param transaction: Transaction turned away
+    :type transaction Transaction
+    :return: json response
+    :rtype: tuple
+    """
+    if reason == PENDING:
+        response = dict(message="Transaction is already pending", id=transaction.id)
+        return jsonify(response), 200
+
+    if reason == UNSIGNED:
+        response = dict(message="Transaction is not validly signed by its sender")
+        return jsonify(response), 401
+
+    if reason == MINED:
+        response = dict(message="Transaction is already mined", id=transaction.id)
+        return jsonify(response), 409
+
+    if reason == OVERDRAFT:
+        available = balance_of(transaction.sender)["available"]
+        response = dict(message="Insufficient funds", available=available)
+        return jsonify(response), 409
+
+    response = dict(message="Transaction pool is full, a higher fee is needed")
+    return jsonify(response), 503
+
+
+@block.route("/transactions/batch", methods=["POST"])
+def new_transactions():
+    """
+    Adds a batch of transactions to the pool in one request. The whole batch is rejected if any of its transactions is
+    invalid, otherwise the response tells how many were accepted and how many were duplicates, overdrafts or turned
+    away by a full pool
+    :return: json response
+    :rtype: tuple
+    """
+    values = request.get_json()
+    transactions = values.get("transactions") if isinstance(values, dict) else None
+
+    if not isinstance(transactions, list):
+        return jsonify(dict(message="Missing transactions")), 400
+
+    max_batch = current_app.config.get("TRANSACTION_BATCH_LIMIT", 10000)
+    if len(transactions) > max_batch:
+        message = f"A batch holds at most {max_batch} transactions"
+        return jsonify(dict(message=message)), 413
+
+    parsed = [parse_transaction(transaction) for transaction in transactions]
+    invalid = [
+        position for position, transaction in enumerate(parsed) if transaction is None
+    ]
 
+    if invalid:
+        return jsonify(dict(message="Missing values", invalid=invalid)), 400
+
+    accepted = blockchain.new_transactions(parsed)
+    length, _ = blockchain.tip()
+
+    response = dict(
+        message=f"Transactions will be added from block {length + 1}",
+        accepted=accepted,
+        rejected=len(parsed) - accepted,
+    )
     return jsonify(response), 201
 
 
+@block.route("/balances/<address>", methods=["GET"])
+def get_balance(address):
+    """
+    Gets the balance of an address in the chain, what its pending transactions spend and what it has left to spend
+    :param address: Address
+    :type address str
+    :return: json response
+    :rtype: tuple
+    """
+    return jsonify(balance_of(address)), 200
+
+
+@block.route("/balances", methods=["GET"])
+def get_balances():
+    """
+    Gets the balances of the addresses given with the address query parameter, e.g ?address=a&address=b
+    :return: json response
+    :rtype: tuple
+    """
+    addresses = request.args.getlist("address")
+
+    if not addresses:
+        return jsonify(dict(message="Missing addresses")), 400
+
+    max_addresses = current_app.config.get("CHAIN_PAGE_LIMIT", 1000)
+    if len(addresses) > max_addresses:
+        message = f"At most {max_addresses} addresses can be requested at once"
+        return jsonify(dict(message=message)), 400
+
+    response = dict(balances=[balance_of(address) for address in addresses])
+    return jsonify(response), 200
+
+
+def located(block, position):
+    return dict(
+        block=block["index"],
+        position=position,
+        transaction=block["transactions"][position].to_dict(),
+    )
+
+
+@block.route("/transactions/<transaction_id>", methods=["GET"])
+def get_transaction(transaction_id):
+    """
+    Gets a transaction by id, with the block holding it once it is mined. Identical transactions share an id, every
+    block holding one is listed in locations
+    :param transaction_id: Id of the transaction
+    :type transaction_id str
+    :return: json response
+    :rtype: tuple
+    """
+    locations = blockchain.find_transaction(transaction_id)
+
+    if locations:
+        response = dict(
+            id=transaction_id,
+            status="confirmed",
+            locations=[located(block, position) for block, position in locations],
+        )
+        return jsonify(response), 200
+
+    if blockchain.is_pending(transaction_id):
+        return jsonify(dict(id=transaction_id, status="pending", locations=[])), 200
+
+    return jsonify(dict(message="Transaction not found")), 404
+
+
+@block.route("/transactions/<transaction_id>/proof", methods=["GET"])
+def get_transaction_proof(transaction_id):
+    """
+    Gets the proof that a transaction is in a block: the header of the block and the sibling hashes on the path from
+    the transaction to the Merkle root of the block. A client holding the header checks the proof without downloading
+    the transactions of the block
+    :param transaction_id: Id of the transaction
+    :type transaction_id str
+    :return: json response
+    :rtype: tuple
+    """
+    locations = blockchain.find_transaction(transaction_id)
+
+    if not locations:
+        return jsonify(dict(message="Transaction is not in a block")), 404
+
+    block, position = locations[0]
+    response = dict(
+        id=transaction_id,
+        block=block["index"],
+        position=position,
+        hash=block.hash,
+        header=block.header().to_dict(),
+        proof=block.merkle_proof(position),
+    )
+    return jsonify(response), 200
+
+
+@block.route("/addresses/<address>/transactions", methods=["GET"])
+def get_address_transactions(address):
+    """
+    Gets the transactions sent or received by an address, in chain order. A page of transactions is requested with
+    from, the number of transactions to skip, and limit, the number of transactions. next is the from of the following
+    page, None on the last page
+    :param address: Address
+    :type address str
+    :return: json response
+    :rtype: tuple
+    """
+    max_limit = current_app.config.get("CHAIN_PAGE_LIMIT", 1000)
+    message = f"from must be 0 or more and limit between 1 and {max_limit}"
+
+    try:
+        start = int(request.args.get("from", 0))
+        limit = int(request.args.get("limit", 100))
+    except ValueError:
+        return jsonify(dict(message=message)), 400
+
+    if start < 0 or not 0 < limit <= max_limit:
+        return jsonify(dict(message=message)), 400
+
+    count, transactions = blockchain.address_page(address, start, limit)
+    following = start + len(transactions)
+
+    response = dict(
+        address=address,
+        count=count,
+        transactions=[located(block, position) for block, position in transactions],
+        next=following if following < count else None,
+    )
+    return jsonify(response), 200
+
+
 @block.route("/mine", methods=["POST"])
 def mine_block():
     """
@@ -43,35 +453,229 @@ def mine_block():
     2. Reward the miner (us) by adding a transaction granting us 1 coin
     3. Forge the new Block by adding it to the chain
 
+    Mining runs as a background job, this returns straight away with the id of the job, which is used to query its
+    progress and get the forged block
+
+    :return: json response
+    :rtype: tuple
+    """
+    job_id, started = mining_jobs.submit()
+
+    if not started:
+        response = dict(message="A mining job is already running", job=job_id)
+        return jsonify(response), 409
+
+    response = dict(message="Mining job started", job=job_id)
+
+    return jsonify(response), 202
+
+
+@block.route("/mine/<job_id>", methods=["GET"])
+def mining_status(job_id):
+    """
+    Reports the progress of a mining job, hashes tried and hash rate, and the forged block once it is done
+    :param job_id: Id of the mining job
+    :return: json response
+    :rtype: tuple
+    """
+    job = mining_jobs.status(job_id)
+
+    if job is None:
+        return jsonify(dict(message="Mining job not found")), 404
+
+    return jsonify(job), 200
+
+
+@block.route("/mine/<job_id>", methods=["DELETE"])
+def cancel_mining(job_id):
+    """
+    Cancels a running mining job
+    :param job_id: Id of the mining job
+    :return: json response
+    :rtype: tuple
+    """
+    status = mining_jobs.cancel(job_id)
+
+    if status is None:
+        return jsonify(dict(message="Mining job not found")), 404
+
+    if status not in (MiningJob.PENDING, MiningJob.RUNNING):
+        return jsonify(dict(message=f"Mining job is already {status}")), 409
+
+    return jsonify(dict(message="Mining job cancelled", job=job_id)), 202
+
+
+@block.route("/chain", methods=["GET"])
+def get_chain():
+    """
+    Gets the chain. The whole chain is streamed, a range of blocks is requested with from, the index of the first
+    block, and limit, the number of blocks. next is the index to request the following page from, None on the last
+    page. The length is always the length of the whole chain. Clients asking for application/octet-stream get the range
+    in the canonical binary encoding of the blocks, see binary_range
     :return: json response
     :rtype: tuple
     """
-    last_block = blockchain.last_block
-    last_proof = last_block["proof"]
-    proof = blockchain.proof_of_work(last_proof)
+    if "from" not in request.args and "limit" not in request.args:
+        return stream_chain(length=None), 200
+
+    max_limit = current_app.config.get("CHAIN_PAGE_LIMIT", 1000)
+    message = f"from must be a block index and limit between 1 and {max_limit}"
+
+    try:
+        start = int(request.args.get("from", 1))
+        limit = int(request.args.get("limit", max_limit))
+    except ValueError:
+        return jsonify(dict(message=message)), 400
+
+    if start < 1 or not 0 < limit <= max_limit:
+        return jsonify(dict(message=message)), 400
 
-    # We must receive a reward for finding the proof.
-    # The sender is "0" to signify that this node has mined a new coin.
-    blockchain.new_transaction(sender="0", recipient=node_identifier, amount=1)
+    length, blocks = blockchain.chain_range(start, limit)
+    following = start + len(blocks)
+    following = following if following <= length else None
 
-    # forge a new block by adding it to the chain
-    previous_hash = blockchain.hash(last_block)
-    block = blockchain.new_block(proof, previous_hash)
+    if wants_binary():
+        return binary_range([block.encoded for block in blocks], length, following)
 
     response = dict(
-        message="New block forged",
-        index=block["index"],
-        transactions=block["transactions"],
-        proof=block["proof"],
-        previous_hash=block["previous_hash"],
+        chain=[block.to_dict() for block in blocks], length=length, next=following
     )
+    return jsonify(response), 200
+
 
+@block.route("/headers", methods=["GET"])
+def get_headers():
+    """
+    Gets a range of block headers, from the index of the first block and limit, the number of headers. Headers are the
+    blocks without their transactions, enough to check the chain they form, so nodes pick the chain to sync with from
+    headers and only download the blocks of that chain. Clients asking for application/octet-stream get the headers in
+    their canonical binary encoding, see binary_range
+    :return: json response
+    :rtype: tuple
+    """
+    max_limit = current_app.config.get("HEADER_PAGE_LIMIT", 10000)
+    message = f"from must be a block index and limit between 1 and {max_limit}"
+
+    try:
+        start = int(request.args.get("from", 1))
+        limit = int(request.args.get("limit", max_limit))
+    except ValueError:
+        return jsonify(dict(message=message)), 400
+
+    if start < 1 or not 0 < limit <= max_limit:
+        return jsonify(dict(message=message)), 400
+
+    length, blocks = blockchain.chain_range(start, limit)
+    following = start + len(blocks)
+    following = following if following <= length else None
+
+    if wants_binary():
+        headers = [block.header().encode() for block in blocks]
+        return binary_range(headers, length, following)
+
+    response = dict(
+        headers=[block.header().to_dict() for block in blocks],
+        length=length,
+        next=following,
+    )
     return jsonify(response), 200
 
 
-@block.route("/chain", methods=["GET"])
-def get_chain():
-    response = dict(chain=blockchain.chain, length=len(blockchain))
+@block.route("/chain/tip", methods=["GET"])
+def get_tip():
+    """
+    Gets the height and cumulative work of the chain and the hash of its last block, which is all a node needs to
+    find out whether our chain took more work than its own
+    :return: json response
+    :rtype: tuple
+    """
+    length, last_block = blockchain.tip()
+    response = dict(
+        length=length,
+        index=last_block["index"],
+        hash=last_block.hash,
+        work=blockchain.cumulative_work(last_block.hash),
+    )
+    return jsonify(response), 200
+
+
+def is_string_list(values):
+    return isinstance(values, list) and all(isinstance(value, str) for value in values)
+
+
+@block.route("/inventory", methods=["POST"])
+def receive_inventory():
+    """
+    Receives the hashes of new blocks and the ids of new transactions announced by a registered node, e.g
+    {"node": "192.168.1.0:8000", "blocks": [hash], "transactions": [id]}. Those we do not have are fetched from the node
+    in the background, see gossip
+    :return: json response
+    :rtype: tuple
+    """
+    values = request.get_json(silent=True)
+    if not isinstance(values, dict):
+        return jsonify(dict(message="Missing inventory")), 400
+
+    node, blocks, transactions = (
+        values.get("node"),
+        values.get("blocks", []),
+        values.get("transactions", []),
+    )
+    if not isinstance(node, str) or not (
+        is_string_list(blocks) and is_string_list(transactions)
+    ):
+        return jsonify(dict(message="Missing inventory")), 400
+
+    max_items = current_app.config.get("TRANSACTION_BATCH_LIMIT", 10000)
+    if len(blocks) + len(transactions) > max_items:
+        message = f"An inventory holds at most {max_items} items"
+        return jsonify(dict(message=message)), 413
+
+    wanted = blockchain.receive_inventory(node, blocks, transactions)
+    if wanted is None:
+        return jsonify(dict(message="Node is not registered")), 403
+
+    return jsonify(dict(message="Inventory received", wanted=wanted)), 202
+
+
+@block.route("/blocks", methods=["GET"])
+def get_blocks():
+    """
+    Gets recent blocks of the chain, or of its side branches, by the hashes given with the hash query parameter, e.g
+    ?hash=a&hash=b. Blocks no longer held in the block tree are left out
+    :return: json response
+    :rtype: tuple
+    """
+    hashes = request.args.getlist("hash")
+
+    max_blocks = current_app.config.get("CHAIN_PAGE_LIMIT", 1000)
+    if not hashes or len(hashes) > max_blocks:
+        message = f"Between 1 and {max_blocks} hashes can be requested at once"
+        return jsonify(dict(message=message)), 400
+
+    blocks = blockchain.find_blocks(hashes)
+    return jsonify(dict(blocks=[block.to_dict() for block in blocks])), 200
+
+
+@block.route("/mempool", methods=["GET"])
+def get_pending_transactions():
+    """
+    Gets pending transactions by the ids given with the id query parameter, e.g ?id=a&id=b. Transactions that are not
+    pending are left out
+    :return: json response
+    :rtype: tuple
+    """
+    ids = request.args.getlist("id")
+
+    max_ids = current_app.config.get("TRANSACTION_BATCH_LIMIT", 10000)
+    if not ids or len(ids) > max_ids:
+        message = f"Between 1 and {max_ids} ids can be requested at once"
+        return jsonify(dict(message=message)), 400
+
+    transactions = blockchain.pending_transactions(ids)
+    response = dict(
+        transactions=[transaction.to_dict() for transaction in transactions]
+    )
     return jsonify(response), 200
 
 
@@ -88,7 +692,7 @@ def register_nodes():
         blockchain.register_node(node)
 
     response = dict(
-        message="New nodes have been added", total_nodes=list(blockchain.nodes)
+        message="New nodes have been added", total_nodes=blockchain.node_list()
     )
     return jsonify(response), 201
 
@@ -96,10 +700,5 @@ def register_nodes():
 @block.route("/nodes/resolve", methods=["GET"])
 def consensus():
     replaced = blockchain.resolve_conflicts()
-
-    response = dict(
-        message=f"Our chain {'was replaced' if replaced else 'is authoritative'}",
-        chain=blockchain.chain,
-    )
-
-    return jsonify(response), 200
+    message = f"Our chain {'was replaced' if replaced else 'is authoritative'}"
+    return stream_chain(message=message), 200
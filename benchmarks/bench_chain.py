@@ -0,0 +1,100 @@
+"""
+Peak memory and time to first byte of GET /api/block/chain, building the whole JSON document with jsonify the way the
+view used to against the streamed response. Every measurement runs in its own process so peak RSS is not carried over
+from the previous one. Run from the root of the project with:
+
+    python -m benchmarks.bench_chain --blocks 10000 100000 1000000
+"""
+import argparse
+import resource
+import subprocess
+import sys
+from time import perf_counter
+
+from flask import jsonify
+
+from app import create_app
+from benchmarks.bench_hash import synthetic_chain
+
+
+def peak_rss():
+    """
+    Peak resident set size of this process
+    :return: KiB
+    :rtype: int
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def buffered(app, chain):
+    with app.test_request_context("/api/block/chain"):
+        start = perf_counter()
+        response = jsonify(
+            dict(chain=[block.to_dict() for block in chain], length=len(chain))
+        )
+        body = response.get_data()
+        return perf_counter() - start, len(body)
+
+
+def streamed(app, chain):
+    client = app.test_client()
+    start = perf_counter()
+    response = client.get("/api/block/chain", buffered=False)
+    chunks = iter(response.response)
+    size = len(next(chunks))
+    first_byte = perf_counter() - start
+    for chunk in chunks:
+        size += len(chunk)
+    response.close()
+    return first_byte, size
+
+
+def measure(mode, blocks, transactions):
+    """
+    Requests the chain once in this process and prints the time to first byte, the size of the body and how much the
+    peak RSS grew while serving it
+    """
+    app = create_app("testing")
+    chain = synthetic_chain(blocks, transactions)
+    app.extensions["blockchain"].chain = chain
+
+    baseline = peak_rss()
+    first_byte, size = dict(buffered=buffered, streamed=streamed)[mode](app, chain)
+    print(first_byte, size, peak_rss() - baseline)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--blocks", type=int, nargs="+", default=[10000, 100000, 1000000]
+    )
+    parser.add_argument("--transactions", type=int, default=5)
+    parser.add_argument(
+        "--measure", choices=["buffered", "streamed"], help=argparse.SUPPRESS
+    )
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.blocks[0], args.transactions)
+        return
+
+    print(f"{args.transactions} transactions per block")
+    print(f"{'blocks':>10}{'mode':>10}{'TTFB':>10}{'body':>12}{'peak RSS':>12}")
+    for blocks in args.blocks:
+        for mode in ("buffered", "streamed"):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_chain", "--measure", mode]
+                + ["--blocks", str(blocks), "--transactions", str(args.transactions)],
+                check=True,
+                stdout=subprocess.PIPE,
+                universal_newlines=True,
+            ).stdout.split()
+            first_byte, size, rss = float(output[0]), int(output[1]), int(output[2])
+            print(
+                f"{blocks:>10,}{mode:>10}{first_byte * 1000:>8.1f}ms"
+                f"{size / 2 ** 20:>8.1f} MiB{rss / 2 ** 10:>8.1f} MiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark of the canonical binary encoding of blocks against their JSON encoding on a synthetic chain: serializing
+blocks, deserializing them, hashing their headers, and the size of the encoded chain. Run from the root of the project
+with:
+
+    python -m benchmarks.bench_encoding --blocks 20000 --transactions 20
+"""
+import argparse
+import hashlib
+import json
+from time import perf_counter
+
+from app.mod_blockchain.models import Block
+from benchmarks.bench_hash import synthetic_chain
+
+
+def json_encode(block):
+    return json.dumps(block.to_dict(), sort_keys=True).encode()
+
+
+def json_decode(encoded):
+    return Block.from_dict(json.loads(encoded))
+
+
+def json_hash(header):
+    return hashlib.sha256(json.dumps(header.to_dict(), sort_keys=True).encode())
+
+
+def binary_hash(header):
+    return hashlib.sha256(header.encode())
+
+
+def timed(function, items, passes):
+    start = perf_counter()
+    for _ in range(passes):
+        for item in items:
+            function(item)
+    return perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--blocks", type=int, default=20000)
+    parser.add_argument("--transactions", type=int, default=20)
+    parser.add_argument("--passes", type=int, default=3)
+    args = parser.parse_args()
+
+    chain = synthetic_chain(args.blocks, args.transactions)
+    headers = [block.header() for block in chain]
+    json_blocks = [json_encode(block) for block in chain]
+    binary_blocks = [block.encode() for block in chain]
+
+    print(
+        f"{args.blocks:,} blocks, {args.transactions} transactions each, "
+        f"{args.passes} passes"
+    )
+    print(f"{'':<14}{'json':>10}{'binary':>10}")
+    for label, json_seconds, binary_seconds in (
+        (
+            "serialize",
+            timed(json_encode, chain, args.passes),
+            timed(Block.encode, chain, args.passes),
+        ),
+        (
+            "deserialize",
+            timed(json_decode, json_blocks, args.passes),
+            timed(Block.decode, binary_blocks, args.passes),
+        ),
+        (
+            "hash header",
+            timed(json_hash, headers, args.passes),
+            timed(binary_hash, headers, args.passes),
+        ),
+    ):
+        print(f"{label:<14}{json_seconds:9.3f}s{binary_seconds:9.3f}s")
+
+    json_size = sum(map(len, json_blocks))
+    binary_size = sum(map(len, binary_blocks))
+    print(f"{'size':<14}{json_size / 2 ** 20:8.1f}MB{binary_size / 2 ** 20:8.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark of block hashing on a synthetic chain, comparing json.dumps hashing of every block on every call against
+the hash each Block computes once and keeps. Run from the root of the project with:
+
+    python -m benchmarks.bench_hash --blocks 100000
+"""
+import argparse
+import hashlib
+import json
+from time import perf_counter
+
+from app.mod_blockchain.blockchain import Blockchain
+from app.mod_blockchain.models import Block
+
+
+def synthetic_chain(blocks, transactions):
+    """
+    Builds a chain of blocks each holding the given number of transactions. Proofs are not valid, only the shape of
+    the blocks matters for hashing
+    :rtype: list
+    """
+    chain = []
+    previous_hash = "1"
+
+    for index in range(1, blocks + 1):
+        block = Block(
+            index=index,
+            timestamp=1530568221.2421486 + index,
+            transactions=[
+                dict(sender=f"sender{index}", recipient=f"recipient{i}", amount=i)
+                for i in range(transactions)
+            ],
+            proof=index * 7919,
+            difficulty=16,
+            previous_hash=previous_hash,
+        )
+        previous_hash = block.hash
+        chain.append(block)
+
+    # start from blocks that have not been hashed yet
+    return [Block.from_dict(block.to_dict()) for block in chain]
+
+
+def json_hash(block):
+    return hashlib.sha256(
+        json.dumps(block.to_dict(), sort_keys=True).encode()
+    ).hexdigest()
+
+
+def timed(function, chain, passes):
+    start = perf_counter()
+    for _ in range(passes):
+        for block in chain:
+            function(block)
+    return perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--blocks", type=int, default=100000)
+    parser.add_argument("--transactions", type=int, default=5)
+    parser.add_argument("--passes", type=int, default=3)
+    args = parser.parse_args()
+
+    chain = synthetic_chain(args.blocks, args.transactions)
+
+    json_time = timed(json_hash, chain, args.passes)
+    first_time = timed(Blockchain.hash, chain, 1)
+    cached_time = timed(Blockchain.hash, chain, args.passes)
+    verify_time = timed(Block.verify, chain, 1)
+
+    print(f"{args.blocks:,} blocks, {args.transactions} transactions each")
+    for label, seconds in (
+        (f"json.dumps hashing, {args.passes} passes", json_time),
+        ("first hash, computed and stored", first_time),
+        (f"cached hash, {args.passes} passes", cached_time),
+        ("integrity check, 1 pass", verify_time),
+    ):
+        print(f"{label:<36}{seconds:8.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Memory held by transactions and blocks as plain dicts, the way blocks used to be built, against the slotted Block and
+Transaction models. Addresses are drawn from a shared pool, so the figures are the overhead of the containers
+themselves. Run from the root of the project with:
+
+    python -m benchmarks.bench_memory --transactions 1000000
+"""
+import argparse
+import gc
+import tracemalloc
+from uuid import uuid4
+
+from app.mod_blockchain.models import Block, Transaction
+
+
+def dict_chain(addresses, transactions, per_block):
+    chain = []
+    for index in range(transactions // per_block):
+        chain.append(
+            dict(
+                index=index + 1,
+                timestamp=1530568221.2421486 + index,
+                transactions=[
+                    {
+                        "sender": addresses[(index + i) % len(addresses)],
+                        "recipient": addresses[(index + i + 1) % len(addresses)],
+                        "amount": i,
+                    }
+                    for i in range(per_block)
+                ],
+                proof=index * 7919,
+                difficulty=16,
+                previous_hash=addresses[index % len(addresses)],
+            )
+        )
+    return chain
+
+
+def model_chain(addresses, transactions, per_block):
+    chain = []
+    for index in range(transactions // per_block):
+        chain.append(
+            Block(
+                index=index + 1,
+                timestamp=1530568221.2421486 + index,
+                transactions=[
+                    Transaction(
+                        addresses[(index + i) % len(addresses)],
+                        addresses[(index + i + 1) % len(addresses)],
+                        i,
+                    )
+                    for i in range(per_block)
+                ],
+                proof=index * 7919,
+                difficulty=16,
+                previous_hash=addresses[index % len(addresses)],
+            )
+        )
+    return chain
+
+
+def measure(build, *args):
+    """
+    Memory allocated by the structure build returns
+    :return: bytes
+    :rtype: int
+    """
+    gc.collect()
+    tracemalloc.start()
+    chain = build(*args)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del chain
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--transactions", type=int, default=1000000)
+    parser.add_argument("--per-block", type=int, default=100)
+    parser.add_argument("--addresses", type=int, default=10000)
+    args = parser.parse_args()
+
+    addresses = [uuid4().hex for _ in range(args.addresses)]
+    arguments = (addresses, args.transactions, args.per_block)
+
+    dicts = measure(dict_chain, *arguments)
+    models = measure(model_chain, *arguments)
+
+    print(f"{args.transactions:,} transactions, {args.per_block} per block")
+    for name, size in (("dicts", dicts), ("models", models)):
+        mebibytes, per_transaction = size / 2 ** 20, size / args.transactions
+        print(f"{name:<8}{mebibytes:10.1f} MiB {per_transaction:8.1f} B/tx")
+    print(f"models are {dicts / models:.2f}x smaller")
+
+    # models exist to save memory, a field stored on every transaction can undo it
+    if models >= dicts:
+        raise SystemExit("models are no smaller than dicts")
+
+
+if __name__ == "__main__":
+    main()
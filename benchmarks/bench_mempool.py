@@ -0,0 +1,87 @@
+"""
+Transaction intake throughput, posting transactions one at a time to /api/block/transactions/new against posting them
+in batches to /api/block/transactions/batch, through the application's test client. Run from the root of the project
+with:
+
+    python -m benchmarks.bench_mempool --transactions 20000 --batch-size 1000
+"""
+import argparse
+from time import perf_counter
+
+from app import create_app
+from app.mod_blockchain.models import Transaction
+
+
+def transactions(count, offset=0):
+    return [
+        dict(
+            sender="sender",
+            recipient=f"recipient{number}",
+            amount=number + 1,
+            fee=number % 10,
+        )
+        for number in range(offset, offset + count)
+    ]
+
+
+def fund(blockchain):
+    """Mints the coins the transactions spend, so none is rejected for lack of funds"""
+    blockchain.new_block(proof=0, transactions=[Transaction("0", "sender", 2 ** 62)])
+
+
+def single(client, pending):
+    for transaction in pending:
+        client.post("/api/block/transactions/new", json=transaction)
+
+
+def batched(client, pending, batch_size):
+    for start in range(0, len(pending), batch_size):
+        client.post(
+            "/api/block/transactions/batch",
+            json=dict(transactions=pending[start : start + batch_size]),
+        )
+
+
+def timed(intake, *args):
+    """
+    Seconds intake takes to post the transactions to a new application, whose pool holds all of them
+    :rtype: float
+    """
+    app = create_app("testing")
+    app.extensions["blockchain"].mempool.max_size = len(args[0])
+    fund(app.extensions["blockchain"])
+    client = app.test_client()
+
+    start = perf_counter()
+    intake(client, *args)
+    seconds = perf_counter() - start
+
+    assert len(app.extensions["blockchain"].mempool) == len(args[0])
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--transactions", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    pending = transactions(args.transactions)
+
+    single_time = timed(single, pending)
+    batch_time = timed(
+        lambda client, pending: batched(client, pending, args.batch_size), pending
+    )
+
+    print(f"{args.transactions:,} transactions")
+    print(
+        f"{'single POSTs':<24}{single_time:8.3f}s{args.transactions / single_time:12,.0f} tx/s"
+    )
+    print(
+        f"{f'batches of {args.batch_size}':<24}{batch_time:8.3f}s"
+        f"{args.transactions / batch_time:12,.0f} tx/s ({single_time / batch_time:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Microbenchmark comparing the hash rate of Blockchain.valid_proof against the midstate search used by the proof of work
+engines. Run from the root of the project with:
+
+    python -m benchmarks.bench_pow
+"""
+import argparse
+from time import perf_counter
+
+from app.mod_blockchain.blockchain import Blockchain
+from app.mod_blockchain.pow import MidstateSearch
+
+# a difficulty no candidate in the benchmark range will meet, so that every candidate is hashed
+UNREACHABLE_DIFFICULTY = 256
+
+
+def bench_valid_proof(last_proof, candidates):
+    """
+    Hash rate of checking each candidate with valid_proof
+    :return: hashes per second
+    :rtype: float
+    """
+    valid_proof = Blockchain.valid_proof
+    start = perf_counter()
+    for proof in range(candidates):
+        valid_proof(last_proof, proof)
+    return candidates / (perf_counter() - start)
+
+
+def bench_midstate(last_proof, candidates):
+    """
+    Hash rate of the midstate search over the same candidates
+    :return: hashes per second
+    :rtype: float
+    """
+    search = MidstateSearch(last_proof, UNREACHABLE_DIFFICULTY)
+    start = perf_counter()
+    search.search(0, candidates)
+    return candidates / (perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--candidates", type=int, default=500000)
+    parser.add_argument("--last-proof", type=int, default=35293)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    baseline = max(
+        bench_valid_proof(args.last_proof, args.candidates) for _ in range(args.repeat)
+    )
+    midstate = max(
+        bench_midstate(args.last_proof, args.candidates) for _ in range(args.repeat)
+    )
+
+    print(f"valid_proof:     {baseline:>12,.0f} hashes/s")
+    print(f"midstate search: {midstate:>12,.0f} hashes/s ({midstate / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
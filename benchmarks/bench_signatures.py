@@ -0,0 +1,78 @@
+"""
+Signature verification throughput, verifying the signatures of a block's worth of transactions one after the other in
+the calling process against verifying them in batches across a pool of worker processes, and against looking them up in
+the cache of transactions verified when they were posted. Run from the root of the project with:
+
+    python -m benchmarks.bench_signatures --transactions 20000 --workers 4 --batch-size 256
+"""
+import argparse
+from time import perf_counter
+
+from app.mod_blockchain.signatures import (
+    SignatureVerifier,
+    VerifiedCache,
+    generate_key,
+    sign,
+)
+
+
+def transactions(count, keys=16):
+    senders = [generate_key() for _ in range(keys)]
+    return [
+        sign(senders[number % keys], f"recipient{number}", number + 1, number % 10)
+        for number in range(count)
+    ]
+
+
+def timed(verifier, signed):
+    """
+    Seconds the verifier takes to verify the signatures of the transactions, once its workers are started
+    :rtype: float
+    """
+    # starts the pool of workers
+    verifier.verify_many(signed[: verifier.batch_size + 1])
+
+    start = perf_counter()
+    results = verifier.verify_many(signed)
+    seconds = perf_counter() - start
+
+    assert all(results)
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--transactions", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+
+    signed = transactions(args.transactions)
+
+    inline_time = timed(SignatureVerifier(workers=1), signed)
+    verifier = SignatureVerifier(workers=args.workers, batch_size=args.batch_size)
+    try:
+        batch_time = timed(verifier, signed)
+    finally:
+        verifier.close()
+
+    cached = SignatureVerifier(workers=1, cache=VerifiedCache())
+    cached.verify_many(signed)
+    cached_time = timed(cached, signed)
+
+    print(f"{args.transactions:,} signatures")
+    print(
+        f"{'inline':<24}{inline_time:8.3f}s{args.transactions / inline_time:12,.0f} sig/s"
+    )
+    print(
+        f"{f'{verifier.workers} workers':<24}{batch_time:8.3f}s"
+        f"{args.transactions / batch_time:12,.0f} sig/s ({inline_time / batch_time:.1f}x)"
+    )
+    print(
+        f"{'cached':<24}{cached_time:8.3f}s"
+        f"{args.transactions / cached_time:12,.0f} sig/s ({inline_time / cached_time:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""
+Benchmark suite tracking the performance of the node between releases: the proof of work search, block hashing,
+validation of a mined chain, transaction intake through the API and serialization of the chain by GET /api/block/chain.
+Every benchmark is repeated and its best run kept, and the results are written as JSON so that the results of two
+releases can be compared. Run from the root of the project with:
+
+    python manage.py bench --blocks 1000 --output results.json
+
+or without the application manager with:
+
+    python -m benchmarks.suite --blocks 1000 --output results.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+from datetime import datetime, timezone
+from time import perf_counter
+
+from app import create_app
+from app.mod_blockchain.blockchain import Blockchain
+from app.mod_blockchain.models import Block, Transaction
+from app.mod_blockchain.pow import create_engine
+from app.mod_blockchain.validation import ChainValidator
+from benchmarks.bench_mempool import batched, fund, single, transactions
+
+# version of the layout of the results, bumped when a benchmark or one of its metrics changes meaning
+FORMAT_VERSION = 1
+
+# difficulty the synthetic chain is mined at, low enough for long chains to be mined quickly
+CHAIN_DIFFICULTY = 8
+
+BENCHMARKS = (
+    "proof_of_work",
+    "hash",
+    "valid_chain",
+    "transaction_intake",
+    "chain_serialization",
+)
+
+
+class HashCounter(object):
+    """Progress of a proof of work search which only counts the candidates hashed"""
+
+    cancelled = False
+
+    def __init__(self):
+        self.hashes = 0
+
+    def add(self, hashes):
+        self.hashes += hashes
+
+
+def best(function, repeat):
+    """
+    Runs a benchmark repeat times
+    :param function: Benchmark run, returns its seconds and metrics
+    :type function callable
+    :param repeat: Number of runs
+    :type repeat int
+    :return: Metrics of the fastest run
+    :rtype: dict
+    """
+    return min((function() for _ in range(repeat)), key=lambda run: run["seconds"])
+
+
+def mined_chain(blocks, transactions_per_block):
+    """
+    Mines a valid chain, every block but the first holding the given number of transactions and every block its
+    mining reward. The transactions of a block spend half the rewards of the blocks before it, the first block has
+    none to spend
+    :param blocks: Number of blocks after the genesis block
+    :type blocks int
+    :param transactions_per_block: Number of transactions in each block
+    :type transactions_per_block int
+    :return: Encoded blocks of the chain, decoded by each run so that every run hashes them again
+    :rtype: list
+    """
+    blockchain = Blockchain(difficulty=CHAIN_DIFFICULTY, retarget_interval=0)
+
+    for index in range(blocks):
+        proof = blockchain.proof_of_work(blockchain.last_block.proof)
+        transactions = [
+            Transaction("miner", f"recipient{number}", 0.5 / transactions_per_block)
+            for number in range(transactions_per_block if index else 0)
+        ]
+        blockchain.new_block(
+            proof, transactions=transactions + [Transaction("0", "miner", 1)]
+        )
+
+    return [block.encode() for block in blockchain.chain]
+
+
+def bench_proof_of_work(config, proofs, difficulty, repeat):
+    """
+    Hash rate of the configured proof of work engine, searching the proofs following proofs consecutive last proofs
+    :rtype: dict
+    """
+    engine = create_engine(config)
+
+    def run():
+        counter = HashCounter()
+        start = perf_counter()
+        for last_proof in range(proofs):
+            engine.search(last_proof, difficulty, counter)
+        seconds = perf_counter() - start
+        return dict(
+            seconds=seconds,
+            proofs=proofs,
+            difficulty=difficulty,
+            hashes=counter.hashes,
+            hashes_per_second=counter.hashes / seconds,
+        )
+
+    try:
+        return best(run, repeat)
+    finally:
+        engine.close()
+
+
+def bench_hash(encoded, repeat):
+    """
+    Rate at which blocks that have not been hashed yet are hashed
+    :rtype: dict
+    """
+
+    def run():
+        chain = [Block.decode(block) for block in encoded]
+        start = perf_counter()
+        for block in chain:
+            Blockchain.hash(block)
+        seconds = perf_counter() - start
+        return dict(
+            seconds=seconds, blocks=len(chain), blocks_per_second=len(chain) / seconds
+        )
+
+    return best(run, repeat)
+
+
+def bench_valid_chain(config, encoded, repeat):
+    """
+    Rate at which the configured validator validates the mined chain, as it validates the chain of a peer
+    :rtype: dict
+    """
+    blockchain = Blockchain(
+        difficulty=CHAIN_DIFFICULTY,
+        retarget_interval=0,
+        validator=ChainValidator.from_config(config),
+    )
+
+    def run():
+        chain = [Block.decode(block) for block in encoded]
+        start = perf_counter()
+        valid = blockchain.valid_chain(chain)
+        seconds = perf_counter() - start
+        assert valid, "mined chain is invalid"
+        return dict(
+            seconds=seconds, blocks=len(chain), blocks_per_second=len(chain) / seconds
+        )
+
+    return best(run, repeat)
+
+
+def bench_transaction_intake(count, batch_size, repeat):
+    """
+    Transactions per second accepted by a new application, posted one at a time and posted in batches
+    :rtype: dict
+    """
+    pending = transactions(count)
+
+    def intake(post):
+        def run():
+            app = create_app("testing")
+            blockchain = app.extensions["blockchain"]
+            blockchain.mempool.max_size = count
+            fund(blockchain)
+            client = app.test_client()
+
+            start = perf_counter()
+            post(client, pending)
+            seconds = perf_counter() - start
+
+            assert len(blockchain.mempool) == count, "transactions were rejected"
+            return dict(
+                seconds=seconds,
+                transactions=count,
+                transactions_per_second=count / seconds,
+            )
+
+        return best(run, repeat)
+
+    return dict(
+        single=intake(single),
+        batched=dict(
+            intake(lambda client, pending: batched(client, pending, batch_size)),
+            batch_size=batch_size,
+        ),
+    )
+
+
+def bench_chain_serialization(encoded, repeat):
+    """
+    Time GET /api/block/chain takes to serialize the whole mined chain as JSON
+    :rtype: dict
+    """
+    app = create_app("testing")
+    app.extensions["blockchain"].chain = [Block.decode(block) for block in encoded]
+    client = app.test_client()
+
+    def run():
+        start = perf_counter()
+        response = client.get("/api/block/chain")
+        size = len(response.get_data())
+        seconds = perf_counter() - start
+        assert response.status_code == 200
+        return dict(
+            seconds=seconds,
+            blocks=len(encoded),
+            bytes=size,
+            blocks_per_second=len(encoded) / seconds,
+        )
+
+    return best(run, repeat)
+
+
+def run(
+    config,
+    blocks=1000,
+    transactions=10,
+    proofs=20,
+    difficulty=16,
+    intake=5000,
+    batch_size=500,
+    repeat=3,
+    only=BENCHMARKS,
+):
+    """
+    Runs the benchmark suite
+    :param config: Application configuration, selecting the proof of work engine and chain validator benchmarked
+    :type config dict
+    :param blocks: (Optional) Length of the mined chain hashed, validated and serialized
+    :type blocks int
+    :param transactions: (Optional) Number of transactions in each block of the mined chain
+    :type transactions int
+    :param proofs: (Optional) Number of proofs searched by the proof of work benchmark
+    :type proofs int
+    :param difficulty: (Optional) Difficulty of the proofs searched, in leading zero bits
+    :type difficulty int
+    :param intake: (Optional) Number of transactions posted by the intake benchmark
+    :type intake int
+    :param batch_size: (Optional) Number of transactions in each batch posted
+    :type batch_size int
+    :param repeat: (Optional) Number of runs of each benchmark, the fastest is kept
+    :type repeat int
+    :param only: (Optional) Names of the benchmarks to run
+    :type only tuple
+    :return: Results, with the parameters and environment they were measured in
+    :rtype: dict
+    """
+    unknown = set(only) - set(BENCHMARKS)
+    if unknown:
+        raise ValueError(f"Unknown benchmarks {', '.join(sorted(unknown))}")
+
+    parameters = dict(
+        blocks=blocks,
+        transactions=transactions,
+        proofs=proofs,
+        difficulty=difficulty,
+        intake=intake,
+        batch_size=batch_size,
+        repeat=repeat,
+        pow_engine=config.get("POW_ENGINE", "default"),
+    )
+
+    encoded = None
+    if {"hash", "valid_chain", "chain_serialization"} & set(only):
+        encoded = mined_chain(blocks, transactions)
+
+    benchmarks = dict(
+        proof_of_work=lambda: bench_proof_of_work(config, proofs, difficulty, repeat),
+        hash=lambda: bench_hash(encoded, repeat),
+        valid_chain=lambda: bench_valid_chain(config, encoded, repeat),
+        transaction_intake=lambda: bench_transaction_intake(intake, batch_size, repeat),
+        chain_serialization=lambda: bench_chain_serialization(encoded, repeat),
+    )
+
+    return dict(
+        format=FORMAT_VERSION,
+        date=datetime.now(timezone.utc).isoformat(),
+        environment=dict(
+            python=platform.python_version(),
+            implementation=platform.python_implementation(),
+            platform=platform.platform(),
+            cpus=os.cpu_count(),
+        ),
+        parameters=parameters,
+        results={name: benchmarks[name]() for name in BENCHMARKS if name in only},
+    )
+
+
+def write(results, output=None):
+    """
+    Writes the results as JSON
+    :param results: Results of the suite
+    :type results dict
+    :param output: (Optional) Path of the file written, the results are written to stdout if not given
+    :type output str
+    """
+    if output is None:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--blocks", type=int, default=1000)
+    parser.add_argument("--transactions", type=int, default=10)
+    parser.add_argument("--proofs", type=int, default=20)
+    parser.add_argument("--difficulty", type=int, default=16)
+    parser.add_argument("--intake", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument("--output")
+    parser.add_argument("--config", default=os.environ.get("FLASK_CONFIG", "default"))
+    args = parser.parse_args()
+
+    config = create_app(args.config).config
+    results = run(
+        config,
+        blocks=args.blocks,
+        transactions=args.transactions,
+        proofs=args.proofs,
+        difficulty=args.difficulty,
+        intake=args.intake,
+        batch_size=args.batch_size,
+        repeat=args.repeat,
+        only=args.only,
+    )
+    write(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
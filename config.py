@@ -30,6 +30,49 @@ class Config(metaclass=ABCMeta):
     :cvar ROOT_DIRECTORY
     :cvar CSRF_ENABLED
     :cvar CSRF_SESSION_KEY
+    :cvar POW_ENGINE Proof of work engine used for mining, either serial or parallel
+    :cvar POW_WORKERS Number of worker processes used by the parallel engine, defaults to the number of CPUs
+    :cvar POW_CHUNK_SIZE Number of candidate proofs handed to a worker at a time
+    :cvar DIFFICULTY Difficulty of the genesis block, in leading zero bits of the proof hash
+    :cvar RETARGET_INTERVAL Number of blocks between difficulty retargets, 0 disables retargeting
+    :cvar TARGET_BLOCK_TIME Seconds a block should take to mine, the difficulty is retargeted towards it
+    :cvar CHAIN_STORE_PATH Path of the append-only log the chain is persisted to, the chain only lives in memory if unset
+    :cvar CHAIN_STORE_SYNC_EVERY Number of blocks appended to the log between fsyncs
+    :cvar VALIDATION_WORKERS Number of worker processes validating peer chains, defaults to the number of CPUs
+    :cvar VALIDATION_CHUNK_SIZE Number of blocks validated by a worker at a time
+    :cvar VALIDATION_TIMEOUT Seconds a validation across the workers may take before the chain is validated serially
+    :cvar PEER_TIMEOUT Seconds to wait on a single peer
+    :cvar CONSENSUS_DEADLINE Seconds a consensus round may spend fetching chains from all peers
+    :cvar PEER_WORKERS Number of peers requested at the same time
+    :cvar CONSENSUS_MODE Either full, fetching whole chains from peers, incremental, fetching only the blocks after
+    the fork point with each peer, or headers, fetching only the headers after the fork point and the blocks of the
+    chain picked
+    :cvar SYNC_PAGE_SIZE Number of blocks fetched from a peer at a time in incremental mode
+    :cvar CHAIN_PAGE_LIMIT Most blocks served for a single range of the chain
+    :cvar HEADER_PAGE_LIMIT Most headers served for a single range of the chain
+    :cvar MEMPOOL_MAX_SIZE Most pending transactions held, transactions with the lowest fees are evicted first
+    :cvar BLOCK_MAX_TRANSACTIONS Most transactions in a block, mining reward included
+    :cvar TRANSACTION_BATCH_LIMIT Most transactions posted in a single batch
+    :cvar INDEX_SNAPSHOT_EVERY Number of blocks added between snapshots of the balance and lookup indexes of a stored
+    chain
+    :cvar SHARED_STATE_ADDRESS Address of the state server holding the chain shared by the worker processes of this
+    host, host:port or the path of a Unix socket. Every process creates its own chain if unset
+    :cvar SHARED_STATE_KEY Key authenticating the worker processes to the state server, required along with
+    SHARED_STATE_ADDRESS and distinct from SECRET_KEY
+    :cvar METRICS_ENABLED Whether metrics are recorded and exposed at /metrics
+    :cvar BLOCK_TREE_DEPTH Number of blocks below the tip of our chain kept in the block tree along with the side
+    branches forking from them, side branches forking further back are pruned
+    :cvar REQUIRE_SIGNATURES Whether transactions must be signed by their sender, at intake and in the blocks of peers
+    :cvar SIGNATURE_WORKERS Number of worker processes verifying signatures, defaults to the number of CPUs
+    :cvar SIGNATURE_BATCH_SIZE Number of signatures verified by a worker at a time
+    :cvar SIGNATURE_CACHE_MAX_BYTES Memory taken by the cache of the ids of validly signed transactions, shared by
+    intake and block validation. 0 disables the cache
+    :cvar NODE_ADDRESS Address the registered nodes reach this node at, host:port. New blocks and transactions are
+    announced to them with it, announcements are disabled if unset
+    :cvar GOSSIP_FANOUT Most registered nodes a new block or transaction is announced to, picked at random
+    :cvar GOSSIP_SEEN_SIZE Number of hashes of announced blocks and transactions remembered, so that each is fetched and
+    relayed once
+    :cvar GOSSIP_WORKERS Number of threads sending announcements and fetching what they announce
     """
 
     __abstract__ = True
@@ -38,6 +81,42 @@ class Config(metaclass=ABCMeta):
     ROOT_DIRECTORY = APP_ROOT
     CSRF_ENABLED = True
     CSRF_SESSION_KEY = os.environ.get("CSRF_SESSION_KEY")
+    POW_ENGINE = os.environ.get("POW_ENGINE", "serial")
+    POW_WORKERS = int(os.environ.get("POW_WORKERS", 0)) or None
+    POW_CHUNK_SIZE = int(os.environ.get("POW_CHUNK_SIZE", 10000))
+    DIFFICULTY = int(os.environ.get("DIFFICULTY", 16))
+    RETARGET_INTERVAL = int(os.environ.get("RETARGET_INTERVAL", 10))
+    TARGET_BLOCK_TIME = float(os.environ.get("TARGET_BLOCK_TIME", 10))
+    CHAIN_STORE_PATH = os.environ.get("CHAIN_STORE_PATH")
+    CHAIN_STORE_SYNC_EVERY = int(os.environ.get("CHAIN_STORE_SYNC_EVERY", 100))
+    VALIDATION_WORKERS = int(os.environ.get("VALIDATION_WORKERS", 0)) or None
+    VALIDATION_CHUNK_SIZE = int(os.environ.get("VALIDATION_CHUNK_SIZE", 5000))
+    VALIDATION_TIMEOUT = float(os.environ.get("VALIDATION_TIMEOUT", 600))
+    PEER_TIMEOUT = float(os.environ.get("PEER_TIMEOUT", 5))
+    CONSENSUS_DEADLINE = float(os.environ.get("CONSENSUS_DEADLINE", 30))
+    PEER_WORKERS = int(os.environ.get("PEER_WORKERS", 8))
+    CONSENSUS_MODE = os.environ.get("CONSENSUS_MODE", "full")
+    SYNC_PAGE_SIZE = int(os.environ.get("SYNC_PAGE_SIZE", 500))
+    CHAIN_PAGE_LIMIT = int(os.environ.get("CHAIN_PAGE_LIMIT", 1000))
+    HEADER_PAGE_LIMIT = int(os.environ.get("HEADER_PAGE_LIMIT", 10000))
+    MEMPOOL_MAX_SIZE = int(os.environ.get("MEMPOOL_MAX_SIZE", 10000))
+    BLOCK_MAX_TRANSACTIONS = int(os.environ.get("BLOCK_MAX_TRANSACTIONS", 1000))
+    TRANSACTION_BATCH_LIMIT = int(os.environ.get("TRANSACTION_BATCH_LIMIT", 10000))
+    INDEX_SNAPSHOT_EVERY = int(os.environ.get("INDEX_SNAPSHOT_EVERY", 1000))
+    SHARED_STATE_ADDRESS = os.environ.get("SHARED_STATE_ADDRESS")
+    SHARED_STATE_KEY = os.environ.get("SHARED_STATE_KEY")
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+    BLOCK_TREE_DEPTH = int(os.environ.get("BLOCK_TREE_DEPTH", 100))
+    REQUIRE_SIGNATURES = os.environ.get("REQUIRE_SIGNATURES", "true").lower() == "true"
+    SIGNATURE_WORKERS = int(os.environ.get("SIGNATURE_WORKERS", 0)) or None
+    SIGNATURE_BATCH_SIZE = int(os.environ.get("SIGNATURE_BATCH_SIZE", 256))
+    SIGNATURE_CACHE_MAX_BYTES = int(
+        os.environ.get("SIGNATURE_CACHE_MAX_BYTES", 16 * 1024 * 1024)
+    )
+    NODE_ADDRESS = os.environ.get("NODE_ADDRESS")
+    GOSSIP_FANOUT = int(os.environ.get("GOSSIP_FANOUT", 8))
+    GOSSIP_SEEN_SIZE = int(os.environ.get("GOSSIP_SEEN_SIZE", 100000))
+    GOSSIP_WORKERS = int(os.environ.get("GOSSIP_WORKERS", 4))
 
     @staticmethod
     def init_app(app):
@@ -62,6 +141,9 @@ class TestingConfig(Config):
     WTF_CSRF_ENABLED = False
     CSRF_ENABLED = False
     PRESERVE_CONTEXT_ON_EXCEPTION = False
+    CHAIN_STORE_PATH = None
+    # the tests sign their transactions where signatures are what they test
+    REQUIRE_SIGNATURES = False
 
 
 class ProductionConfig(Config):
@@ -63,6 +63,60 @@ def test(cover=False):
         cov.erase()
 
 
+@manager.command
+def stateserver():
+    """
+    Runs the state server holding the chain shared by the worker processes of this host, which connect to it with
+    SHARED_STATE_ADDRESS
+    """
+    from app.mod_blockchain.shared import serve
+    from app.mod_blockchain.views import node_identifier
+
+    serve(app.config, node_identifier)
+
+
+@manager.command
+def keygen():
+    """
+    Generates a private key to sign transactions with, printing it along with its address
+    """
+    from app.mod_blockchain.signatures import address_of, export_key, generate_key
+
+    private_key = generate_key()
+    print(f"private key: {export_key(private_key)}")
+    print(f"address:     {address_of(private_key)}")
+
+
+@manager.command
+def bench(
+    blocks=1000,
+    transactions=10,
+    proofs=20,
+    difficulty=16,
+    intake=5000,
+    batch_size=500,
+    repeat=3,
+    output=None,
+):
+    """
+    Runs the benchmark suite: proof of work, block hashing, chain validation, transaction intake and chain
+    serialization. Results are written as JSON to output, or to stdout, to be compared between releases
+    """
+    from benchmarks.suite import run, write
+
+    results = run(
+        app.config,
+        blocks=blocks,
+        transactions=transactions,
+        proofs=proofs,
+        difficulty=difficulty,
+        intake=intake,
+        batch_size=batch_size,
+        repeat=repeat,
+    )
+    write(results, output)
+
+
 @manager.command
 def profile(length=25, profile_dir=None):
     """
@@ -70,9 +124,9 @@ def profile(length=25, profile_dir=None):
     bottlenecks in web application. It uses the profile or cProfile
     module to do the profiling and writes the stats to the stream provided
 
-    see: http://werkzeug.pocoo.org/docs/0.9/contrib/profiler/
+    see: https://werkzeug.palletsprojects.com/en/stable/middleware/profiler/
     """
-    from werkzeug.contrib.profiler import ProfilerMiddleware
+    from werkzeug.middleware.profiler import ProfilerMiddleware
 
     app.config["PROFILE"] = True
     app.wsgi_app = ProfilerMiddleware(
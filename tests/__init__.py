@@ -1,7 +1,55 @@
+import re
 import unittest
 from flask_testing import TestCase
 from app import create_app
-from app.mod_blockchain.blockchain import Blockchain
+from app.mod_blockchain.blockchain import MINING_REWARD, Blockchain
+from app.mod_blockchain.mempool import TransactionRejected
+from app.mod_blockchain.models import Transaction
+
+
+def fund(blockchain, address, amount):
+    """Forges a block minting coins to an address, so it has the funds to send transactions"""
+    blockchain.new_block(proof=0, transactions=[Transaction("0", address, amount)])
+
+
+def rejection(blockchain, *args, **kwargs):
+    """Reason the blockchain turns a new transaction away for, None if it is accepted"""
+    try:
+        blockchain.new_transaction(*args, **kwargs)
+    except TransactionRejected as e:
+        return e.reason
+    return None
+
+
+def sample(text, name, **labels):
+    """Value of a sample of rendered metrics, None if there is no such sample"""
+    label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    pattern = (
+        "^" + re.escape(name + (f"{{{label_text}}}" if labels else "")) + r" (\S+)$"
+    )
+    match = re.search(pattern, text, re.MULTILINE)
+    return None if match is None else float(match.group(1))
+
+
+def mine_block(blockchain, transactions):
+    """
+    Mines a block holding the given transactions and the mining reward they pay without checking them, as a dishonest
+    node would
+    """
+    proof = blockchain.proof_of_work(blockchain.last_block.proof)
+    fees = sum(transaction.fee for transaction in transactions)
+    reward = Transaction("0", "miner", MINING_REWARD + fees)
+    return blockchain.new_block(proof, transactions=transactions + [reward])
+
+
+def mined_chain(blocks, difficulty=4, base=None):
+    """Chain of a miner mining the given number of blocks, on top of a base chain if given"""
+    miner = Blockchain(difficulty=difficulty, retarget_interval=0)
+    if base is not None:
+        miner.adopt_chain(base)
+    for _ in range(blocks):
+        miner.mine("miner")
+    return list(miner.chain)
 
 
 class ContextTestCase(TestCase):
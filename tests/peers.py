@@ -0,0 +1,49 @@
+"""
+Stand-in peers for tests. A StandInPeer is a real instance of the application served
+over HTTP on a free local port, holding a given chain and answering every request after
+a configurable latency
+"""
+from threading import Thread
+from time import sleep
+from flask import request
+from werkzeug.serving import make_server
+from app import create_app
+
+
+class StandInPeer(object):
+    def __init__(self, chain=None, latency=0.0):
+        """
+        :param chain: (Optional) Chain the peer holds, defaults to a new chain
+        :type chain list
+        :param latency: (Optional) Seconds the peer waits before answering a request
+        :type latency float
+        """
+        self.latency = latency
+        self.requests = []
+        self.app = create_app("testing")
+        self.blockchain = self.app.extensions["blockchain"]
+
+        if chain is not None:
+            self.blockchain.adopt_chain(chain)
+
+        @self.app.before_request
+        def delay():
+            self.requests.append(request.full_path)
+            if self.latency:
+                sleep(self.latency)
+
+        self.server = make_server("127.0.0.1", 0, self.app, threaded=True)
+        self.address = f"127.0.0.1:{self.server.server_port}"
+        self.thread = Thread(
+            target=self.server.serve_forever,
+            kwargs=dict(poll_interval=0.05),
+            daemon=True,
+        )
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,110 @@
+from collections import defaultdict
+from random import Random
+from unittest import TestCase, main
+
+from app.mod_blockchain.balances import BalanceIndex
+from app.mod_blockchain.blockchain import Blockchain
+from app.mod_blockchain.mempool import OVERDRAFT
+from app.mod_blockchain.models import Transaction
+from tests import fund, rejection
+
+ADDRESSES = ["a", "b", "c", "d", "e"]
+
+
+def rescan(chain):
+    """Balances computed from every transaction of the chain"""
+    balances = defaultdict(int)
+    for block in chain:
+        for transaction in block.transactions:
+            if transaction.sender != "0":
+                balances[transaction.sender] -= transaction.amount + transaction.fee
+            balances[transaction.recipient] += transaction.amount
+    return {address: balance for address, balance in balances.items() if balance}
+
+
+class TestBalanceIndex(TestCase):
+    def setUp(self):
+        self.random = Random(1530568221)
+        self.blockchain = Blockchain(retarget_interval=0)
+
+    def random_transactions(self):
+        transactions = [
+            Transaction(
+                sender=self.random.choice(ADDRESSES),
+                recipient=self.random.choice(ADDRESSES),
+                amount=self.random.randint(1, 50),
+                fee=self.random.randint(0, 3),
+            )
+            for _ in range(self.random.randint(0, 6))
+        ]
+        reward = Transaction("0", self.random.choice(ADDRESSES), 100)
+        return transactions + [reward]
+
+    def extend(self, blockchain, blocks):
+        for _ in range(blocks):
+            blockchain.new_block(proof=0, transactions=self.random_transactions())
+
+    def test_index_matches_rescan_after_random_forks(self):
+        self.extend(self.blockchain, 20)
+
+        for _ in range(30):
+            fork = self.random.randint(1, len(self.blockchain))
+            branch = Blockchain(retarget_interval=0)
+            branch.adopt_chain(self.blockchain.chain[:fork])
+            self.extend(branch, self.random.randint(1, 8))
+
+            if self.random.random() < 0.2:
+                self.blockchain.adopt_chain(branch.chain)
+            else:
+                self.blockchain.splice_chain(fork, branch.chain[fork:])
+
+            assert self.blockchain.balances.to_dict() == rescan(self.blockchain.chain)
+            assert branch.balances.to_dict() == rescan(branch.chain)
+
+    def test_revert_undoes_apply(self):
+        self.extend(self.blockchain, 5)
+        index = BalanceIndex(self.blockchain.chain)
+
+        for block in reversed(list(self.blockchain.chain)[2:]):
+            index.revert(block)
+
+        assert index.to_dict() == rescan(list(self.blockchain.chain)[:2])
+
+
+class TestOverdrafts(TestCase):
+    def setUp(self):
+        self.blockchain = Blockchain(difficulty=4, retarget_interval=0)
+        fund(self.blockchain, "a", 10)
+
+    def test_transaction_within_funds_is_accepted(self):
+        assert self.blockchain.new_transaction("a", "b", 9, fee=1) is not None
+        assert self.blockchain.mempool.spending("a") == 10
+
+    def test_overdraft_is_rejected(self):
+        assert rejection(self.blockchain, "a", "b", 10, fee=1) == OVERDRAFT
+        assert rejection(self.blockchain, "b", "a", 1) == OVERDRAFT
+        assert len(self.blockchain.mempool) == 0
+
+    def test_pending_transactions_are_counted(self):
+        assert self.blockchain.new_transaction("a", "b", 6) is not None
+        assert rejection(self.blockchain, "a", "c", 6) == OVERDRAFT
+        assert (
+            self.blockchain.new_transactions(
+                [Transaction("a", "c", 3), Transaction("a", "d", 3)]
+            )
+            == 1
+        )
+
+    def test_mined_transactions_move_balances(self):
+        self.blockchain.new_transaction("a", "b", 6, fee=2)
+
+        self.blockchain.mine("miner")
+
+        assert self.blockchain.balance("a") == 2
+        assert self.blockchain.balance("b") == 6
+        assert self.blockchain.balance("miner") == 3
+        assert self.blockchain.mempool.spending("a") == 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import json
+from io import StringIO
+from unittest import TestCase, main
+from unittest.mock import patch
+from uuid import uuid4
+
+from app import create_app
+from benchmarks.bench_memory import dict_chain, measure, model_chain
+from benchmarks.suite import BENCHMARKS, run, write
+
+
+class TestBenchmarkSuite(TestCase):
+    def setUp(self):
+        self.config = create_app("testing").config
+
+    def test_results_are_written_as_json(self):
+        results = run(
+            self.config,
+            blocks=5,
+            transactions=2,
+            proofs=2,
+            difficulty=4,
+            intake=10,
+            batch_size=5,
+            repeat=1,
+        )
+
+        assert set(results["results"]) == set(BENCHMARKS)
+        assert results["parameters"]["blocks"] == 5
+        assert results["results"]["valid_chain"]["blocks"] == 6
+        assert results["results"]["proof_of_work"]["hashes"] > 0
+        assert results["results"]["transaction_intake"]["batched"]["transactions"] == 10
+
+        with patch("sys.stdout", new=StringIO()) as stdout:
+            write(results)
+        assert json.loads(stdout.getvalue()) == results
+
+    def test_only_selected_benchmarks_run(self):
+        results = run(self.config, proofs=1, difficulty=1, only=("proof_of_work",))
+
+        assert list(results["results"]) == ["proof_of_work"]
+
+        with self.assertRaises(ValueError):
+            run(self.config, only=("mining",))
+
+
+class TestMemoryBenchmark(TestCase):
+    def test_models_are_smaller_than_dicts(self):
+        addresses = [uuid4().hex for _ in range(100)]
+        arguments = (addresses, 5000, 100)
+
+        # computing the Merkle roots of the blocks must not store anything on their transactions
+        assert 1.5 * measure(model_chain, *arguments) < measure(dict_chain, *arguments)
+
+
+if __name__ == "__main__":
+    main()
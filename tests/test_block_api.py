@@ -1,7 +1,21 @@
 import json
 from unittest import main, skip
-from unittest.mock import patch
-from tests import BaseTestCase
+from time import sleep
+from app.mod_blockchain.encoding import decode_records
+from app.mod_blockchain.merkle import verify_proof
+from app.mod_blockchain.models import Block, Header
+from app.mod_blockchain.pow import ProofOfWork
+from tests import BaseTestCase, fund
+
+
+class UntilCancelledProofOfWork(ProofOfWork):
+    """Proof of work engine that never finds a proof, it searches until it is cancelled"""
+
+    def search(self, last_proof, difficulty=None, progress=None):
+        while not progress.cancelled:
+            progress.add(1)
+            sleep(0.01)
+        return None
 
 
 class BlockApiTestCases(BaseTestCase):
@@ -9,6 +23,7 @@ class BlockApiTestCases(BaseTestCase):
 
     def test_new_transaction_returns_201_on_post_request(self):
         """Test new transaction returns response of 201 for POST request with correct arguments"""
+        fund(self.app.extensions["blockchain"], "onluncd", 100)
         response = self.client.post(
             "/api/block/transactions/new",
             json=dict(sender="onluncd", recipient="bouncda", amount=100),
@@ -18,6 +33,236 @@ class BlockApiTestCases(BaseTestCase):
             "Transaction will be added to block ", response.data.decode("utf-8")
         )
 
+    def test_new_transaction_returns_200_when_already_pending(self):
+        fund(self.app.extensions["blockchain"], "onluncd", 100)
+        values = dict(sender="onluncd", recipient="bouncda", amount=100)
+        first = self.client.post("/api/block/transactions/new", json=values)
+        second = self.client.post("/api/block/transactions/new", json=values)
+
+        self.assertEqual(first.status_code, 201)
+        self.assert200(second)
+        self.assertEqual(first.json["id"], second.json["id"])
+
+    def test_new_transaction_returns_400_on_negative_fee(self):
+        response = self.client.post(
+            "/api/block/transactions/new",
+            json=dict(sender="onluncd", recipient="bouncda", amount=100, fee=-1),
+        )
+        self.assert400(response)
+
+    def test_new_transaction_returns_400_on_amount_that_is_not_finite(self):
+        fund(self.app.extensions["blockchain"], "onluncd", 100)
+        for number in ("nan", "inf", "-inf"):
+            for field in ("amount", "fee"):
+                values = dict(sender="onluncd", recipient="bouncda", amount=10, fee=0)
+                values[field] = float(number)
+                # json writes NaN and Infinity, which the API parses as floats
+                response = self.client.post(
+                    "/api/block/transactions/new",
+                    data=json.dumps(values),
+                    content_type="application/json",
+                )
+                self.assert400(response)
+
+        self.assertEqual(len(self.app.extensions["blockchain"].mempool), 0)
+
+    def test_new_transaction_returns_400_on_transaction_that_cannot_be_encoded(self):
+        fund(self.app.extensions["blockchain"], "onluncd", 100)
+        valid = dict(sender="onluncd", recipient="bouncda", amount=10)
+
+        for values in (
+            dict(valid, sender=1),
+            dict(valid, recipient=["bouncda"]),
+            dict(valid, recipient="b" * 2 ** 15),
+            dict(valid, amount=2 ** 2100),
+            dict(valid, signature="zz" * 64),
+            dict(valid, signature="ab" * 63),
+        ):
+            response = self.client.post("/api/block/transactions/new", json=values)
+            self.assert400(response)
+
+        response = self.client.post(
+            "/api/block/transactions/batch",
+            json=dict(transactions=[valid, dict(valid, amount=2 ** 2100)]),
+        )
+        self.assert400(response)
+        self.assertEqual(response.json["invalid"], [1])
+        self.assertEqual(len(self.app.extensions["blockchain"].mempool), 0)
+
+    def test_transaction_batch_returns_accepted_and_rejected(self):
+        fund(self.app.extensions["blockchain"], "onluncd", 100)
+        transactions = [
+            dict(sender="onluncd", recipient="bouncda", amount=amount, fee=amount % 3)
+            for amount in range(1, 11)
+        ]
+
+        response = self.client.post(
+            "/api/block/transactions/batch",
+            json=dict(transactions=transactions + transactions[:4]),
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json["accepted"], 10)
+        self.assertEqual(response.json["rejected"], 4)
+        self.assertEqual(len(self.app.extensions["blockchain"].mempool), 10)
+
+    def test_transaction_batch_returns_400_on_invalid_transaction(self):
+        transactions = [
+            dict(sender="onluncd", recipient="bouncda", amount=1),
+            dict(sender="onluncd", amount=1),
+        ]
+
+        response = self.client.post(
+            "/api/block/transactions/batch", json=dict(transactions=transactions)
+        )
+
+        self.assert400(response)
+        self.assertEqual(response.json["invalid"], [1])
+        self.assertEqual(len(self.app.extensions["blockchain"].mempool), 0)
+
+    def test_transaction_batch_returns_413_above_limit(self):
+        self.app.config["TRANSACTION_BATCH_LIMIT"] = 2
+        transactions = [
+            dict(sender="onluncd", recipient="bouncda", amount=amount)
+            for amount in range(3)
+        ]
+
+        response = self.client.post(
+            "/api/block/transactions/batch", json=dict(transactions=transactions)
+        )
+
+        self.assertEqual(response.status_code, 413)
+
+    def test_new_transaction_returns_409_on_overdraft(self):
+        fund(self.app.extensions["blockchain"], "onluncd", 100)
+
+        response = self.client.post(
+            "/api/block/transactions/new",
+            json=dict(sender="onluncd", recipient="bouncda", amount=100, fee=1),
+        )
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json["available"], 100)
+
+    def test_new_transaction_returns_200_when_already_pending(self):
+        fund(self.app.extensions["blockchain"], "onluncd", 100)
+        values = dict(sender="onluncd", recipient="bouncda", amount=10)
+
+        first = self.client.post("/api/block/transactions/new", json=values)
+        second = self.client.post("/api/block/transactions/new", json=values)
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json["id"], first.json["id"])
+
+    def test_new_transaction_returns_503_when_pool_is_full(self):
+        blockchain = self.app.extensions["blockchain"]
+        fund(blockchain, "onluncd", 100)
+        blockchain.mempool.max_size = 1
+
+        for amount, status in ((10, 201), (20, 503)):
+            response = self.client.post(
+                "/api/block/transactions/new",
+                json=dict(sender="onluncd", recipient="bouncda", amount=amount),
+            )
+            self.assertEqual(response.status_code, status)
+
+    def test_get_balance_returns_balance_and_pending(self):
+        fund(self.app.extensions["blockchain"], "onluncd", 100)
+        self.client.post(
+            "/api/block/transactions/new",
+            json=dict(sender="onluncd", recipient="bouncda", amount=30, fee=2),
+        )
+
+        response = self.client.get("/api/block/balances/onluncd")
+
+        self.assert200(response)
+        self.assertEqual(
+            response.json,
+            dict(address="onluncd", balance=100, pending=32, available=68),
+        )
+
+    def test_get_balances_of_several_addresses(self):
+        fund(self.app.extensions["blockchain"], "onluncd", 100)
+
+        response = self.client.get(
+            "/api/block/balances?address=onluncd&address=bouncda"
+        )
+
+        self.assert200(response)
+        self.assertEqual(
+            [balance["balance"] for balance in response.json["balances"]], [100, 0]
+        )
+        self.assert400(self.client.get("/api/block/balances"))
+
+    def test_get_transaction_by_id(self):
+        blockchain = self.app.extensions["blockchain"]
+        fund(blockchain, "onluncd", 100)
+        values = dict(sender="onluncd", recipient="bouncda", amount=10)
+        transaction_id = self.client.post(
+            "/api/block/transactions/new", json=values
+        ).json["id"]
+
+        response = self.client.get(f"/api/block/transactions/{transaction_id}")
+        self.assert200(response)
+        self.assertEqual(response.json["status"], "pending")
+
+        blockchain.new_block(proof=0)
+
+        response = self.client.get(f"/api/block/transactions/{transaction_id}")
+        self.assert200(response)
+        self.assertEqual(response.json["status"], "confirmed")
+        self.assertEqual(
+            response.json["locations"],
+            [dict(block=3, position=0, transaction=values)],
+        )
+
+        self.assert404(self.client.get("/api/block/transactions/abc"))
+
+    def test_get_transaction_proof(self):
+        blockchain = self.app.extensions["blockchain"]
+        fund(blockchain, "onluncd", 100)
+        for amount in range(1, 6):
+            blockchain.new_transaction("onluncd", "bouncda", amount)
+        blockchain.new_block(proof=0)
+        transaction = blockchain.last_block.transactions[3]
+
+        response = self.client.get(f"/api/block/transactions/{transaction.id}/proof")
+        self.assert200(response)
+
+        data = response.json
+        self.assertEqual(data["position"], 3)
+        self.assertEqual(data["hash"], blockchain.last_block.hash)
+        self.assertNotIn("transactions", data["header"])
+        self.assertTrue(
+            verify_proof(transaction.id, data["proof"], data["header"]["merkle_root"])
+        )
+
+        self.assert404(self.client.get("/api/block/transactions/abc/proof"))
+
+    def test_get_address_transactions_pages(self):
+        blockchain = self.app.extensions["blockchain"]
+        fund(blockchain, "onluncd", 100)
+        for amount in range(1, 4):
+            blockchain.new_transaction("onluncd", "bouncda", amount)
+            blockchain.new_block(proof=0)
+
+        response = self.client.get(
+            "/api/block/addresses/bouncda/transactions?from=1&limit=1"
+        )
+        self.assert200(response)
+        self.assertEqual(response.json["count"], 3)
+        self.assertEqual(response.json["next"], 2)
+        self.assertEqual(
+            [t["transaction"]["amount"] for t in response.json["transactions"]], [2]
+        )
+
+        response = self.client.get("/api/block/addresses/bouncda/transactions?from=2")
+        self.assertIsNone(response.json["next"])
+        self.assert400(
+            self.client.get("/api/block/addresses/bouncda/transactions?limit=0")
+        )
+
     def test_new_transaction_returns_400_on_invalid_post_request(self):
         """Test new transaction returns 400 on invalid sender address"""
         # if sender is None
@@ -56,31 +301,67 @@ class BlockApiTestCases(BaseTestCase):
         data = json.loads(response.data.decode("utf-8"))
         self.assertEqual(data.get("message"), "Missing values")
 
-    @patch("app.mod_blockchain.views.uuid4", return_value=100)
-    def test_mine_block_returns_200_on_post_request(self, mock_uuid):
-        """Test POST request to mine block route returns 200 with block metadata"""
+    def mine(self):
+        """Starts a mining job and waits for it to finish, returns the job id"""
         response = self.client.post("/api/block/mine")
-        self.assert200(response)
+        self.assertEqual(response.status_code, 202)
+
+        job_id = json.loads(response.data.decode("utf-8")).get("job")
+        self.assertTrue(self.app.extensions["mining_jobs"].get(job_id).wait(60))
 
-        mock_uuid.return_value = 100
+        return job_id
 
-        mock_node_identifier = str(mock_uuid()).replace("-", "")
+    def test_mine_block_returns_202_with_job_on_post_request(self):
+        """Test POST request to mine block route returns 202 with the job, and the job status has the forged block"""
+        job_id = self.mine()
+
+        response = self.client.get(f"/api/block/mine/{job_id}")
+        self.assert200(response)
 
         last_block = self.blockchain.last_block
-        last_proof = last_block["proof"]
-        proof = self.blockchain.proof_of_work(last_proof)
+        proof = self.blockchain.proof_of_work(last_block["proof"])
+
+        data = json.loads(response.data.decode("utf-8"))
+        self.assertEqual(data.get("status"), "done")
+        self.assertGreater(data.get("hashes"), 0)
+        self.assertIn("hash_rate", data)
+        self.assertEqual(data["block"]["index"], last_block["index"] + 1)
+        self.assertEqual(data["block"]["proof"], proof)
+
+    def test_mine_block_returns_409_while_job_is_running(self):
+        """Test a second POST to mine block route is refused while a job is running, and the job can be cancelled"""
+        jobs = self.app.extensions["mining_jobs"]
+        self.app.extensions["blockchain"].pow_engine = UntilCancelledProofOfWork()
+        fund(self.app.extensions["blockchain"], "onluncd", 100)
+        length = len(self.app.extensions["blockchain"])
 
-        self.blockchain.new_transaction(
-            sender="0", recipient=mock_node_identifier, amount=1
+        response = self.client.post("/api/block/mine")
+        job_id = json.loads(response.data.decode("utf-8")).get("job")
+
+        response = self.client.post("/api/block/mine")
+        self.assertEqual(response.status_code, 409)
+
+        # transactions and chain reads are served while mining
+        response = self.client.post(
+            "/api/block/transactions/new",
+            json=dict(sender="onluncd", recipient="bouncda", amount=100),
         )
+        self.assertEqual(response.status_code, 201)
+        self.assert200(self.client.get("/api/block/chain"))
 
-        previous_hash = self.blockchain.hash(last_block)
-        block = self.blockchain.new_block(proof, previous_hash)
+        response = self.client.delete(f"/api/block/mine/{job_id}")
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(jobs.get(job_id).wait(60))
 
-        data = json.loads(response.data.decode("utf-8"))
-        self.assertEqual(data.get("message"), "New block forged")
-        self.assertEqual(data.get("index"), block["index"])
-        self.assertEqual(data.get("proof"), block["proof"])
+        data = json.loads(
+            self.client.get(f"/api/block/mine/{job_id}").data.decode("utf-8")
+        )
+        self.assertEqual(data.get("status"), "cancelled")
+        self.assertEqual(len(self.app.extensions["blockchain"]), length)
+
+    def test_mining_status_returns_404_for_unknown_job(self):
+        response = self.client.get("/api/block/mine/unknown")
+        self.assert404(response)
 
     def test_get_chain_returns_200_on_get_request(self):
         response = self.client.get("/api/block/chain")
@@ -90,6 +371,123 @@ class BlockApiTestCases(BaseTestCase):
         self.assertIn("chain", data)
         self.assertEqual(data.get("length"), len(self.blockchain))
 
+    def test_get_chain_range_returns_blocks_from_index(self):
+        blockchain = self.app.extensions["blockchain"]
+        for proof in range(4):
+            blockchain.new_block(proof)
+
+        response = self.client.get("/api/block/chain?from=2&limit=2")
+        self.assert200(response)
+
+        data = json.loads(response.data.decode("utf-8"))
+        self.assertEqual([block["index"] for block in data["chain"]], [2, 3])
+        self.assertEqual(data.get("length"), 5)
+
+    def test_get_chain_range_returns_next_page(self):
+        blockchain = self.app.extensions["blockchain"]
+        for proof in range(4):
+            blockchain.new_block(proof)
+
+        pages, start = [], 1
+        while start is not None:
+            response = self.client.get(f"/api/block/chain?from={start}&limit=2")
+            data = json.loads(response.data.decode("utf-8"))
+            pages.append([block["index"] for block in data["chain"]])
+            start = data["next"]
+
+        self.assertEqual(pages, [[1, 2], [3, 4], [5]])
+
+    def test_get_chain_is_streamed(self):
+        blockchain = self.app.extensions["blockchain"]
+        for proof in range(250):
+            blockchain.new_block(proof)
+
+        response = self.client.get("/api/block/chain")
+        self.assert200(response)
+        self.assertTrue(response.is_streamed)
+
+        data = json.loads(response.data.decode("utf-8"))
+        self.assertEqual(data["chain"], [block.to_dict() for block in blockchain.chain])
+        self.assertEqual(data["length"], 251)
+
+    def test_get_chain_as_ndjson(self):
+        blockchain = self.app.extensions["blockchain"]
+        for proof in range(3):
+            blockchain.new_block(proof)
+
+        response = self.client.get(
+            "/api/block/chain", headers={"Accept": "application/x-ndjson"}
+        )
+        self.assert200(response)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        self.assertEqual(response.headers["X-Chain-Length"], "4")
+
+        lines = response.data.decode("utf-8").splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [block.to_dict() for block in blockchain.chain],
+        )
+
+    def test_get_chain_range_returns_400_on_invalid_range(self):
+        for query in ("from=0", "limit=0", "from=abc", "limit=1000000"):
+            response = self.client.get(f"/api/block/chain?{query}")
+            self.assert400(response)
+
+    def test_get_headers_returns_headers_with_block_hashes(self):
+        blockchain = self.app.extensions["blockchain"]
+        for proof in range(3):
+            blockchain.new_block(proof)
+
+        response = self.client.get("/api/block/headers?from=2&limit=2")
+        self.assert200(response)
+
+        data = response.json
+        self.assertEqual(data["length"], 4)
+        self.assertEqual(data["next"], 4)
+        headers = [Header.from_dict(header) for header in data["headers"]]
+        self.assertEqual(
+            [header.hash for header in headers],
+            [block.hash for block in blockchain.chain[1:3]],
+        )
+        self.assertNotIn("transactions", data["headers"][0])
+        self.assert400(self.client.get("/api/block/headers?limit=0"))
+
+    def test_get_chain_range_in_binary_encoding(self):
+        blockchain = self.app.extensions["blockchain"]
+        fund(blockchain, "a", 10)
+        blockchain.new_transaction("a", "b", 2.5, fee=1)
+        blockchain.new_block(123)
+
+        binary = {"Accept": "application/octet-stream"}
+        response = self.client.get("/api/block/chain?from=2&limit=5", headers=binary)
+        self.assert200(response)
+        self.assertEqual(response.mimetype, "application/octet-stream")
+        self.assertEqual(response.headers["X-Chain-Length"], "3")
+        self.assertEqual(response.headers["X-Next"], "")
+
+        blocks = [Block.decode(record) for record in decode_records(response.data)]
+        self.assertEqual(blocks, list(blockchain.chain[1:]))
+
+        response = self.client.get("/api/block/headers?from=1&limit=2", headers=binary)
+        headers = [Header.decode(record) for record in decode_records(response.data)]
+        self.assertEqual(
+            [header.hash for header in headers],
+            [block.hash for block in blockchain.chain[:2]],
+        )
+        self.assertEqual(response.headers["X-Next"], "3")
+
+    def test_get_tip_returns_length_and_hash(self):
+        blockchain = self.app.extensions["blockchain"]
+        blockchain.new_block(123)
+
+        response = self.client.get("/api/block/chain/tip")
+        self.assert200(response)
+
+        data = json.loads(response.data.decode("utf-8"))
+        self.assertEqual(data.get("length"), 2)
+        self.assertEqual(data.get("index"), 2)
+        self.assertEqual(data.get("hash"), blockchain.hash(blockchain.last_block))
+
     def test_register_nodes_returns_201_on_successful_post_request(self):
         """Test that POST request with valid nodes returns 201 with message and total_nodes"""
         nodes = ["http://192.168.1.0:8000"]
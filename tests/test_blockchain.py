@@ -1,8 +1,14 @@
 import hashlib
 import json
+import pickle
 from unittest import TestCase, main
+from unittest.mock import patch
 
-from app.mod_blockchain.blockchain import Blockchain
+from app.mod_blockchain.blockchain import Blockchain, just_after
+from app.mod_blockchain.encoding import encode_header
+from app.mod_blockchain.models import Block, Transaction
+from app.mod_blockchain.pow import MAX_RETARGET_STEP, MIN_DIFFICULTY, retarget
+from tests import fund
 
 
 class BlockchainTestCase(TestCase):
@@ -13,6 +19,7 @@ class BlockchainTestCase(TestCase):
         self.blockchain.new_block(proof, previous_hash)
 
     def create_transaction(self, sender="a", recipient="b", amount=1):
+        fund(self.blockchain, sender, amount)
         self.blockchain.new_transaction(
             sender=sender, recipient=recipient, amount=amount
         )
@@ -85,18 +92,180 @@ class TestBlocksAndTransactions(BlockchainTestCase):
         assert len(self.blockchain.chain) == 2
         assert created_block is self.blockchain.chain[-1]
 
+    def test_block_is_timestamped_after_the_median_of_the_blocks_before_it(self):
+        for _ in range(3):
+            self.create_block()
+        median = self.blockchain.median_time()
+
+        # a clock running behind the blocks of the chain
+        with patch("app.mod_blockchain.blockchain.time", return_value=median - 60):
+            self.create_block()
+
+        assert self.blockchain.last_block["timestamp"] > median
+
+    def test_just_after_is_greater_by_a_microsecond_at_most(self):
+        for timestamp in (0, 1.0, 1506057125.900785, 4102444800.0):
+            assert timestamp < just_after(timestamp) <= timestamp + 1e-6
+
+
+class TestModels(BlockchainTestCase):
+    def test_block_converts_to_json_shape(self):
+        self.create_transaction()
+        self.create_block()
+        block = self.blockchain.last_block
+
+        values = block.to_dict()
+
+        assert values == json.loads(json.dumps(values))
+        assert values["transactions"] == [dict(sender="a", recipient="b", amount=1)]
+        assert set(values) == {
+            "index",
+            "timestamp",
+            "transactions",
+            "proof",
+            "difficulty",
+            "previous_hash",
+            "merkle_root",
+        }
+        assert Block.from_dict(values) == block
+        assert Block.from_dict(values).hash == block.hash
+
+    def test_models_are_picklable(self):
+        self.create_transaction()
+        self.create_block()
+        block = self.blockchain.last_block
+
+        assert pickle.loads(pickle.dumps(block)) == block
+        assert pickle.loads(pickle.dumps(block.transactions[0])) == Transaction(
+            "a", "b", 1
+        )
+
 
 class TestHashingAndProofs(BlockchainTestCase):
     def test_hash_is_correct(self):
         self.create_block()
 
         new_block = self.blockchain.last_block
-        new_block_json = json.dumps(self.blockchain.last_block, sort_keys=True).encode()
-        new_hash = hashlib.sha256(new_block_json).hexdigest()
+        header = encode_header(
+            new_block["index"],
+            new_block["timestamp"],
+            new_block["proof"],
+            new_block["difficulty"],
+            new_block["previous_hash"],
+            new_block["merkle_root"],
+        )
+        new_hash = hashlib.sha256(header).hexdigest()
 
         assert len(new_hash) == 64
         assert new_hash == self.blockchain.hash(new_block)
 
+    def test_hash_commits_to_transactions_through_merkle_root(self):
+        self.create_transaction()
+        self.create_block()
+        block = self.blockchain.last_block
+
+        values = block.to_dict()
+        values["transactions"][0]["amount"] = 1000
+        tampered = Block.from_dict(values)
+
+        # the header is unchanged, the root no longer matches the transactions
+        assert tampered.hash == block.hash
+        assert not tampered.verify()
+        assert Block.from_dict(dict(values, merkle_root=None)).hash != block.hash
+
+    def test_blocks_are_immutable(self):
+        self.create_block()
+
+        with self.assertRaises(AttributeError):
+            self.blockchain.last_block.proof = 1
+
+        with self.assertRaises(TypeError):
+            self.blockchain.last_block["proof"] = 1
+
+    def test_hash_is_computed_once(self):
+        self.create_block()
+        block = self.blockchain.last_block
+
+        with patch("app.mod_blockchain.models.canonical_encoding") as encoding:
+            encoding.return_value = b"{}"
+            first = self.blockchain.hash(block)
+            second = self.blockchain.hash(block)
+
+        assert first == second
+        assert encoding.call_count <= 1
+
+    def test_verify_integrity(self):
+        self.create_block(previous_hash=None)
+        self.create_block(previous_hash=None)
+
+        assert self.blockchain.verify_integrity() is None
+
+        # tamper with a block behind the back of its cached hash
+        object.__setattr__(self.blockchain.chain[1], "proof", 1)
+
+        assert self.blockchain.verify_integrity() == 2
+
+
+class TestDifficulty(BlockchainTestCase):
+    def create_blocks(self, count, block_time):
+        """Appends count blocks, spaced block_time seconds apart"""
+        for _ in range(count):
+            timestamp = self.blockchain.last_block["timestamp"] + block_time
+            with patch("app.mod_blockchain.blockchain.time", return_value=timestamp):
+                self.create_block()
+
+    def test_retarget(self):
+        # blocks mined twice as fast as expected need one more bit
+        assert retarget(16, 50, 100) == 17
+        assert retarget(16, 200, 100) == 15
+        assert retarget(16, 100, 100) == 16
+
+        # steps are bounded
+        assert retarget(16, 1, 100) == 16 + MAX_RETARGET_STEP
+        assert retarget(16, 0, 100) == 16 + MAX_RETARGET_STEP
+        assert retarget(16, 10000, 100) == 16 - MAX_RETARGET_STEP
+        assert retarget(MIN_DIFFICULTY, 10000, 100) == MIN_DIFFICULTY
+
+    def test_difficulty_is_stored_in_blocks(self):
+        blockchain = Blockchain(difficulty=8)
+
+        assert blockchain.last_block["difficulty"] == 8
+
+        blockchain.new_block(123, "abc")
+
+        assert blockchain.last_block["difficulty"] == 8
+
+    def test_difficulty_retargets_every_interval(self):
+        interval = self.blockchain.retarget_interval
+        target_block_time = self.blockchain.target_block_time
+
+        # blocks mined 4 times faster than the target
+        self.create_blocks(interval - 1, target_block_time / 4)
+
+        assert self.blockchain.last_block["difficulty"] == 16
+        assert self.blockchain.next_difficulty() == 18
+
+        self.create_blocks(1, target_block_time / 4)
+
+        assert self.blockchain.last_block["difficulty"] == 18
+        assert self.blockchain.next_difficulty() == 18
+
+        # and then blocks mined at the target
+        self.create_blocks(interval - 1, target_block_time)
+
+        assert self.blockchain.next_difficulty() == 18
+
+    def test_mined_proof_uses_block_difficulty(self):
+        blockchain = Blockchain(difficulty=4)
+
+        block = blockchain.mine("miner")
+
+        assert block["difficulty"] == 4
+        assert blockchain.valid_proof(100, block["proof"], 4)
+        assert block["proof"] == next(
+            proof for proof in range(10**6) if blockchain.valid_proof(100, proof, 4)
+        )
+
 
 if __name__ == "__main__":
     main()
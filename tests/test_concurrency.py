@@ -0,0 +1,241 @@
+import json
+from threading import Event, Thread
+from time import sleep
+from unittest import TestCase, main
+
+from app import create_app
+from app.mod_blockchain.locks import ReadWriteLock
+from app.mod_blockchain.lookup import LookupIndex
+from app.mod_blockchain.models import Block
+from app.mod_blockchain.pow import ProofOfWork
+from tests import fund
+from tests.test_balances import rescan
+
+SENDERS = ["alice", "bob", "carol", "dave"]
+
+
+class InstantProofOfWork(ProofOfWork):
+    """Proof of work engine answering straight away, so mining only contends for the chain"""
+
+    def search(self, last_proof, difficulty=None, progress=None):
+        sleep(0.001)
+        return 0
+
+
+def run_threads(*targets):
+    """Runs the targets on threads at the same time, returns the errors they raised"""
+    errors = []
+
+    def guarded(target):
+        try:
+            target()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [Thread(target=guarded, args=(target,)) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=60)
+        assert not thread.is_alive(), "thread is deadlocked"
+    return errors
+
+
+class TestReadWriteLock(TestCase):
+    def setUp(self):
+        self.lock = ReadWriteLock()
+
+    def test_readers_share_the_lock(self):
+        inside = Event()
+
+        def reader():
+            with self.lock.read():
+                inside.set()
+
+        with self.lock.read():
+            thread = Thread(target=reader)
+            thread.start()
+            assert inside.wait(1)
+        thread.join()
+
+    def test_writer_excludes_readers(self):
+        inside = Event()
+
+        def reader():
+            with self.lock.read():
+                inside.set()
+
+        with self.lock.write():
+            thread = Thread(target=reader)
+            thread.start()
+            assert not inside.wait(0.1)
+        assert inside.wait(1)
+        thread.join()
+
+    def test_waiting_writer_goes_before_new_readers(self):
+        order = []
+        writer_waiting = Event()
+
+        def writer():
+            writer_waiting.set()
+            with self.lock.write():
+                order.append("writer")
+
+        def reader():
+            with self.lock.read():
+                order.append("reader")
+
+        with self.lock.read():
+            threads = [Thread(target=writer)]
+            threads[0].start()
+            writer_waiting.wait(1)
+            sleep(0.05)
+            threads.append(Thread(target=reader))
+            threads[1].start()
+            sleep(0.05)
+            assert order == []
+
+        for thread in threads:
+            thread.join(1)
+        assert order == ["writer", "reader"]
+
+    def test_lock_is_reentrant(self):
+        with self.lock.write():
+            with self.lock.write():
+                with self.lock.read():
+                    pass
+
+        with self.lock.read():
+            with self.lock.read():
+                with self.assertRaises(RuntimeError):
+                    self.lock.acquire_write()
+
+        # the lock is free again
+        with self.lock.write():
+            pass
+
+    def test_deferred_work_runs_once_the_writer_releases_the_lock(self):
+        released = []
+
+        def callback():
+            with self.lock.read():
+                released.append(True)
+
+        with self.lock.write():
+            with self.lock.write():
+                self.lock.defer(callback)
+            assert released == []
+        assert released == [True]
+
+        with self.lock.read():
+            with self.assertRaises(RuntimeError):
+                self.lock.defer(callback)
+
+
+class TestConcurrentRequests(TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.blockchain = self.app.extensions["blockchain"]
+        self.blockchain.pow_engine = InstantProofOfWork()
+        self.blockchain.retarget_interval = 0
+        for sender in SENDERS:
+            fund(self.blockchain, sender, 10**6)
+
+    def post_transactions(self, sender, accepted):
+        client = self.app.test_client()
+        for amount in range(1, 101):
+            response = client.post(
+                "/api/block/transactions/new",
+                json=dict(
+                    sender=sender, recipient="shop", amount=amount, fee=amount % 3
+                ),
+            )
+            assert response.status_code == 201, response.data
+            accepted.append(response.json["id"])
+
+    def mine_through_api(self, done):
+        client = self.app.test_client()
+        while not done.is_set():
+            response = client.post("/api/block/mine")
+            if response.status_code != 202:
+                continue
+            job = response.json["job"]
+            while client.get(f"/api/block/mine/{job}").json["status"] not in (
+                "done",
+                "failed",
+                "cancelled",
+            ):
+                sleep(0.001)
+
+    def mine_directly(self, done):
+        while not done.is_set():
+            self.blockchain.mine("miner")
+
+    def read_chain(self, done):
+        client = self.app.test_client()
+        while not done.is_set():
+            data = json.loads(client.get("/api/block/chain").data)
+            chain = [Block.from_dict(block) for block in data["chain"]]
+            assert len(chain) == data["length"]
+            for previous, block in zip(chain, chain[1:]):
+                assert block.previous_hash == previous.hash
+                assert block.index == previous.index + 1
+
+            tip = client.get("/api/block/chain/tip").json
+            assert tip["index"] == tip["length"]
+
+            start = max(1, tip["length"] - 4)
+            page = client.get(f"/api/block/chain?from={start}&limit=5").json
+            indexes = [block["index"] for block in page["chain"]]
+            assert indexes == list(range(start, start + len(indexes)))
+
+    def drop_tip(self, done):
+        while not done.is_set():
+            # the transactions of the block dropped are pending again
+            with self.blockchain.lock.write():
+                chain = list(self.blockchain.chain)
+                if len(chain) > len(SENDERS) + 2:
+                    self.blockchain.adopt_chain(chain[:-1])
+            sleep(0.005)
+
+    def test_no_transaction_is_lost_under_concurrent_requests(self):
+        accepted = []
+        done = Event()
+
+        def senders():
+            errors = run_threads(
+                *(
+                    lambda sender=sender: self.post_transactions(sender, accepted)
+                    for sender in SENDERS
+                )
+            )
+            done.set()
+            if errors:
+                raise errors[0]
+
+        errors = run_threads(
+            senders,
+            lambda: self.mine_through_api(done),
+            lambda: self.mine_directly(done),
+            lambda: self.read_chain(done),
+            lambda: self.read_chain(done),
+            lambda: self.drop_tip(done),
+        )
+        assert errors == []
+
+        while len(self.blockchain.mempool):
+            self.blockchain.mine("miner")
+
+        assert len(accepted) == len(set(accepted)) == 100 * len(SENDERS)
+        for transaction_id in accepted:
+            assert len(self.blockchain.lookup.locate(transaction_id)) == 1
+
+        chain = list(self.blockchain.chain)
+        assert self.blockchain.verify_integrity() is None
+        assert self.blockchain.balances.to_dict() == rescan(chain)
+        assert self.blockchain.lookup._postings == LookupIndex(chain)._postings
+        assert all(self.blockchain.balance(sender) >= 0 for sender in SENDERS)
+
+
+if __name__ == "__main__":
+    main()
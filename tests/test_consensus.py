@@ -0,0 +1,338 @@
+from contextlib import ExitStack
+from time import monotonic, sleep
+from unittest import TestCase, main
+
+from flask import Response, jsonify, request
+
+from app.mod_blockchain.blockchain import Blockchain
+from app.mod_blockchain.encoding import encode_records
+from app.mod_blockchain.models import Block
+from app.mod_blockchain.peers import PeerClient
+from tests.peers import StandInPeer
+
+
+class ConsensusTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        miner = Blockchain(difficulty=4, retarget_interval=0)
+        for _ in range(6):
+            miner.mine("miner")
+        cls.chain = list(miner.chain)
+
+    def setUp(self):
+        self.peers = ExitStack()
+        self.blockchain = Blockchain(
+            difficulty=4,
+            retarget_interval=0,
+            peers=PeerClient(timeout=0.5, deadline=1.5),
+        )
+
+    def tearDown(self):
+        self.peers.close()
+
+    def start_peer(self, chain=None, latency=0.0):
+        peer = self.peers.enter_context(StandInPeer(chain, latency))
+        self.blockchain.register_node(f"http://{peer.address}")
+        return peer
+
+    def start_malformed_peer(self):
+        """
+        Starts a peer sending the chain with a transaction that cannot be encoded, its sender being a number, in a block
+        without a Merkle root, which is computed from the transactions when the block is read
+        """
+        peer = self.start_peer(self.chain)
+        chain = [block.to_dict() for block in self.chain]
+        chain[-1]["transactions"][0]["sender"] = 1
+        del chain[-1]["merkle_root"]
+
+        @peer.app.before_request
+        def malformed():
+            if request.path == "/api/block/chain":
+                start = request.args.get("from", 1, type=int)
+                limit = request.args.get("limit", len(chain), type=int)
+                return jsonify(
+                    chain=chain[start - 1 : start - 1 + limit], length=len(chain)
+                )
+
+        return peer
+
+    def resolve(self):
+        """Resolves conflicts, returns whether the chain was replaced and the seconds it took"""
+        start = monotonic()
+        replaced = self.blockchain.resolve_conflicts()
+        return replaced, monotonic() - start
+
+
+class TestResolveConflicts(ConsensusTestCase):
+    def test_longest_valid_chain_wins(self):
+        self.start_peer(self.chain[:3])
+        self.start_peer(self.chain)
+        self.start_peer(self.chain[:5])
+
+        replaced, _ = self.resolve()
+
+        assert replaced
+        assert list(self.blockchain.chain) == self.chain
+
+    def test_shorter_chains_are_ignored(self):
+        self.start_peer(self.chain[:1])
+
+        replaced, _ = self.resolve()
+
+        assert not replaced
+        assert len(self.blockchain) == 1
+
+    def test_invalid_chain_is_ignored(self):
+        values = self.chain[3].to_dict()
+        values["previous_hash"] = "abc"
+        self.start_peer(self.chain[:3] + [Block.from_dict(values)] + self.chain[4:])
+        self.start_peer(self.chain[:4])
+
+        replaced, _ = self.resolve()
+
+        assert replaced
+        assert list(self.blockchain.chain) == self.chain[:4]
+
+    def test_chain_with_another_genesis_block_is_ignored(self):
+        forged = [
+            Block(
+                index=1,
+                timestamp=0,
+                transactions=[],
+                proof=100,
+                difficulty=255,
+                previous_hash="1",
+            )
+        ]
+
+        for mode in ("full", "incremental", "headers"):
+            with self.subTest(mode=mode):
+                self.setUp()
+                self.blockchain.sync_mode = mode
+                self.blockchain.adopt_chain(self.chain)
+                self.start_peer(forged)
+
+                replaced, _ = self.resolve()
+
+                assert not replaced
+                assert list(self.blockchain.chain) == self.chain
+                assert self.blockchain.work == len(self.chain) * 2 ** 4
+                self.peers.close()
+
+    def test_peers_are_queried_concurrently(self):
+        for _ in range(4):
+            self.start_peer(self.chain, latency=0.3)
+
+        replaced, elapsed = self.resolve()
+
+        assert replaced
+        assert elapsed < 4 * 0.3
+
+    def test_slow_peer_does_not_stall_consensus(self):
+        self.start_peer(self.chain + self.chain, latency=5)
+        self.start_peer(self.chain)
+
+        replaced, elapsed = self.resolve()
+
+        # the slow peer times out after half a second
+        assert replaced
+        assert list(self.blockchain.chain) == self.chain
+        assert elapsed < 1.5
+
+    def test_dead_peer_is_skipped(self):
+        self.blockchain.register_node("http://127.0.0.1:1")
+        self.start_peer(self.chain)
+
+        replaced, _ = self.resolve()
+
+        assert replaced
+
+    def test_malformed_chains_are_skipped(self):
+        self.start_malformed_peer()
+        self.start_peer(self.chain[:4])
+
+        replaced, _ = self.resolve()
+
+        assert replaced
+        assert list(self.blockchain.chain) == self.chain[:4]
+
+    def test_deadline_bounds_the_round(self):
+        self.blockchain.peers = PeerClient(timeout=5, deadline=0.5)
+        self.start_peer(self.chain, latency=2)
+        self.start_peer(self.chain, latency=2)
+
+        replaced, elapsed = self.resolve()
+
+        assert not replaced
+        assert elapsed < 1.5
+
+    def test_time_spent_on_documents_does_not_count_against_the_deadline(self):
+        client = PeerClient(timeout=5, deadline=0.5)
+        nodes = {self.start_peer(self.chain).address for _ in range(3)}
+
+        received = []
+        for node, _ in client.get_all(nodes, "/api/block/chain/tip"):
+            received.append(node)
+            # validating a document takes longer than the deadline
+            sleep(0.6)
+
+        assert set(received) == nodes
+
+
+class TestIncrementalSync(ConsensusTestCase):
+    def setUp(self):
+        super(TestIncrementalSync, self).setUp()
+        self.blockchain.sync_mode = "incremental"
+        self.blockchain.sync_page_size = 2
+
+    def chain_requests(self, peer):
+        return [path for path in peer.requests if path.startswith("/api/block/chain?")]
+
+    def test_fetches_only_blocks_after_our_tip(self):
+        self.blockchain.adopt_chain(self.chain[:3])
+        peer = self.start_peer(self.chain)
+
+        replaced, _ = self.resolve()
+
+        assert replaced
+        assert list(self.blockchain.chain) == self.chain
+        # one header to check our tip is in their chain, then the 4 missing blocks in pages of 2
+        assert peer.requests[1:] == [
+            "/api/block/headers?from=3&limit=1",
+            "/api/block/chain?from=4&limit=2",
+            "/api/block/chain?from=6&limit=2",
+        ]
+
+    def test_replaces_blocks_after_fork_point(self):
+        fork = Blockchain(difficulty=4, retarget_interval=0)
+        fork.adopt_chain(self.chain[:4])
+        fork.mine("another miner")
+        self.blockchain.adopt_chain(fork.chain)
+        self.start_peer(self.chain)
+
+        replaced, _ = self.resolve()
+
+        assert replaced
+        assert list(self.blockchain.chain) == self.chain
+        assert self.blockchain.common_ancestor(
+            next(iter(self.blockchain.nodes)), len(self.chain)
+        ) == len(self.chain)
+
+    def test_syncs_whole_chain_after_our_genesis_block(self):
+        self.start_peer(self.chain)
+
+        replaced, _ = self.resolve()
+
+        assert replaced
+        assert list(self.blockchain.chain) == self.chain
+
+    def test_invalid_blocks_after_fork_point_are_rejected(self):
+        values = self.chain[5].to_dict()
+        values["previous_hash"] = "abc"
+        self.blockchain.adopt_chain(self.chain[:3])
+        self.start_peer(self.chain[:5] + [Block.from_dict(values)])
+
+        replaced, _ = self.resolve()
+
+        assert not replaced
+        assert list(self.blockchain.chain) == self.chain[:3]
+
+    def test_malformed_blocks_are_rejected(self):
+        self.blockchain.adopt_chain(self.chain[:3])
+        self.start_malformed_peer()
+
+        replaced, _ = self.resolve()
+
+        assert not replaced
+        assert list(self.blockchain.chain) == self.chain[:3]
+
+
+class TestHeadersFirstSync(ConsensusTestCase):
+    def setUp(self):
+        super(TestHeadersFirstSync, self).setUp()
+        self.blockchain.sync_mode = "headers"
+        self.blockchain.sync_page_size = 2
+        self.blockchain.adopt_chain(self.chain[:3])
+
+    def tampered_chain(self, position):
+        """The chain with the transactions of a block replaced, its header left as it was"""
+        values = self.chain[position].to_dict()
+        values["transactions"] = [dict(sender="0", recipient="thief", amount=100)]
+        return (
+            self.chain[:position]
+            + [Block.from_dict(values)]
+            + self.chain[position + 1 :]
+        )
+
+    def block_requests(self, peer):
+        return [path for path in peer.requests if path.startswith("/api/block/chain?")]
+
+    def test_blocks_are_fetched_from_the_longest_chain_only(self):
+        shorter = self.start_peer(self.chain[:5])
+        longest = self.start_peer(self.chain)
+
+        replaced, _ = self.resolve()
+
+        assert replaced
+        assert list(self.blockchain.chain) == self.chain
+        assert shorter.requests == ["/api/block/chain/tip?"]
+        assert sorted(self.block_requests(longest)) == [
+            "/api/block/chain?from=4&limit=2",
+            "/api/block/chain?from=6&limit=2",
+        ]
+
+    def test_chain_with_invalid_headers_is_skipped_without_fetching_blocks(self):
+        values = self.chain[4].to_dict()
+        values["previous_hash"] = "abc"
+        invalid = self.start_peer(
+            self.chain[:4] + [Block.from_dict(values)] + self.chain[5:]
+        )
+        valid = self.start_peer(self.chain[:6])
+
+        replaced, _ = self.resolve()
+
+        assert replaced
+        assert list(self.blockchain.chain) == self.chain[:6]
+        assert self.block_requests(invalid) == []
+        assert self.block_requests(valid)
+
+    def test_blocks_not_matching_their_headers_are_rejected(self):
+        self.start_peer(self.tampered_chain(5))
+
+        replaced, _ = self.resolve()
+
+        assert not replaced
+        assert list(self.blockchain.chain) == self.chain[:3]
+
+    def test_malformed_headers_are_rejected(self):
+        peer = self.start_peer(self.chain)
+        headers = [block.header().encode() for block in self.chain]
+        # the previous hash of a header, following its first 26 bytes, is a short string that is not valid UTF-8
+        headers[4] = headers[4][:26] + b"\x01\x05" + b"\xff" * 31 + headers[4][59:]
+
+        @peer.app.before_request
+        def malformed():
+            if (
+                request.path == "/api/block/headers"
+                and request.accept_mimetypes["application/octet-stream"]
+            ):
+                start = request.args.get("from", 1, type=int)
+                limit = request.args.get("limit", len(headers), type=int)
+                records = encode_records(headers[start - 1 : start - 1 + limit])
+                return Response(records, mimetype="application/octet-stream")
+
+        replaced, _ = self.resolve()
+
+        assert not replaced
+        assert list(self.blockchain.chain) == self.chain[:3]
+        assert not self.block_requests(peer)
+
+    def test_incomplete_range_is_rejected(self):
+        peer = self.start_peer(self.chain)
+        # the peer claims a longer chain than it serves
+        assert not self.blockchain.sync_headers(peer.address, len(self.chain) + 2)
+        assert list(self.blockchain.chain) == self.chain[:3]
+
+
+if __name__ == "__main__":
+    main()
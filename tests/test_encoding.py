@@ -0,0 +1,133 @@
+import hashlib
+from unittest import TestCase, main
+
+from app.mod_blockchain.blockchain import Blockchain
+from app.mod_blockchain.encoding import (
+    HEADER,
+    EncodingError,
+    decode_records,
+    encode_header,
+    encode_number,
+    encode_records,
+    encode_transaction,
+)
+from app.mod_blockchain.models import Block, Header, Transaction
+
+ROOT = hashlib.sha256(b"root").hexdigest()
+
+
+def block(**values):
+    fields = dict(
+        index=2,
+        timestamp=1500000000.25,
+        transactions=[
+            Transaction("a", "b", 1),
+            Transaction("ä", "b", 2.5, fee=0.5),
+            Transaction("a", "b", 1, nonce=2 ** 64 - 1),
+            Transaction("0", "miner", 2 ** 70),
+        ],
+        proof=35293,
+        difficulty=16,
+        previous_hash=hashlib.sha256(b"previous").hexdigest(),
+    )
+    fields.update(values)
+    return Block(**fields)
+
+
+class TestBinaryEncoding(TestCase):
+    def test_block_round_trip(self):
+        original = block()
+
+        decoded = Block.decode(original.encoded)
+
+        assert decoded == original
+        assert decoded.to_dict() == original.to_dict()
+        assert decoded.hash == original.hash
+        assert decoded.verify()
+
+    def test_header_has_a_fixed_size(self):
+        for previous_hash in ("1", "abc", block().previous_hash):
+            header = block(previous_hash=previous_hash).header()
+
+            assert len(header.encode()) == HEADER.size
+            assert Header.decode(header.encode()) == header
+            assert Header.decode(header.encode()).previous_hash == previous_hash
+
+    def test_encoding_depends_on_values_only(self):
+        assert encode_number(100) == encode_number(100.0)
+        assert Transaction("a", "b", 100).id == Transaction("a", "b", 100.0).id
+        assert block(timestamp=1500000000).hash == block(timestamp=1500000000.0).hash
+        assert encode_number(0.1) != encode_number(0.2)
+        assert encode_number(-(2 ** 80)) != encode_number(2 ** 80)
+
+    def test_every_field_is_covered(self):
+        hashes = {
+            block().hash,
+            block(index=3).hash,
+            block(timestamp=1500000000.5).hash,
+            block(proof=1).hash,
+            block(difficulty=17).hash,
+            block(previous_hash="1").hash,
+            block(merkle_root=ROOT).hash,
+        }
+
+        assert len(hashes) == 7
+        assert encode_transaction("ab", "c", 1, 0) != encode_transaction(
+            "a", "bc", 1, 0
+        )
+
+    def test_values_out_of_range_are_rejected(self):
+        with self.assertRaises(EncodingError):
+            encode_header(1, 0.0, 2 ** 64, 16, "1", ROOT)
+        with self.assertRaises(EncodingError):
+            encode_header(1, 0.0, 100, 16, "x" * 32, ROOT)
+        with self.assertRaises(EncodingError):
+            encode_transaction("a", "b", "1", 0)
+        with self.assertRaises(EncodingError):
+            encode_transaction("a", "b", True, 0)
+        for nonce in (-1, 2 ** 64, "1", True):
+            with self.assertRaises(EncodingError):
+                encode_transaction("a", "b", 1, 0, nonce=nonce)
+
+    def test_malformed_bytes_are_rejected(self):
+        encoded = block().encoded
+
+        for malformed in (encoded[:-1], encoded + b"\0", b"\x02" + encoded[1:], b""):
+            with self.assertRaises(EncodingError):
+                Block.decode(malformed)
+
+    def test_malformed_headers_are_rejected(self):
+        encoded = block(previous_hash="short").header().encode()
+        # the previous hash follows the version, index, timestamp, proof and difficulty
+        offset = 26
+
+        for malformed in (
+            # a short string that is not valid UTF-8
+            encoded[: offset + 2] + b"\xff" + encoded[offset + 3 :],
+            # an unknown tag
+            encoded[:offset] + b"\x07" + encoded[offset + 1 :],
+            # a short string longer than the field
+            encoded[: offset + 1] + b"\x40" + encoded[offset + 2 :],
+        ):
+            with self.assertRaises(EncodingError):
+                Header.decode(malformed)
+            with self.assertRaises(EncodingError):
+                Block.decode(malformed + block().encoded[HEADER.size :])
+
+    def test_records_round_trip(self):
+        records = [block(index=index).encoded for index in range(3)] + [b""]
+
+        assert decode_records(encode_records(records)) == records
+        with self.assertRaises(EncodingError):
+            decode_records(encode_records(records[:1])[:-1])
+
+    def test_block_that_cannot_be_encoded_is_invalid(self):
+        blockchain = Blockchain()
+        genesis = blockchain.last_block
+        unencodable = block(index=2, previous_hash=genesis.hash, proof=-1)
+
+        assert not blockchain.valid_block([genesis, unencodable], 1)
+
+
+if __name__ == "__main__":
+    main()
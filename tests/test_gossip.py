@@ -0,0 +1,239 @@
+from contextlib import ExitStack
+from itertools import combinations
+from time import sleep, time
+from unittest import TestCase, main
+
+from app.mod_blockchain.blockchain import Blockchain
+from app.mod_blockchain.gossip import Gossip
+from app.mod_blockchain.models import Block, Transaction
+from tests import mine_block, mined_chain, sample
+from tests.peers import StandInPeer
+
+
+def eventually(predicate, timeout=5.0):
+    """Waits for gossip running in the background to make a predicate true"""
+    deadline = time() + timeout
+    while time() < deadline:
+        if predicate():
+            return True
+        sleep(0.02)
+    return predicate()
+
+
+class GossipTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # every node starts from the same chain, where alice has the funds to send transactions
+        miner = Blockchain(difficulty=4, retarget_interval=0)
+        mine_block(miner, [Transaction("0", "alice", 100)])
+        cls.chain = list(miner.chain)
+
+    def setUp(self):
+        self.peers = ExitStack()
+
+    def tearDown(self):
+        self.peers.close()
+
+    def start_nodes(self, count, chain=None, links=None, fanout=8):
+        """
+        Starts nodes announcing to each other, each registering the nodes it is linked to, every other node by default
+        """
+        nodes = [
+            self.peers.enter_context(StandInPeer(chain or self.chain))
+            for _ in range(count)
+        ]
+        for node in nodes:
+            node.blockchain.gossip.address = node.address
+            node.blockchain.gossip.fanout = fanout
+
+        for first, second in links or combinations(range(count), 2):
+            nodes[first].blockchain.register_node(nodes[second].address)
+            nodes[second].blockchain.register_node(nodes[first].address)
+        return nodes
+
+    @staticmethod
+    def fetched(node, kind):
+        return sample(
+            node.blockchain.metrics.render(),
+            "blockchain_gossip_fetched_total",
+            kind=kind,
+        )
+
+
+class TestBlockPropagation(GossipTestCase):
+    def test_mined_block_reaches_every_node_once(self):
+        nodes = self.start_nodes(4)
+
+        block = nodes[0].blockchain.mine("miner")
+
+        assert eventually(
+            lambda: all(node.blockchain.last_block == block for node in nodes)
+        )
+        for node in nodes[1:]:
+            assert eventually(lambda: self.fetched(node, "block") == 1)
+            # only the block was fetched, no consensus round ran
+            assert not [path for path in node.requests if "/chain" in path]
+        sleep(0.2)
+        assert all(self.fetched(node, "block") == 1 for node in nodes[1:])
+
+    def test_blocks_are_relayed_from_node_to_node(self):
+        nodes = self.start_nodes(4, links=[(0, 1), (1, 2), (2, 3)])
+
+        for _ in range(2):
+            nodes[0].blockchain.mine("miner")
+
+        assert eventually(
+            lambda: list(nodes[3].blockchain.chain) == list(nodes[0].blockchain.chain)
+        )
+
+    def test_node_missing_blocks_syncs_with_the_announcing_node(self):
+        ahead = mined_chain(2, base=self.chain)
+        behind, leader = self.start_nodes(1)[0], self.start_nodes(1, chain=ahead)[0]
+        behind.blockchain.register_node(leader.address)
+        leader.blockchain.register_node(behind.address)
+
+        leader.blockchain.mine("miner")
+
+        assert eventually(
+            lambda: list(behind.blockchain.chain) == list(leader.blockchain.chain)
+        )
+        assert len(behind.blockchain.chain) == len(self.chain) + 3
+
+
+class TestTransactionPropagation(GossipTestCase):
+    def test_posted_transactions_reach_every_node(self):
+        nodes = self.start_nodes(3)
+        single = Transaction("alice", "bob", 5)
+        batch = [Transaction("alice", "carol", amount) for amount in (1, 2)]
+
+        client = nodes[0].app.test_client()
+        assert (
+            client.post(
+                "/api/block/transactions/new", json=single.to_dict()
+            ).status_code
+            == 201
+        )
+        response = client.post(
+            "/api/block/transactions/batch",
+            json=dict(transactions=[transaction.to_dict() for transaction in batch]),
+        )
+        assert response.status_code == 201
+
+        ids = [transaction.id for transaction in [single] + batch]
+        assert eventually(
+            lambda: all(
+                node.blockchain.is_pending(transaction_id)
+                for node in nodes
+                for transaction_id in ids
+            )
+        )
+        for node in nodes[1:]:
+            assert eventually(lambda: self.fetched(node, "transaction") == 3)
+
+    def test_mined_transactions_leave_the_pool_of_every_node(self):
+        nodes = self.start_nodes(2)
+        transaction = Transaction("alice", "bob", 5)
+        nodes[0].blockchain.new_transaction(**transaction.to_dict())
+        assert eventually(lambda: nodes[1].blockchain.is_pending(transaction.id))
+
+        nodes[0].blockchain.mine("miner")
+
+        assert eventually(lambda: not nodes[1].blockchain.is_pending(transaction.id))
+        assert nodes[1].blockchain.find_transaction(transaction.id)
+
+
+class TestInventoryApi(GossipTestCase):
+    def setUp(self):
+        super(TestInventoryApi, self).setUp()
+        self.node, self.other = self.start_nodes(2)
+        self.client = self.node.app.test_client()
+
+    def announce(self, node, **inventory):
+        return self.client.post(
+            "/api/block/inventory", json=dict(node=node, **inventory)
+        )
+
+    def test_known_blocks_are_not_fetched(self):
+        response = self.announce(
+            self.other.address, blocks=[self.chain[-1].hash], transactions=[]
+        )
+
+        assert response.status_code == 202
+        assert response.json["wanted"] == 0
+
+    def test_items_announced_twice_are_fetched_once(self):
+        transaction = Transaction("alice", "bob", 5)
+        self.other.blockchain.mempool.add(transaction)
+
+        first = self.announce(self.other.address, transactions=[transaction.id])
+        second = self.announce(self.other.address, transactions=[transaction.id])
+
+        assert (first.json["wanted"], second.json["wanted"]) == (1, 0)
+        assert eventually(lambda: self.node.blockchain.is_pending(transaction.id))
+        text = self.node.blockchain.metrics.render()
+        assert (
+            sample(text, "blockchain_gossip_duplicates_total", kind="transaction") == 1
+        )
+
+    def test_unregistered_nodes_are_refused(self):
+        assert self.announce("127.0.0.1:1", blocks=[]).status_code == 403
+
+    def test_malformed_inventory_is_refused(self):
+        assert self.announce(self.other.address, blocks="hash").status_code == 400
+        assert self.announce(None, blocks=[]).status_code == 400
+
+    def test_blocks_and_pending_transactions_are_served_by_hash(self):
+        transaction = Transaction("alice", "bob", 5)
+        self.node.blockchain.mempool.add(transaction)
+
+        blocks = self.client.get(
+            "/api/block/blocks", query_string=dict(hash=[self.chain[-1].hash, "a"])
+        )
+        pending = self.client.get(
+            "/api/block/mempool", query_string=dict(id=[transaction.id, "a"])
+        )
+
+        assert blocks.json["blocks"] == [self.chain[-1].to_dict()]
+        assert pending.json["transactions"] == [transaction.to_dict()]
+        assert self.client.get("/api/block/blocks").status_code == 400
+
+
+class TestReceiveBlock(TestCase):
+    def setUp(self):
+        self.chain = mined_chain(3)
+        self.blockchain = Blockchain(difficulty=4, retarget_interval=0)
+        self.blockchain.adopt_chain(self.chain[:-1])
+
+    def test_block_following_our_chain_is_added(self):
+        assert self.blockchain.receive_block(self.chain[-1])
+
+        assert list(self.blockchain.chain) == self.chain
+        assert self.blockchain.receive_block(self.chain[-1]) is False
+
+    def test_block_following_an_unknown_block_is_not_added(self):
+        self.blockchain.adopt_chain(self.chain[:-2])
+
+        assert self.blockchain.receive_block(self.chain[-1]) is None
+
+    def test_invalid_block_is_not_added(self):
+        forged = Block.from_dict(dict(self.chain[-1].to_dict(), proof=0))
+
+        assert self.blockchain.receive_block(forged) is False
+        assert list(self.blockchain.chain) == self.chain[:-1]
+
+
+class TestFanout(TestCase):
+    def test_announcements_go_to_at_most_fanout_nodes(self):
+        gossip = Gossip(address="127.0.0.1:1", fanout=2)
+        nodes = frozenset(f"127.0.0.1:{port}" for port in range(2, 7))
+
+        targets = gossip.announce(nodes, blocks=["a"], origin="127.0.0.1:2")
+
+        assert len(targets) == 2
+        assert set(targets) <= nodes - {"127.0.0.1:2"}
+        assert gossip.unseen("block", ["a"]) == []
+
+    def test_nothing_is_announced_without_an_address(self):
+        gossip = Gossip(fanout=2)
+
+        assert gossip.announce(frozenset(["127.0.0.1:2"]), blocks=["a"]) == []
@@ -0,0 +1,186 @@
+import os
+import pickle
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main
+from threading import Thread
+from unittest.mock import patch
+
+from app.mod_blockchain.blockchain import Blockchain
+from app.mod_blockchain.lookup import LookupIndex
+from app.mod_blockchain.models import Transaction
+from app.mod_blockchain.snapshot import save_snapshot
+from app.mod_blockchain.store import ChainStore
+from tests import fund
+
+
+def payments(*amounts):
+    return [Transaction("a", "b", amount) for amount in amounts]
+
+
+class TestLookupIndex(TestCase):
+    def setUp(self):
+        self.blockchain = Blockchain(retarget_interval=0)
+        fund(self.blockchain, "a", 100)
+        self.blockchain.new_block(proof=0, transactions=payments(1, 2))
+        self.blockchain.new_block(
+            proof=0, transactions=payments(3) + [Transaction("c", "c", 4)]
+        )
+
+    def test_locate_transaction(self):
+        lookup = self.blockchain.lookup
+
+        assert lookup.locate(Transaction("a", "b", 2).id) == ((3, 1),)
+        assert lookup.locate(Transaction("a", "b", 99).id) == ()
+
+        block, position = self.blockchain.find_transaction(Transaction("a", "b", 3).id)[
+            0
+        ]
+        assert block is self.blockchain.chain[3]
+        assert block.transactions[position] == Transaction("a", "b", 3)
+
+    def test_identical_transactions_share_an_id(self):
+        self.blockchain.new_block(proof=0, transactions=payments(1))
+
+        assert self.blockchain.lookup.locate(Transaction("a", "b", 1).id) == (
+            (3, 0),
+            (5, 0),
+        )
+
+    def test_postings_in_chain_order(self):
+        lookup = self.blockchain.lookup
+
+        assert lookup.postings("a") == [(2, 0), (3, 0), (3, 1), (4, 0)]
+        assert lookup.postings("b", start=1, limit=1) == [(3, 1)]
+        # a transaction to oneself is posted once
+        assert lookup.postings("c") == [(4, 1)]
+        assert lookup.count("a") == 4
+
+    def test_revert_matches_rebuild_after_fork(self):
+        branch = Blockchain(retarget_interval=0)
+        branch.adopt_chain(self.blockchain.chain[:3])
+        branch.new_block(proof=0, transactions=payments(5, 3))
+
+        self.blockchain.splice_chain(3, branch.chain[3:])
+
+        rebuilt = LookupIndex(self.blockchain.chain)
+        assert self.blockchain.lookup._locations == rebuilt._locations
+        assert self.blockchain.lookup._postings == rebuilt._postings
+        assert self.blockchain.lookup.count("c") == 0
+
+    def test_view_holds_the_index_as_it_was(self):
+        lookup = self.blockchain.lookup
+        length = len(self.blockchain.chain)
+        expected = LookupIndex(self.blockchain.chain)
+        view = lookup.view()
+
+        self.blockchain.new_block(
+            proof=0, transactions=payments(5) + [Transaction("d", "e", 1)]
+        )
+
+        assert lookup.state(view, length) == (expected._locations, expected._postings)
+
+    def test_view_of_rolled_back_blocks_is_unusable(self):
+        view = self.blockchain.lookup.view()
+
+        self.blockchain.splice_chain(3, [])
+
+        assert self.blockchain.lookup.state(view, 4) is None
+
+
+class TestIndexSnapshots(TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "chain.log")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def open_blockchain(self, snapshot_every=3):
+        store = ChainStore(self.path)
+        self.addCleanup(store.close)
+        return Blockchain(
+            retarget_interval=0, store=store, snapshot_every=snapshot_every
+        )
+
+    def test_indexes_survive_reopening(self):
+        blockchain = self.open_blockchain()
+        fund(blockchain, "a", 100)
+        for amount in range(1, 6):
+            blockchain.new_block(proof=0, transactions=payments(amount))
+        blockchain.store.sync()
+
+        with patch.object(
+            LookupIndex, "apply", autospec=True, side_effect=LookupIndex.apply
+        ) as apply:
+            reopened = self.open_blockchain()
+
+        # the snapshot was taken at 6 blocks, only the 7th is indexed on top of it
+        assert apply.call_count == 1
+        assert reopened.lookup.postings("a") == blockchain.lookup.postings("a")
+        assert reopened.balance("b") == blockchain.balance("b") == 15
+
+    def test_snapshot_ahead_of_chain_is_ignored(self):
+        blockchain = self.open_blockchain(snapshot_every=1)
+        fund(blockchain, "a", 100)
+        blockchain.new_block(proof=0, transactions=payments(1))
+        blockchain.store.truncate(2)
+        blockchain.store.sync()
+
+        reopened = self.open_blockchain()
+
+        assert reopened.lookup.count("a") == 1
+        assert reopened.balance("a") == 100
+
+    def test_lookup_index_is_unpickled_when_first_read(self):
+        blockchain = self.open_blockchain()
+        fund(blockchain, "a", 100)
+        for amount in range(1, 6):
+            blockchain.new_block(proof=0, transactions=payments(amount))
+        blockchain.store.sync()
+
+        with patch(
+            "app.mod_blockchain.lookup.pickle.loads", wraps=pickle.loads
+        ) as loads:
+            reopened = self.open_blockchain()
+            assert loads.call_count == 0
+
+            assert reopened.lookup.postings("a") == blockchain.lookup.postings("a")
+            assert reopened.lookup.count("b") == 5
+            assert loads.call_count == 1
+
+    def test_snapshot_is_written_outside_the_lock(self):
+        blockchain = self.open_blockchain()
+        fund(blockchain, "a", 100)
+        readers = []
+
+        def save(*args):
+            # a reader gets the lock while the snapshot is written
+            reader = Thread(target=blockchain.balance, args=("a",))
+            reader.start()
+            reader.join(1)
+            readers.append(not reader.is_alive())
+            save_snapshot(*args)
+
+        with patch("app.mod_blockchain.blockchain.save_snapshot", side_effect=save):
+            blockchain.new_block(proof=0, transactions=payments(1, 2))
+        blockchain.store.sync()
+
+        assert readers == [True]
+        assert self.open_blockchain().lookup.count("a") == 3
+
+    def test_snapshot_of_an_older_layout_is_rebuilt(self):
+        blockchain = self.open_blockchain()
+        fund(blockchain, "a", 100)
+        blockchain.new_block(proof=0, transactions=payments(1, 2))
+        blockchain.store.sync()
+        with open(blockchain.snapshot_path, "wb") as f:
+            pickle.dump(dict(length=3, tip=blockchain.last_block.hash), f)
+
+        reopened = self.open_blockchain()
+
+        assert reopened.lookup.count("a") == 3
+        assert reopened.balance("b") == 3
+
+
+if __name__ == "__main__":
+    main()
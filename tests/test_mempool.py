@@ -0,0 +1,114 @@
+from unittest import TestCase, main
+
+from app.mod_blockchain.blockchain import Blockchain
+from app.mod_blockchain.mempool import FULL, PENDING, Mempool
+from app.mod_blockchain.models import Transaction
+from tests import fund, rejection
+
+
+def transaction(number, fee=0):
+    return Transaction(sender="a", recipient="b", amount=number, fee=fee)
+
+
+class TestMempool(TestCase):
+    def setUp(self):
+        self.mempool = Mempool(max_size=3)
+
+    def test_duplicates_are_dropped(self):
+        assert self.mempool.add(transaction(1))
+        assert not self.mempool.add(transaction(1))
+        assert len(self.mempool) == 1
+
+    def test_transactions_are_taken_by_fee_then_arrival(self):
+        self.mempool.add_many(
+            [transaction(1), transaction(2, fee=5), transaction(3, fee=1)]
+        )
+
+        taken = self.mempool.take(2)
+
+        assert [t.amount for t in taken] == [2, 3]
+        assert [t.amount for t in self.mempool] == [1]
+
+    def test_full_pool_evicts_lowest_fee(self):
+        self.mempool.add_many([transaction(1), transaction(2), transaction(3, fee=2)])
+
+        assert self.mempool.add(transaction(4, fee=1))
+        # the newest of the transactions paying the lowest fee goes first
+        assert [t.amount for t in self.mempool] == [3, 4, 1]
+
+    def test_full_pool_turns_away_lower_fees(self):
+        self.mempool.add_many(
+            [transaction(1, fee=1), transaction(2, fee=1), transaction(3, fee=1)]
+        )
+
+        assert not self.mempool.add(transaction(4, fee=1))
+        assert self.mempool.add_many([transaction(5), transaction(6, fee=2)]) == 1
+        assert len(self.mempool) == 3
+
+    def test_remove(self):
+        self.mempool.add_many([transaction(1), transaction(2)])
+
+        self.mempool.remove([transaction(1), transaction(9)])
+
+        assert [t.amount for t in self.mempool] == [2]
+
+    def test_order_survives_churn(self):
+        mempool = Mempool(max_size=50)
+        for number in range(1000):
+            mempool.add(transaction(number, fee=number % 7))
+            if number % 3 == 1:
+                mempool.take(1)
+
+        taken = mempool.take(len(mempool))
+
+        assert len(taken) == 50
+        assert [t.fee for t in taken] == sorted((t.fee for t in taken), reverse=True)
+        assert len(mempool._by_priority) + len(mempool._by_eviction) <= 64
+
+
+class TestBlockchainMempool(TestCase):
+    def setUp(self):
+        self.blockchain = Blockchain(
+            difficulty=4, retarget_interval=0, max_block_transactions=3
+        )
+        fund(self.blockchain, "a", 100)
+
+    def test_duplicate_transaction_is_not_pending_twice(self):
+        assert self.blockchain.new_transaction("a", "b", 1) == 3
+        assert rejection(self.blockchain, "a", "b", 1) == PENDING
+        assert len(self.blockchain.current_transactions) == 1
+
+    def test_full_pool_turns_away_low_fees(self):
+        self.blockchain.mempool.max_size = 1
+
+        assert self.blockchain.new_transaction("a", "b", 1, fee=1) == 3
+        assert rejection(self.blockchain, "a", "b", 2, fee=1) == FULL
+        assert self.blockchain.new_transaction("a", "b", 3, fee=2) == 3
+
+    def test_mined_block_is_filled_by_fee_up_to_limit(self):
+        self.blockchain.new_transactions(
+            [transaction(1), transaction(2, fee=3), transaction(3, fee=2)]
+        )
+
+        block = self.blockchain.mine("miner")
+
+        assert [t.amount for t in block.transactions] == [2, 3, 6]
+        assert block.transactions[-1].recipient == "miner"
+        assert [t.amount for t in self.blockchain.current_transactions] == [1]
+
+    def test_transactions_of_dropped_blocks_are_pending_again(self):
+        self.blockchain.new_transactions([transaction(1), transaction(2)])
+        self.blockchain.mine("miner")
+        fork = Blockchain(difficulty=4, retarget_interval=0)
+        fork.adopt_chain(self.blockchain.chain[:2])
+        fork.new_transaction("a", "b", 1)
+        fork.mine("another miner")
+        fork.mine("another miner")
+
+        self.blockchain.splice_chain(2, fork.chain[2:])
+
+        assert [t.amount for t in self.blockchain.current_transactions] == [2]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import hashlib
+from unittest import TestCase, main
+
+from app.mod_blockchain.merkle import (
+    EMPTY_ROOT,
+    merkle_proof,
+    merkle_root,
+    verify_proof,
+)
+
+
+def ids(count):
+    return [hashlib.sha256(str(number).encode()).hexdigest() for number in range(count)]
+
+
+class TestMerkleTree(TestCase):
+    def test_empty_root(self):
+        assert merkle_root([]) == EMPTY_ROOT
+
+    def test_root_depends_on_order_and_content(self):
+        leaves = ids(5)
+
+        assert merkle_root(leaves) != merkle_root(list(reversed(leaves)))
+        assert merkle_root(leaves) != merkle_root(leaves[:4])
+        # the odd leaf is carried up, not paired with a copy of itself
+        assert merkle_root(leaves) != merkle_root(leaves + leaves[-1:])
+
+    def test_proofs_verify_for_every_position(self):
+        for count in range(1, 18):
+            leaves = ids(count)
+            root = merkle_root(leaves)
+
+            for position, leaf in enumerate(leaves):
+                proof = merkle_proof(leaves, position)
+
+                assert len(proof) <= (count - 1).bit_length()
+                assert verify_proof(leaf, proof, root)
+
+    def test_proof_does_not_verify_another_transaction(self):
+        leaves = ids(6)
+        root = merkle_root(leaves)
+        proof = merkle_proof(leaves, 2)
+
+        assert not verify_proof(leaves[3], proof, root)
+        assert not verify_proof(ids(7)[6], proof, root)
+
+        proof[0]["side"] = "left" if proof[0]["side"] == "right" else "right"
+        assert not verify_proof(leaves[2], proof, root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+from unittest import TestCase, main
+
+from app import create_app
+from app.mod_blockchain.blockchain import Blockchain
+from app.mod_blockchain.mempool import OVERDRAFT
+from app.mod_blockchain.metrics import NULL_METRIC, Metrics
+from app.mod_blockchain.peers import PeerClient
+from tests import fund, rejection, sample
+from tests.test_consensus import ConsensusTestCase
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_counter(self):
+        counter = self.metrics.counter("requests_total", "Requests", ("peer",))
+        counter.inc(1, "a")
+        counter.inc(2, "a")
+        counter.inc(1, 'b"c')
+
+        text = self.metrics.render()
+
+        assert "# TYPE requests_total counter" in text
+        assert 'requests_total{peer="a"} 3' in text
+        assert 'requests_total{peer="b\\"c"} 1' in text
+
+    def test_histogram(self):
+        histogram = self.metrics.histogram("seconds", "Seconds", buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value)
+
+        text = self.metrics.render()
+
+        assert sample(text, "seconds_bucket", le="0.1") == 2
+        assert sample(text, "seconds_bucket", le="1") == 3
+        assert sample(text, "seconds_bucket", le="+Inf") == 4
+        assert sample(text, "seconds_count") == 4
+        assert sample(text, "seconds_sum") == 5.65
+
+    def test_gauge_is_read_when_scraped(self):
+        values = [1]
+        self.metrics.gauge("length", "Length", function=lambda: len(values))
+        values.append(2)
+
+        assert sample(self.metrics.render(), "length") == 2
+
+    def test_instruments_are_shared_by_name(self):
+        first = self.metrics.counter("shared_total", "Shared")
+        second = self.metrics.counter("shared_total", "Shared")
+
+        assert first is second
+
+    def test_disabled_metrics_record_nothing(self):
+        metrics = Metrics(enabled=False)
+
+        counter = metrics.counter("requests_total", "Requests")
+        counter.inc()
+
+        assert counter is NULL_METRIC
+        assert metrics.render() == ""
+
+
+class TestBlockchainMetrics(TestCase):
+    def setUp(self):
+        self.blockchain = Blockchain(
+            difficulty=4, retarget_interval=0, metrics=Metrics()
+        )
+
+    def test_mining_is_counted(self):
+        block = self.blockchain.mine("miner")
+
+        text = self.blockchain.render_metrics()
+
+        assert sample(text, "blockchain_hashes_total") == block.proof + 1
+        assert sample(text, "blockchain_blocks_mined_total") == 1
+        assert sample(text, "blockchain_proof_of_work_seconds_count") == 1
+        assert sample(text, "blockchain_chain_length") == 2
+        assert sample(text, "blockchain_difficulty") == 4
+
+    def test_transactions_are_counted(self):
+        fund(self.blockchain, "alice", 10)
+        self.blockchain.new_transaction("alice", "bob", 5)
+        assert rejection(self.blockchain, "alice", "bob", 50) == OVERDRAFT
+
+        text = self.blockchain.render_metrics()
+
+        assert sample(text, "blockchain_transactions_total", result="accepted") == 1
+        assert sample(text, "blockchain_transactions_total", result="rejected") == 1
+        assert sample(text, "blockchain_mempool_size") == 1
+
+    def test_metrics_are_disabled_by_default(self):
+        assert Blockchain().render_metrics() == ""
+
+
+class TestConsensusMetrics(ConsensusTestCase):
+    def setUp(self):
+        super(TestConsensusMetrics, self).setUp()
+        metrics = Metrics()
+        self.blockchain = Blockchain(
+            difficulty=4,
+            retarget_interval=0,
+            peers=PeerClient(timeout=0.5, deadline=1.5, metrics=metrics),
+            metrics=metrics,
+        )
+
+    def test_rounds_and_peers_are_timed(self):
+        peer = self.start_peer(self.chain)
+
+        replaced, _ = self.resolve()
+
+        text = self.blockchain.render_metrics()
+        assert replaced
+        assert sample(text, "blockchain_consensus_rounds_total", result="replaced") == 1
+        assert sample(text, "blockchain_consensus_seconds_count", mode="full") == 1
+        assert (
+            sample(text, "blockchain_peer_sync_seconds_count", peer=peer.address) == 1
+        )
+        assert sample(text, "blockchain_peer_request_seconds_count", peer=peer.address)
+        assert sample(text, "blockchain_blocks_validated_total") == len(self.chain) - 1
+
+    def test_failed_requests_are_counted(self):
+        self.blockchain.register_node("http://127.0.0.1:1")
+
+        self.resolve()
+
+        text = self.blockchain.render_metrics()
+        assert (
+            sample(text, "blockchain_peer_request_failures_total", peer="127.0.0.1:1")
+            == 1
+        )
+
+
+class TestMetricsEndpoint(TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.client = self.app.test_client()
+
+    def test_metrics_are_exposed(self):
+        self.client.get("/api/block/chain/tip")
+
+        response = self.client.get("/metrics")
+
+        text = response.get_data(as_text=True)
+        assert response.status_code == 200
+        assert response.content_type.startswith("text/plain; version=0.0.4")
+        assert sample(text, "blockchain_chain_length") == 1
+        assert (
+            sample(
+                text,
+                "blockchain_http_request_seconds_count",
+                endpoint="block.get_tip",
+                method="GET",
+                status=200,
+            )
+            == 1
+        )
+
+    def test_disabled_metrics_are_not_exposed(self):
+        self.app.extensions["metrics"] = Metrics(enabled=False)
+
+        assert self.client.get("/metrics").status_code == 404
+        assert self.client.get("/api/block/chain/tip").status_code == 200
+
+
+if __name__ == "__main__":
+    main()
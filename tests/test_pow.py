@@ -0,0 +1,87 @@
+from unittest import TestCase, main
+
+from app.mod_blockchain.blockchain import Blockchain
+from app.mod_blockchain.jobs import MiningJob
+from app.mod_blockchain.pow import (
+    MidstateSearch,
+    ParallelProofOfWork,
+    SerialProofOfWork,
+    create_engine,
+    valid_proof,
+)
+
+
+class TestProofOfWorkEngines(TestCase):
+    def setUp(self):
+        self.serial = SerialProofOfWork()
+        # small chunks so that a search spans several chunks and workers
+        self.parallel = ParallelProofOfWork(workers=2, chunk_size=2000)
+
+    def tearDown(self):
+        self.parallel.close()
+
+    def test_parallel_matches_serial(self):
+        for last_proof in (100, 35293, 119678):
+            proof = self.parallel.search(last_proof)
+
+            assert valid_proof(last_proof, proof)
+            assert proof == self.serial.search(last_proof)
+
+    def test_progress_counts_hashes(self):
+        job = MiningJob()
+
+        proof = self.serial.search(100, progress=job)
+
+        assert job.hashes == proof + 1
+
+    def test_cancelled_search(self):
+        job = MiningJob()
+        job.cancel()
+
+        assert self.serial.search(100, progress=job) is None
+        assert self.parallel.search(100, progress=job) is None
+
+    def test_blockchain_uses_engine(self):
+        blockchain = Blockchain(pow_engine=self.parallel)
+
+        assert blockchain.proof_of_work(100) == self.serial.search(100)
+
+
+class TestMidstateSearch(TestCase):
+    def test_is_valid_matches_valid_proof(self):
+        search = MidstateSearch(100)
+
+        for proof in range(20000):
+            assert search.is_valid(proof) == valid_proof(100, proof)
+
+    def test_search_carries_digits(self):
+        # the nonce is incremented in place, check candidates across a change in the number of digits
+        search = MidstateSearch(7, difficulty=4)
+
+        for proof in range(95, 1005):
+            expected = next(p for p in range(proof, 10 ** 6) if search.is_valid(p))
+            assert search.search(proof) == expected
+
+    def test_search_range_without_proof(self):
+        search = MidstateSearch(100, difficulty=256)
+
+        assert search.search(0, 1000) is None
+
+
+class TestCreateEngine(TestCase):
+    def test_engine_selected_from_config(self):
+        engine = create_engine(dict(POW_ENGINE="parallel", POW_WORKERS=3))
+
+        assert isinstance(engine, ParallelProofOfWork)
+        assert engine.workers == 3
+
+        assert isinstance(create_engine(dict(POW_ENGINE="serial")), SerialProofOfWork)
+        assert isinstance(create_engine(dict()), SerialProofOfWork)
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            create_engine(dict(POW_ENGINE="gpu"))
+
+
+if __name__ == "__main__":
+    main()
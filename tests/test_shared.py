@@ -0,0 +1,282 @@
+import multiprocessing
+import os
+from tempfile import TemporaryDirectory
+from time import sleep
+from unittest import TestCase, main
+from unittest.mock import patch
+
+from app import create_app
+from app.mod_blockchain.blockchain import Blockchain
+from app.mod_blockchain.models import Transaction
+from app.mod_blockchain.replica import ChainReplica
+from app.mod_blockchain.shared import (
+    RemoteState,
+    ReplicatedState,
+    parse_address,
+    serve,
+    state_key,
+)
+from app.mod_blockchain.store import ChainStore
+from config import TestingConfig
+from tests import fund
+
+KEY = "state server test key"
+
+
+def wait_for_job(client, job_id):
+    """Polls a mining job until it is finished, returns its last status"""
+    for _ in range(6000):
+        job = client.get(f"/api/block/mine/{job_id}").json
+        if job["status"] not in ("pending", "running"):
+            return job
+        sleep(0.01)
+    raise AssertionError("mining job did not finish")
+
+
+class TestParseAddress(TestCase):
+    def test_host_and_port(self):
+        assert parse_address("127.0.0.1:5001") == ("127.0.0.1", 5001)
+        assert parse_address("localhost:5001") == ("localhost", 5001)
+
+    def test_unix_socket(self):
+        assert parse_address("/tmp/chain.sock") == "/tmp/chain.sock"
+        assert parse_address("/tmp/chain:1") == "/tmp/chain:1"
+
+
+class TestStateKey(TestCase):
+    def test_dedicated_key(self):
+        assert state_key(dict(SECRET_KEY="blockchain", SHARED_STATE_KEY=KEY)) == (
+            KEY.encode()
+        )
+
+    def test_missing_key_is_refused(self):
+        with self.assertRaises(ValueError):
+            state_key(dict(SECRET_KEY="blockchain"))
+        with self.assertRaises(ValueError):
+            state_key(dict(SECRET_KEY="blockchain", SHARED_STATE_KEY=""))
+
+    def test_short_key_is_refused(self):
+        with self.assertRaises(ValueError):
+            state_key(dict(SECRET_KEY="blockchain", SHARED_STATE_KEY="blockchain"))
+
+    def test_secret_key_is_refused(self):
+        with self.assertRaises(ValueError):
+            state_key(dict(SECRET_KEY=KEY, SHARED_STATE_KEY=KEY))
+
+    def test_server_does_not_start_without_a_key(self):
+        with TemporaryDirectory() as directory:
+            address = os.path.join(directory, "state.sock")
+            config = dict(
+                SECRET_KEY="blockchain",
+                SHARED_STATE_ADDRESS=address,
+                SHARED_STATE_KEY=None,
+            )
+
+            with self.assertRaises(ValueError):
+                serve(config, "miner")
+            assert not os.path.exists(address)
+
+
+class TestChainReplica(TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "chain.log")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def open_blockchain(self):
+        store = ChainStore(self.path)
+        self.addCleanup(store.close)
+        return Blockchain(retarget_interval=0, store=store)
+
+    def assert_replicates(self, replica, blockchain):
+        assert replica.refresh()
+        assert [block.hash for block in replica.blockchain.chain] == [
+            block.hash for block in blockchain.chain
+        ]
+        assert replica.blockchain.tip() == blockchain.tip()
+        for address in ("a", "b", "c"):
+            assert replica.blockchain.balance(address) == blockchain.balance(address)
+            assert replica.blockchain.address_page(address) == (
+                blockchain.address_page(address)
+            )
+
+    def test_store_not_created_yet(self):
+        replica = ChainReplica(self.path)
+
+        assert not replica.refresh()
+        assert not replica.ready
+
+    def test_follows_appended_blocks(self):
+        blockchain = self.open_blockchain()
+        replica = ChainReplica(self.path)
+        self.assert_replicates(replica, blockchain)
+        assert replica.ready
+
+        fund(blockchain, "a", 100)
+        transaction = Transaction("a", "b", 10)
+        blockchain.new_block(proof=0, transactions=[transaction])
+        self.assert_replicates(replica, blockchain)
+
+        found = replica.blockchain.find_transaction(transaction.id)
+        assert found == blockchain.find_transaction(transaction.id)
+        assert found is not None
+
+    def test_follows_reorganizations(self):
+        blockchain = self.open_blockchain()
+        fund(blockchain, "a", 100)
+        blockchain.new_block(proof=0, transactions=[Transaction("a", "b", 10)])
+        blockchain.new_block(proof=0, transactions=[Transaction("a", "b", 20)])
+
+        replica = ChainReplica(self.path)
+        self.assert_replicates(replica, blockchain)
+
+        # a branch forking after the funding block, one block longer
+        branch = Blockchain(retarget_interval=0)
+        branch.splice_chain(0, blockchain.chain[:2])
+        branch.new_block(proof=0, transactions=[Transaction("a", "c", 30)])
+        branch.new_block(proof=0, transactions=[Transaction("a", "c", 40)])
+        branch.new_block(proof=0, transactions=[Transaction("a", "b", 5)])
+
+        blockchain.splice_chain(2, branch.chain[2:])
+        self.assert_replicates(replica, blockchain)
+        assert replica.blockchain.balance("c") == 70
+
+        # and back to a shorter chain
+        blockchain.splice_chain(3, [])
+        self.assert_replicates(replica, blockchain)
+        assert replica.blockchain.balance("c") == 30
+
+
+class TestSharedState(TestCase):
+    # stored chain of the state server, or None for a chain in memory
+    store = False
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.address = os.path.join(self.directory.name, "state.sock")
+        self.path = (
+            os.path.join(self.directory.name, "chain.log") if self.store else None
+        )
+
+        with patch.multiple(
+            TestingConfig,
+            SHARED_STATE_ADDRESS=self.address,
+            SHARED_STATE_KEY=KEY,
+            CHAIN_STORE_PATH=self.path,
+        ):
+            self.apps = [create_app("testing") for _ in range(2)]
+
+        config = dict(self.apps[0].config, DIFFICULTY=4)
+        context = multiprocessing.get_context("fork")
+        self.server = context.Process(target=serve, args=(config, "miner"))
+        self.server.start()
+        for _ in range(500):
+            if os.path.exists(self.address):
+                break
+            sleep(0.01)
+
+    def tearDown(self):
+        self.server.terminate()
+        self.server.join()
+        self.directory.cleanup()
+
+    def test_applications_connect_to_the_state_server(self):
+        for app in self.apps:
+            assert isinstance(app.extensions["blockchain"], RemoteState)
+            assert isinstance(app.extensions["mining_jobs"], RemoteState)
+
+    def test_socket_is_only_open_to_its_owner(self):
+        assert os.stat(self.address).st_mode & 0o777 == 0o600
+
+    def test_connections_without_the_key_are_refused(self):
+        blockchain = RemoteState("blockchain", self.address, b"not the state key")
+
+        with self.assertRaises(multiprocessing.AuthenticationError):
+            blockchain.tip()
+
+    def test_workers_share_one_chain_and_pool(self):
+        first, second = (app.test_client() for app in self.apps)
+
+        response = first.post("/api/block/mine")
+        assert response.status_code == 202
+        job = wait_for_job(second, response.json["job"])
+        assert job["status"] == "done"
+        assert second.get("/api/block/chain/tip").json["length"] == 2
+
+        response = first.post(
+            "/api/block/transactions/new",
+            json=dict(sender="miner", recipient="shop", amount=1),
+        )
+        assert response.status_code == 201
+        transaction_id = response.json["id"]
+
+        # pending in the pool of the other worker
+        transaction = second.get(f"/api/block/transactions/{transaction_id}").json
+        assert transaction["status"] == "pending"
+
+        # spent in the pool the other worker checks funds against
+        response = second.post(
+            "/api/block/transactions/new",
+            json=dict(sender="miner", recipient="shop", amount=0.5),
+        )
+        assert response.status_code == 409
+
+        response = second.post("/api/block/mine")
+        assert wait_for_job(first, response.json["job"])["status"] == "done"
+
+        for client in (first, second):
+            assert client.get("/api/block/chain/tip").json["length"] == 3
+            assert client.get("/api/block/balances/shop").json["balance"] == 1
+
+        # metrics of the chain are those of the state server, requests those of each worker
+        metrics = first.get("/metrics").get_data(as_text=True)
+        assert "\nblockchain_chain_length 3\n" in metrics
+        assert "blockchain_blocks_mined_total 2" in metrics
+        assert 'endpoint="block.mine_block"' in metrics
+
+    def test_forked_worker_connects_again(self):
+        blockchain = self.apps[0].extensions["blockchain"]
+        length, _ = blockchain.tip()
+
+        reader, writer = multiprocessing.Pipe(duplex=False)
+        worker = multiprocessing.get_context("fork").Process(
+            target=lambda: writer.send(blockchain.tip()[0])
+        )
+        worker.start()
+        worker.join()
+
+        assert reader.recv() == length
+        # the connection of the parent still works
+        assert blockchain.tip()[0] == length
+
+
+class TestReplicatedState(TestSharedState):
+    store = True
+
+    def test_reads_are_served_by_the_replica_of_each_worker(self):
+        first, second = (app.test_client() for app in self.apps)
+
+        response = first.post("/api/block/mine")
+        assert wait_for_job(second, response.json["job"])["status"] == "done"
+        response = first.post(
+            "/api/block/transactions/new",
+            json=dict(sender="miner", recipient="shop", amount=1),
+        )
+        assert response.status_code == 201
+        response = second.post("/api/block/mine")
+        assert wait_for_job(first, response.json["job"])["status"] == "done"
+
+        for app, client in zip(self.apps, (first, second)):
+            assert client.get("/api/block/chain/tip").json["length"] == 3
+            assert client.get("/api/block/balances/shop").json["balance"] == 1
+
+            blockchain = app.extensions["blockchain"]
+            assert isinstance(blockchain, ReplicatedState)
+            assert blockchain.replica.ready
+            assert len(blockchain.replica.blockchain.chain) == 3
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+from contextlib import ExitStack
+from unittest import TestCase, main
+from unittest.mock import patch
+
+from app import create_app
+from app.mod_blockchain.blockchain import Blockchain
+from app.mod_blockchain.encoding import EncodingError, encode_transaction
+from app.mod_blockchain.mempool import MINED, UNSIGNED
+from app.mod_blockchain.metrics import Metrics
+from app.mod_blockchain.models import Block, Transaction
+from app.mod_blockchain.peers import PeerClient
+from app.mod_blockchain.signatures import (
+    CACHE_ENTRY_SIZE,
+    SignatureVerifier,
+    VerifiedCache,
+    address_of,
+    export_key,
+    generate_key,
+    load_key,
+    sign,
+)
+from tests import fund, mine_block, rejection, sample
+from tests.peers import StandInPeer
+
+ALICE = generate_key()
+BOB = generate_key()
+
+
+def funded_miner():
+    """Miner whose first blocks reward alice, so alice has the funds to send transactions in the blocks after them"""
+    miner = Blockchain(difficulty=4, retarget_interval=0)
+    for _ in range(20):
+        miner.mine(address_of(ALICE))
+    return miner
+
+
+def forged(transaction, **values):
+    """Copy of a signed transaction with some of its values changed, keeping its signature"""
+    fields = transaction.to_dict()
+    fields.update(values)
+    return Transaction.from_dict(fields)
+
+
+class TestSignedTransactions(TestCase):
+    def test_signed_transaction_round_trip(self):
+        transaction = sign(ALICE, address_of(BOB), 5, fee=1)
+        block = Block(2, 1500000000.0, [transaction], 0, 16, "1")
+
+        decoded = Block.decode(block.encoded)
+
+        assert decoded.transactions[0].signature == transaction.signature
+        assert decoded == block
+        assert Transaction.from_dict(transaction.to_dict()) == transaction
+
+    def test_unsigned_transactions_encode_as_before(self):
+        transaction = Transaction("a", "b", 1)
+
+        assert transaction.encode() == encode_transaction("a", "b", 1, 0)
+        assert "signature" not in transaction.to_dict()
+
+    def test_id_covers_the_signature(self):
+        transaction = sign(ALICE, "bob", 5)
+        unsigned = Transaction(transaction.sender, "bob", 5, nonce=transaction.nonce)
+
+        assert transaction.message() == unsigned.encode()
+        assert transaction.id != unsigned.id
+
+    def test_nonce_tells_identical_payments_apart(self):
+        first, second = sign(ALICE, "bob", 5), sign(ALICE, "bob", 5)
+
+        assert first.id != second.id
+        assert sign(ALICE, "bob", 5, nonce=7).message() == (
+            Transaction(address_of(ALICE), "bob", 5, nonce=7).encode()
+        )
+        assert forged(first, nonce=second.nonce).id != second.id
+        assert not SignatureVerifier(workers=1).verify(forged(first, nonce=1))
+
+    def test_malformed_signature_cannot_be_encoded(self):
+        with self.assertRaises(EncodingError):
+            Transaction("a", "b", 1, signature="ab").encode()
+        with self.assertRaises(EncodingError):
+            Transaction("a", "b", 1, signature="x" * 128).encode()
+
+    def test_keys_round_trip(self):
+        assert address_of(load_key(export_key(ALICE))) == address_of(ALICE)
+
+
+class TestSignatureVerifier(TestCase):
+    def setUp(self):
+        self.verifier = SignatureVerifier(workers=1)
+
+    def test_valid_signature(self):
+        assert self.verifier.verify(sign(ALICE, "bob", 5))
+
+    def test_invalid_signatures(self):
+        transaction = sign(ALICE, "bob", 5)
+
+        for invalid in (
+            forged(transaction, amount=50),
+            forged(transaction, sender=address_of(BOB)),
+            forged(transaction, signature=sign(BOB, "bob", 5).signature),
+            forged(transaction, signature=None),
+            forged(transaction, sender="alice"),
+        ):
+            assert not self.verifier.verify(invalid)
+
+    def test_mining_rewards_are_only_valid_in_blocks(self):
+        reward = Transaction("0", "miner", 1)
+
+        assert not self.verifier.verify(reward)
+        assert self.verifier.verify(reward, mint=True)
+        assert not self.verifier.verify(forged(reward, signature="00" * 64), mint=True)
+
+    def test_batches_are_verified_across_processes(self):
+        verifier = SignatureVerifier(workers=2, batch_size=8)
+        transactions = [sign(ALICE, "bob", amount) for amount in range(1, 51)]
+        transactions[17] = forged(transactions[17], amount=1000)
+        transactions[42] = forged(transactions[42], signature=None)
+
+        try:
+            assert verifier.parallel
+            results = verifier.verify_many(transactions)
+        finally:
+            verifier.close()
+
+        assert results == self.verifier.verify_many(transactions)
+        assert [position for position, valid in enumerate(results) if not valid] == [
+            17,
+            42,
+        ]
+
+
+class TestVerifiedCache(TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+        self.cache = VerifiedCache(max_bytes=3 * CACHE_ENTRY_SIZE, metrics=self.metrics)
+        self.ids = [sign(ALICE, "bob", amount).id for amount in range(1, 5)]
+
+    def test_least_recently_used_ids_are_evicted(self):
+        self.cache.add(self.ids[:3])
+        self.cache.seen([self.ids[0]])
+
+        self.cache.add([self.ids[3]])
+
+        assert len(self.cache) == 3
+        assert self.ids[1] not in self.cache
+        assert all(self.ids[index] in self.cache for index in (0, 2, 3))
+
+    def test_hits_and_misses_are_counted(self):
+        self.cache.add(self.ids[:2])
+
+        assert self.cache.seen(self.ids) == [True, True, False, False]
+
+        text = self.metrics.render()
+        assert sample(text, "blockchain_signature_cache_hits_total") == 2
+        assert sample(text, "blockchain_signature_cache_misses_total") == 2
+        assert sample(text, "blockchain_signature_cache_entries") == 2
+
+    def test_verified_transactions_are_not_verified_again(self):
+        verifier = SignatureVerifier(workers=1, cache=self.cache)
+        transaction = sign(ALICE, "bob", 5)
+
+        assert verifier.verify(transaction)
+        with patch.object(
+            verifier, "_verify_items", wraps=verifier._verify_items
+        ) as verify_items:
+            assert verifier.verify(transaction)
+            assert not verifier.verify(forged(transaction, amount=6))
+
+        assert [call.args[0] for call in verify_items.call_args_list] == [
+            [],
+            [
+                (
+                    transaction.sender,
+                    transaction.signature,
+                    forged(transaction, amount=6).message(),
+                )
+            ],
+        ]
+
+    def test_invalid_signatures_are_not_cached(self):
+        verifier = SignatureVerifier(workers=1, cache=self.cache)
+
+        assert not verifier.verify(forged(sign(ALICE, "bob", 5), amount=6))
+        assert not verifier.verify(Transaction("a", "b", 1, signature="ab"))
+        assert len(self.cache) == 0
+
+
+class TestSignedIntake(TestCase):
+    def setUp(self):
+        self.blockchain = Blockchain(verifier=SignatureVerifier(workers=1))
+        fund(self.blockchain, address_of(ALICE), 100)
+
+    def test_signed_transaction_is_accepted(self):
+        transaction = sign(ALICE, "bob", 5)
+
+        assert self.blockchain.new_transaction(**transaction.to_dict()) == 3
+        assert self.blockchain.is_pending(transaction.id)
+
+    def test_unsigned_and_forged_transactions_are_rejected(self):
+        transaction = sign(ALICE, "bob", 5)
+
+        assert rejection(self.blockchain, address_of(ALICE), "bob", 5) == UNSIGNED
+        assert (
+            rejection(self.blockchain, **forged(transaction, amount=6).to_dict())
+            == UNSIGNED
+        )
+        assert rejection(self.blockchain, "0", "bob", 5) == UNSIGNED
+        assert len(self.blockchain.mempool) == 0
+
+    def test_batch_keeps_only_signed_transactions(self):
+        signed = [sign(ALICE, "bob", amount) for amount in range(1, 4)]
+
+        added = self.blockchain.new_transactions(
+            signed + [forged(signed[0], amount=10), Transaction("bob", "carol", 1)]
+        )
+
+        assert added == 3
+        assert all(self.blockchain.is_pending(transaction.id) for transaction in signed)
+
+    def test_mined_transaction_cannot_be_replayed(self):
+        transaction = sign(ALICE, "bob", 5)
+        assert self.blockchain.new_transaction(**transaction.to_dict()) == 3
+        self.blockchain.mine("miner")
+
+        assert rejection(self.blockchain, **transaction.to_dict()) == MINED
+        assert self.blockchain.new_transactions([transaction]) == 0
+        assert len(self.blockchain.mempool) == 0
+        # the same payment signed again is a new transaction
+        assert self.blockchain.new_transaction(**sign(ALICE, "bob", 5).to_dict())
+
+
+class TestSignedBlocks(TestCase):
+    def setUp(self):
+        self.miner = funded_miner()
+        self.validator = Blockchain(
+            difficulty=4, retarget_interval=0, verifier=SignatureVerifier(workers=1)
+        )
+
+    def test_chain_with_signed_transactions_is_valid(self):
+        mine_block(self.miner, [sign(ALICE, "bob", 5), sign(ALICE, "carol", 6)])
+
+        assert self.validator.valid_chain(list(self.miner.chain))
+
+    def test_transactions_verified_at_intake_are_not_verified_in_blocks(self):
+        metrics = Metrics()
+        self.validator.verifier.cache = VerifiedCache(metrics=metrics)
+        self.validator.adopt_chain(list(self.miner.chain))
+        intake = [sign(ALICE, "bob", 5), sign(ALICE, "carol", 6)]
+        assert self.validator.new_transactions(intake) == 2
+        mine_block(self.miner, intake + [sign(ALICE, "dave", 7)])
+
+        assert self.validator.valid_chain(list(self.miner.chain))
+
+        text = metrics.render()
+        assert sample(text, "blockchain_signature_cache_hits_total") == 2
+        assert sample(text, "blockchain_signature_cache_misses_total") == 3
+
+    def test_chain_with_forged_transaction_is_invalid(self):
+        mine_block(self.miner, [sign(ALICE, "bob", 5)])
+        mine_block(self.miner, [forged(sign(ALICE, "bob", 6), recipient="mallory")])
+
+        chain = list(self.miner.chain)
+        assert self.validator.first_invalid_block(chain) == chain[-1].index
+
+    def test_unsigned_transaction_is_invalid(self):
+        mine_block(self.miner, [Transaction(address_of(ALICE), "bob", 5)])
+
+        assert not self.validator.valid_chain(list(self.miner.chain))
+
+    def test_block_holding_a_transaction_twice_is_invalid(self):
+        transaction = sign(ALICE, "bob", 5)
+        mine_block(self.miner, [transaction, transaction])
+
+        chain = list(self.miner.chain)
+        assert self.validator.first_invalid_block(chain) == chain[-1].index
+
+    def test_block_replaying_a_mined_transaction_is_invalid(self):
+        transaction = sign(ALICE, "bob", 5)
+        mine_block(self.miner, [transaction])
+        mine_block(self.miner, [sign(ALICE, "carol", 6)])
+        mine_block(self.miner, [transaction])
+
+        chain = list(self.miner.chain)
+        assert self.validator.first_invalid_block(chain) == chain[-1].index
+
+        # blocks shared with our chain are checked through the lookup index
+        self.validator.adopt_chain(chain[:-1])
+        assert self.validator.first_invalid_block(chain, start=len(chain) - 1) == (
+            chain[-1].index
+        )
+
+
+class TestSignedHeadersSync(TestCase):
+    def setUp(self):
+        self.peers = ExitStack()
+        self.miner = funded_miner()
+        self.blockchain = Blockchain(
+            difficulty=4,
+            retarget_interval=0,
+            peers=PeerClient(timeout=0.5, deadline=1.5),
+            sync_mode="headers",
+            verifier=SignatureVerifier(workers=1),
+        )
+        # both chains start from the block funding alice
+        self.blockchain.adopt_chain(list(self.miner.chain))
+
+    def tearDown(self):
+        self.peers.close()
+
+    def sync(self):
+        peer = self.peers.enter_context(StandInPeer(list(self.miner.chain)))
+        self.blockchain.register_node(f"http://{peer.address}")
+        return self.blockchain.resolve_conflicts()
+
+    def test_signed_blocks_are_synced(self):
+        mine_block(self.miner, [sign(ALICE, "bob", 5)])
+
+        assert self.sync()
+        assert list(self.blockchain.chain) == list(self.miner.chain)
+
+    def test_blocks_with_forged_transactions_are_not_synced(self):
+        mine_block(self.miner, [forged(sign(ALICE, "bob", 5), amount=10)])
+
+        assert not self.sync()
+        assert len(self.blockchain.chain) == 21
+
+    def test_blocks_minting_more_than_their_reward_are_not_synced(self):
+        mine_block(self.miner, [Transaction("0", "mallory", 100)])
+
+        assert not self.sync()
+        assert len(self.blockchain.chain) == 21
+
+    def test_blocks_overdrawing_balances_are_not_synced(self):
+        mine_block(self.miner, [sign(ALICE, "bob", 25)])
+
+        assert not self.sync()
+        assert len(self.blockchain.chain) == 21
+
+    def test_blocks_replaying_transactions_are_not_synced(self):
+        transaction = sign(ALICE, "bob", 5)
+        mine_block(self.miner, [transaction])
+        self.blockchain.adopt_chain(list(self.miner.chain))
+        mine_block(self.miner, [transaction])
+
+        assert not self.sync()
+        assert len(self.blockchain.chain) == 22
+
+
+class TestSignedTransactionApi(TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        blockchain = self.app.extensions["blockchain"]
+        blockchain.verifier = SignatureVerifier(workers=1)
+        fund(blockchain, address_of(ALICE), 100)
+        self.client = self.app.test_client()
+
+    def test_signed_transaction_is_accepted(self):
+        transaction = sign(ALICE, "bob", 5, fee=1)
+
+        response = self.client.post(
+            "/api/block/transactions/new", json=transaction.to_dict()
+        )
+
+        assert response.status_code == 201
+        assert response.json["id"] == transaction.id
+
+    def test_unsigned_transaction_is_refused(self):
+        response = self.client.post(
+            "/api/block/transactions/new",
+            json=dict(sender=address_of(ALICE), recipient="bob", amount=5),
+        )
+
+        assert response.status_code == 401
+
+    def test_replayed_transaction_is_refused(self):
+        transaction = sign(ALICE, "bob", 5)
+        self.client.post("/api/block/transactions/new", json=transaction.to_dict())
+        self.app.extensions["blockchain"].mine("miner")
+
+        response = self.client.post(
+            "/api/block/transactions/new", json=transaction.to_dict()
+        )
+
+        assert response.status_code == 409
+        assert response.json["message"] == "Transaction is already mined"
+
+    def test_batch_rejects_forged_transactions(self):
+        signed = sign(ALICE, "bob", 5)
+
+        response = self.client.post(
+            "/api/block/transactions/batch",
+            json=dict(
+                transactions=[
+                    signed.to_dict(),
+                    forged(signed, amount=7).to_dict(),
+                ]
+            ),
+        )
+
+        assert response.status_code == 201
+        assert response.json["accepted"] == 1
+        assert response.json["rejected"] == 1
+
+
+if __name__ == "__main__":
+    main()
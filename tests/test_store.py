@@ -0,0 +1,122 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main
+
+from app.mod_blockchain.blockchain import Blockchain
+from app.mod_blockchain.models import Block
+from app.mod_blockchain.store import ChainStore
+
+
+class ChainStoreTestCase(TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "chain.log")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def open_store(self, **options):
+        store = ChainStore(self.path, **options)
+        self.addCleanup(store.close)
+        return store
+
+    def block(self, index, proof):
+        return Block(
+            index=index,
+            timestamp=index,
+            transactions=[],
+            proof=proof,
+            difficulty=16,
+            previous_hash="abc",
+        )
+
+    def create_blocks(self, store, count):
+        for index in range(len(store) + 1, len(store) + count + 1):
+            store.append(self.block(index, proof=index * 10))
+
+
+class TestChainStore(ChainStoreTestCase):
+    def test_blocks_survive_reopening(self):
+        store = self.open_store(sync_every=3)
+        self.create_blocks(store, 10)
+        store.close()
+
+        store = self.open_store(cache_size=2)
+
+        assert len(store) == 10
+        assert store[0]["index"] == 1
+        assert store[-1]["index"] == 10
+        assert [block["proof"] for block in store] == list(range(10, 110, 10))
+        assert [block["index"] for block in store[2:4]] == [3, 4]
+
+    def test_appends_after_reopening(self):
+        store = self.open_store()
+        self.create_blocks(store, 3)
+        store.close()
+
+        store = self.open_store(cache_size=1)
+        self.create_blocks(store, 3)
+
+        assert [block["index"] for block in store] == [1, 2, 3, 4, 5, 6]
+
+    def test_corrupted_trailing_record_is_cut_off(self):
+        store = self.open_store()
+        self.create_blocks(store, 5)
+        store.close()
+        size = os.path.getsize(self.path)
+
+        # the last record was only partially written
+        with open(self.path, "r+b") as log:
+            log.truncate(size - 3)
+
+        store = self.open_store()
+
+        assert len(store) == 4
+        assert store[-1]["index"] == 4
+
+        self.create_blocks(store, 1)
+        store.close()
+
+        assert len(self.open_store()) == 5
+
+    def test_flipped_byte_in_trailing_record_is_cut_off(self):
+        store = self.open_store()
+        self.create_blocks(store, 5)
+        store.close()
+
+        with open(self.path, "r+b") as log:
+            log.seek(-2, os.SEEK_END)
+            log.write(b"#")
+
+        assert len(self.open_store()) == 4
+
+    def test_record_missing_from_index_is_recovered(self):
+        store = self.open_store()
+        self.create_blocks(store, 5)
+        store.close()
+
+        with open(store.index_path, "r+b") as index:
+            index.truncate(os.path.getsize(store.index_path) - 8)
+
+        store = self.open_store()
+
+        assert len(store) == 5
+        assert store[-1]["index"] == 5
+
+
+class TestPersistentBlockchain(ChainStoreTestCase):
+    def test_chain_survives_restart(self):
+        blockchain = Blockchain(difficulty=4, store=self.open_store())
+        blockchain.mine("miner")
+        blockchain.mine("miner")
+        chain = list(blockchain.chain)
+        blockchain.store.close()
+
+        blockchain = Blockchain(difficulty=4, store=self.open_store())
+
+        assert list(blockchain.chain) == chain
+        assert blockchain.mine("miner")["previous_hash"] == blockchain.hash(chain[-1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import os
+from tempfile import TemporaryDirectory
+from time import time
+from unittest import TestCase, main
+from unittest.mock import patch
+
+from app import create_app
+from app.mod_blockchain.blockchain import Blockchain
+from app.mod_blockchain.metrics import Metrics
+from app.mod_blockchain.peers import PeerClient
+from app.mod_blockchain.store import ChainStore
+from app.mod_blockchain.tree import BlockTree, block_work
+from tests import mined_chain, sample
+from tests.test_consensus import ConsensusTestCase
+
+
+def timed_chain(blocks, spacing):
+    """Chain of a miner retargeting every 2 blocks towards a block a minute, mining a block every spacing seconds"""
+    miner = Blockchain(difficulty=4, retarget_interval=2, target_block_time=60)
+    start = time() - 3600
+    for number in range(blocks):
+        timestamp = start + number * spacing
+        with patch("app.mod_blockchain.blockchain.time", return_value=timestamp):
+            miner.mine("miner")
+    return list(miner.chain)
+
+
+class TestBlockTree(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.chain = mined_chain(3)
+        # forks after the second block with one block more than the chain
+        cls.branch = mined_chain(3, base=cls.chain[:2])
+
+    def setUp(self):
+        self.tree = BlockTree()
+        self.tree.extend(self.chain, 0)
+        self.tree.extend(self.branch[2:])
+
+    def test_work_accumulates_along_branches(self):
+        assert self.tree.work(self.chain[-1].hash) == 4 * 2 ** 4
+        assert self.tree.work(self.branch[-1].hash) == 5 * 2 ** 4
+        assert self.tree.work("unknown") is None
+
+    def test_blocks_following_unknown_blocks_need_their_parent_work(self):
+        tree = BlockTree()
+
+        assert tree.add(self.chain[2]) is None
+        assert tree.add(self.chain[2], 100).work == 100 + block_work(self.chain[2])
+
+    def test_tips_are_ordered_by_work(self):
+        tips = self.tree.tips()
+
+        assert [tip.hash for tip in tips] == [
+            self.branch[-1].hash,
+            self.chain[-1].hash,
+        ]
+        assert [node.hash for node in self.tree.branch(self.branch[-1].hash)] == [
+            block.hash for block in reversed(self.branch)
+        ]
+
+    def test_pruning_drops_blocks_and_stale_branches(self):
+        self.tree.prune(3)
+
+        assert len(self.tree) == 3
+        assert self.chain[2].hash not in self.tree
+        assert self.branch[2].hash not in self.tree
+        assert all(block.hash in self.tree for block in self.branch[3:])
+
+
+class TestForkChoice(ConsensusTestCase):
+    def setUp(self):
+        super(TestForkChoice, self).setUp()
+        self.metrics = Metrics()
+        self.blockchain = Blockchain(
+            difficulty=4,
+            retarget_interval=0,
+            peers=PeerClient(timeout=0.5, deadline=1.5),
+            metrics=self.metrics,
+        )
+
+    def test_chain_with_most_work_wins_over_longest(self):
+        # blocks mined faster than the target raise the difficulty, so fewer of them take more work
+        longest = timed_chain(6, spacing=60)
+        heavy = timed_chain(4, spacing=1)
+
+        for mode in ("full", "incremental", "headers"):
+            with self.subTest(mode=mode):
+                self.setUp()
+                self.blockchain.retarget_interval = 2
+                self.blockchain.target_block_time = 60
+                self.blockchain.sync_mode = mode
+                self.start_peer(longest)
+                self.start_peer(heavy)
+
+                replaced, _ = self.resolve()
+
+                assert replaced
+                assert list(self.blockchain.chain) == heavy
+                assert self.blockchain.work == 4 * 2 ** 4 + 2 ** 6
+                assert len(heavy) < len(longest)
+                assert sum(block_work(block) for block in longest) == 7 * 2 ** 4
+                self.peers.close()
+
+    def test_side_branch_is_kept_and_not_validated_again(self):
+        for mode in ("full", "headers"):
+            with self.subTest(mode=mode):
+                self.setUp()
+                self.blockchain.sync_mode = mode
+                self.blockchain.adopt_chain(self.chain[:5])
+                side = self.blockchain.mine("us")
+                ours = list(self.blockchain.chain)
+                self.start_peer(self.chain)
+
+                assert self.resolve()[0]
+                assert list(self.blockchain.chain) == self.chain
+                assert side.hash in self.blockchain.tree
+
+                # a peer extends the branch we left, only its new blocks are validated and fetched
+                extended = mined_chain(2, base=ours)
+                peer = self.start_peer(extended)
+
+                assert self.resolve()[0]
+                assert list(self.blockchain.chain) == extended
+
+                text = self.metrics.render()
+                assert sample(text, "blockchain_reorganizations_total") == 2
+                assert sample(text, "blockchain_reorganization_depth_sum") == 3
+                assert sample(text, "blockchain_blocks_validated_total") == 4
+                if mode == "headers":
+                    assert [
+                        path
+                        for path in peer.requests
+                        if path.startswith("/api/block/chain?")
+                    ] == ["/api/block/chain?from=7&limit=2"]
+                self.peers.close()
+
+    def test_extending_our_chain_is_not_a_reorganization(self):
+        self.blockchain.adopt_chain(self.chain[:3])
+        self.start_peer(self.chain)
+
+        assert self.resolve()[0]
+
+        assert not sample(self.metrics.render(), "blockchain_reorganizations_total")
+
+    def test_branches_below_the_tree_depth_are_pruned(self):
+        self.blockchain.tree = BlockTree(depth=3)
+        self.blockchain.adopt_chain(self.chain[:3])
+        side = self.blockchain.mine("us")
+
+        assert self.blockchain.add_branch(3, self.chain[3:])
+
+        assert list(self.blockchain.chain) == self.chain
+        assert side.hash not in self.blockchain.tree
+        assert len(self.blockchain.tree) == 3
+        # the work of blocks pruned from the tree is still known
+        assert self.blockchain.work_at(2) == 2 * 2 ** 4
+
+    def test_lighter_branch_does_not_replace_our_chain(self):
+        self.blockchain.adopt_chain(self.chain)
+
+        branch = mined_chain(1, base=self.chain[:4])[4:]
+
+        assert not self.blockchain.add_branch(4, branch)
+
+        tips = self.blockchain.tree.tips()
+        assert list(self.blockchain.chain) == self.chain
+        assert tips[0].hash == self.chain[-1].hash
+        assert branch[-1].hash in [tip.hash for tip in tips]
+
+
+class TestChainWork(TestCase):
+    def test_work_survives_restart(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "chain.log")
+        blockchain = Blockchain(difficulty=4, store=ChainStore(path), snapshot_every=2)
+        for _ in range(3):
+            blockchain.mine("miner")
+        blockchain.store.close()
+
+        blockchain = Blockchain(difficulty=4, store=ChainStore(path))
+        self.addCleanup(blockchain.store.close)
+
+        assert blockchain.work == 4 * 2 ** 4
+        assert blockchain.cumulative_work(blockchain.last_block.hash) == 4 * 2 ** 4
+
+    def test_tip_reports_the_work_of_the_chain(self):
+        app = create_app("testing")
+        blockchain = app.extensions["blockchain"]
+        blockchain.new_block(123)
+
+        response = app.test_client().get("/api/block/chain/tip")
+
+        assert response.json["work"] == blockchain.work
+        assert blockchain.work == 2 * block_work(blockchain.last_block)
+
+
+if __name__ == "__main__":
+    main()
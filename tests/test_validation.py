@@ -0,0 +1,189 @@
+from time import time
+from unittest import TestCase, main
+
+from app import logger
+from app.mod_blockchain.blockchain import MAX_FUTURE_DRIFT, Blockchain
+from app.mod_blockchain.models import Block, Transaction
+from app.mod_blockchain.validation import ChainValidator
+
+
+class ChainValidationTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        miner = Blockchain(difficulty=4, retarget_interval=0)
+        for _ in range(40):
+            miner.mine("a")
+            miner.new_transaction(sender="a", recipient="b", amount=1)
+        cls.chain = list(miner.chain)
+
+    def setUp(self):
+        self.serial = Blockchain(retarget_interval=0, validator=ChainValidator(1))
+        # chunks of 4 blocks across 2 workers, so the chain is validated in parallel
+        self.parallel = Blockchain(
+            retarget_interval=0, validator=ChainValidator(2, chunk_size=4)
+        )
+
+    def replace_block(self, chain, position, **fields):
+        """Returns a copy of the chain with fields of the block at the given position replaced"""
+        values = chain[position].to_dict()
+        values.update(fields)
+        return chain[:position] + [Block.from_dict(values)] + chain[position + 1 :]
+
+    @staticmethod
+    def mined(chain, transactions):
+        """Returns a copy of the chain with a block holding the given transactions, and nothing else, mined after it"""
+        miner = Blockchain(difficulty=4, retarget_interval=0)
+        miner.adopt_chain(chain)
+        proof = miner.proof_of_work(miner.last_block.proof)
+        miner.new_block(proof, transactions=transactions)
+        return list(miner.chain)
+
+    def invalid_proof(self, position):
+        """A proof that does not validate against the block before the given position"""
+        last_proof = self.chain[position - 1]["proof"]
+        return next(
+            proof
+            for proof in range(10**6)
+            if not Blockchain.valid_proof(last_proof, proof, 4)
+        )
+
+
+class TestChainValidation(ChainValidationTestCase):
+    def test_valid_chain(self):
+        for blockchain in (self.serial, self.parallel):
+            assert blockchain.valid_chain(self.chain)
+            assert blockchain.first_invalid_block(self.chain) is None
+
+    def test_broken_hash_link(self):
+        chain = self.replace_block(self.chain, 17, previous_hash="abc")
+
+        for blockchain in (self.serial, self.parallel):
+            assert not blockchain.valid_chain(chain)
+            assert blockchain.first_invalid_block(chain) == chain[17]["index"]
+
+    def test_invalid_proof(self):
+        chain = self.replace_block(self.chain, 30, proof=self.invalid_proof(30))
+
+        for blockchain in (self.serial, self.parallel):
+            # the block after it no longer links to it either, the proof is reported first
+            assert blockchain.first_invalid_block(chain) == chain[30]["index"]
+
+    def test_transactions_not_matching_merkle_root(self):
+        # the header, and with it the hash of the block, is left as it was
+        chain = self.replace_block(
+            self.chain,
+            12,
+            transactions=[dict(sender="a", recipient="b", amount=1000)],
+            merkle_root=self.chain[12].merkle_root,
+        )
+
+        for blockchain in (self.serial, self.parallel):
+            assert chain[12].hash == self.chain[12].hash
+            assert blockchain.first_invalid_block(chain) == chain[12]["index"]
+
+    def test_invalid_difficulty(self):
+        chain = self.replace_block(self.chain, 5, difficulty=1)
+
+        for blockchain in (self.serial, self.parallel):
+            assert blockchain.first_invalid_block(chain) == chain[5]["index"]
+
+    def test_timestamp_not_after_median_of_previous_blocks(self):
+        # the median of the 11 blocks before block 20 is the timestamp of block 14
+        median = self.chain[14]["timestamp"]
+        backdated = self.replace_block(self.chain, 20, timestamp=median)
+        # earlier than the block before it but after the median, the next block no longer links to it
+        earlier = self.replace_block(
+            self.chain, 20, timestamp=self.chain[18]["timestamp"]
+        )
+
+        for blockchain in (self.serial, self.parallel):
+            assert blockchain.first_invalid_block(backdated) == backdated[20]["index"]
+            assert blockchain.first_invalid_block(earlier) == earlier[21]["index"]
+
+    def test_timestamp_too_far_ahead_of_local_time(self):
+        last = len(self.chain) - 1
+        ahead = self.replace_block(self.chain, last, timestamp=time() + 60)
+        future = self.replace_block(
+            self.chain, last, timestamp=time() + MAX_FUTURE_DRIFT + 60
+        )
+
+        for blockchain in (self.serial, self.parallel):
+            assert blockchain.valid_chain(ahead)
+            assert blockchain.first_invalid_block(future) == future[-1]["index"]
+
+    def test_block_rewards_its_miner_once_with_the_fees_of_the_block(self):
+        payment = Transaction("a", "b", 0.5, fee=0.5)
+        valid = self.mined(self.chain, [payment, Transaction("0", "miner", 1.5)])
+        invalid = [
+            [payment],
+            [payment, Transaction("0", "miner", 1)],
+            [payment, Transaction("0", "miner", 1000)],
+            [Transaction("0", "miner", 1.5), payment],
+            [payment, Transaction("0", "miner", 1), Transaction("0", "miner", 0.5)],
+            [payment, Transaction("0", "miner", 1, fee=0.5)],
+        ]
+
+        for blockchain in (self.serial, self.parallel):
+            assert blockchain.valid_chain(valid)
+            for transactions in invalid:
+                chain = self.mined(self.chain, transactions)
+                assert blockchain.first_invalid_block(chain) == chain[-1]["index"]
+
+    def test_amounts_must_be_positive(self):
+        reward = Transaction("0", "miner", 1)
+
+        for blockchain in (self.serial, self.parallel):
+            for payment in (
+                Transaction("a", "b", 0),
+                Transaction("b", "a", -5),
+                Transaction("a", "b", 1, fee=-1),
+            ):
+                chain = self.mined(self.chain, [payment, reward])
+                assert blockchain.first_invalid_block(chain) == chain[-1]["index"]
+
+    def test_overdraft_is_invalid(self):
+        reward = Transaction("0", "miner", 1)
+        # a sends every coin it mines but the last one to b
+        spent = self.mined(self.chain, [Transaction("a", "b", 1), reward])
+        overdrawn = self.mined(self.chain, [Transaction("a", "b", 2), reward])
+        twice = self.mined(
+            self.chain, [Transaction("a", "b", 1), Transaction("a", "c", 1), reward]
+        )
+
+        for blockchain in (self.serial, self.parallel):
+            assert blockchain.valid_chain(spent)
+            assert blockchain.first_invalid_block(overdrawn) == overdrawn[-1]["index"]
+            assert blockchain.first_invalid_block(twice) == twice[-1]["index"]
+
+    def test_overdraft_is_checked_against_balances_at_the_fork(self):
+        blockchain = Blockchain(difficulty=4, retarget_interval=0)
+        blockchain.adopt_chain(self.chain)
+        # b holds 39 coins at our tip, only 19 after the first 21 blocks
+        payment = [Transaction("b", "c", 30), Transaction("0", "miner", 1)]
+        extended = self.mined(self.chain, payment)
+        forked = self.mined(self.chain[:21], payment)
+
+        assert blockchain.balance("b") == 39
+        assert blockchain.first_invalid_block(extended, start=len(self.chain)) is None
+        assert blockchain.first_invalid_block(forked, start=21) == forked[-1]["index"]
+
+    def test_reports_first_invalid_block(self):
+        chain = self.replace_block(self.chain, 33, previous_hash="abc")
+        chain = self.replace_block(chain, 9, previous_hash="abc")
+        chain = self.replace_block(chain, 2, previous_hash="abc")
+
+        for blockchain in (self.serial, self.parallel):
+            assert blockchain.first_invalid_block(chain) == chain[2]["index"]
+
+    def test_slow_parallel_validation_falls_back_to_serial(self):
+        blockchain = Blockchain(
+            retarget_interval=0, validator=ChainValidator(2, chunk_size=4, timeout=0)
+        )
+        chain = self.replace_block(self.chain, 17, previous_hash="abc")
+
+        with self.assertLogs(logger, "WARNING"):
+            assert blockchain.first_invalid_block(chain) == chain[17]["index"]
+
+
+if __name__ == "__main__":
+    main()